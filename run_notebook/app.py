@@ -3,12 +3,16 @@ from dash import html, dcc
 import dash
 import dash_mantine_components as dmc
 from dash import html, dcc, Input, Output, State, no_update, callback, clientside_callback
-from session_manager import close_ssh_session  # Import the function to close SSH session
+from session_manager import close_ssh_session, get_saved_session  # Import the SSH session helpers
+from output_stream import register_output_stream
 
 
 # Initialize the Dash app
 app = Dash(__name__, suppress_callback_exceptions=True, use_pages=True)
 
+# Push channel for terminal output (server-sent events on the underlying Flask server)
+register_output_stream(app.server)
+
 # Wrap the app layout with MantineProvider
 app.layout = html.Div([
     dcc.Location(id="page-location", refresh=True),  # Track the current URL
@@ -50,6 +54,9 @@ def redirect_and_clear_session(pathname, navigation_state):
     if not navigation_state or not navigation_state.get("navigated"):
         # If the app is refreshed and the pathname is not "/", redirect to login
         if pathname != "/":
+            # A notebook session is still running: reattach to it instead of logging out
+            if get_saved_session() is not None:
+                return ("/notebook" if pathname != "/notebook" else no_update), no_update, {"navigated": True}
             close_ssh_session()
             return "/", [], {"navigated": False}
 
@@ -0,0 +1,139 @@
+import threading
+import time
+
+
+class ClusterSnapshot:
+    """A cluster table and when it was fetched."""
+    __slots__ = ("table", "fetched_at", "duration")
+
+    def __init__(self, table, fetched_at, duration):
+        self.table = table
+        self.fetched_at = fetched_at
+        self.duration = duration
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def __repr__(self):
+        return f"ClusterSnapshot({len(self.table)} hosts, age={self.age:.1f}s)"
+
+
+class _Refresh:
+    """One in-flight fetch that concurrent callers wait on instead of starting their own."""
+    __slots__ = ("done", "snapshot", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.snapshot = None
+        self.error = None
+
+
+class ClusterCache:
+    """TTL cache of the cluster snapshot from the 'ai' command.
+
+    ``get`` answers from memory while the snapshot is younger than the TTL.
+    Concurrent refreshes share one remote execution: the first caller runs
+    ``fetch`` and the others wait for its result. ``start`` keeps the snapshot
+    warm from a background thread, so page callbacks rarely wait for the
+    gateway at all. ``invalidate`` drops the snapshot (e.g. on a user switch);
+    a fetch that was already running when it was called is discarded.
+    """
+
+    def __init__(self, fetch, ttl=60, refresh_interval=60):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._refresh = None
+        self._generation = 0
+        self._stop = None  # Stop event of the background refresher, if one is running
+
+    def peek(self):
+        """The current snapshot, however old, or None."""
+        return self._snapshot
+
+    def get(self, max_age=None, block=True):
+        """Return a snapshot no older than ``max_age`` (default: the TTL).
+
+        With ``block=False`` a stale or missing snapshot is returned as is
+        (possibly None) and a refresh is started in the background instead.
+        """
+        max_age = self.ttl if max_age is None else max_age
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.age <= max_age:
+            return snapshot
+        if not block:
+            self.refresh_async()
+            return snapshot
+        return self.refresh()
+
+    def refresh(self):
+        """Fetch a new snapshot, or wait for the fetch already in flight. Raises the fetch's error."""
+        with self._lock:
+            refresh = self._refresh
+            leader = refresh is None
+            if leader:
+                refresh = self._refresh = _Refresh()
+                generation = self._generation
+        if not leader:
+            refresh.done.wait()
+            if refresh.error is not None:
+                raise refresh.error
+            return refresh.snapshot
+
+        started = time.monotonic()
+        try:
+            table = self.fetch()
+            refresh.snapshot = ClusterSnapshot(table, time.time(), time.monotonic() - started)
+        except Exception as e:
+            refresh.error = e
+            raise
+        finally:
+            with self._lock:
+                if refresh.snapshot is not None and generation == self._generation:
+                    self._snapshot = refresh.snapshot
+                self._refresh = None
+            refresh.done.set()
+        return refresh.snapshot
+
+    def refresh_async(self):
+        """Start a refresh on a background thread unless one is already running."""
+        if self._refresh is not None:
+            return
+        threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Cluster refresh failed: {e}")
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+    def start(self, interval=None):
+        """Refresh the snapshot every ``interval`` seconds on a background thread (idempotent)."""
+        if interval:
+            self.refresh_interval = interval
+        with self._lock:
+            if self._stop is not None:
+                return
+            stop = self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(stop,), daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            if self._stop is not None:
+                self._stop.set()
+                self._stop = None
+
+    def _run(self, stop):
+        while not stop.wait(self.refresh_interval):
+            # A page load may just have refreshed it
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.age >= self.refresh_interval / 2:
+                self._refresh_quietly()
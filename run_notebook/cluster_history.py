@@ -0,0 +1,215 @@
+import math
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from cluster_table import ClusterTable
+
+CLUSTER_HISTORY_FILE = Path("jupyter_cluster_history.db")
+
+# Default look-back for rolling statistics and ranking, in seconds
+TREND_WINDOW = 30 * 60
+
+# Hosts with fewer samples than this in the window are ranked on the current snapshot alone
+MIN_TREND_SAMPLES = 3
+
+# How far ahead a falling GB_AVAIL trend is projected when ranking, in seconds
+TREND_HORIZON = 15 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    ts REAL NOT NULL,
+    host TEXT NOT NULL,
+    load REAL,
+    cpu_avail REAL,
+    gb_avail REAL,
+    gb_total REAL,
+    cpu INTEGER,
+    cpu_type TEXT,
+    has_gpu INTEGER
+);
+CREATE INDEX IF NOT EXISTS samples_host_ts ON samples (host, ts);
+CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts);
+"""
+
+# Columns added after the first release, with their types (older files are migrated on open)
+_ADDED_COLUMNS = (("cpu", "INTEGER"), ("cpu_type", "TEXT"), ("has_gpu", "INTEGER"))
+
+_SAMPLE_COLUMNS = ("ts", "host", "load", "cpu_avail", "gb_avail", "gb_total", "cpu", "cpu_type", "has_gpu")
+
+# Rolling statistics per host; variance and the least-squares slope of GB_AVAIL
+# are computed from the running sums (t is seconds since the window start)
+_STATS_QUERY = """
+SELECT host, COUNT(*),
+       AVG(load), AVG(load * load),
+       AVG(cpu_avail), AVG(cpu_avail * cpu_avail),
+       AVG(gb_avail), AVG(gb_avail * gb_avail), MIN(gb_avail),
+       AVG(t), AVG(t * t), AVG(t * gb_avail)
+FROM (SELECT *, ts - ? AS t FROM samples WHERE ts >= ?) GROUP BY host
+"""
+
+
+def _std(mean, mean_of_squares):
+    return math.sqrt(max(0.0, mean_of_squares - mean * mean))
+
+
+class ClusterHistory:
+    """Time series of cluster snapshots per host, kept in a local SQLite file.
+
+    Every recorded ClusterTable adds one row per host with its LOAD,
+    CPU_AVAIL, GB_AVAIL and GB_TOTAL. ``stats`` returns rolling means and
+    standard deviations over a window, and ``rank`` orders hosts by how much
+    memory they have reliably had free over that window rather than in the
+    latest snapshot only. Samples older than ``retention`` seconds are pruned.
+    """
+
+    def __init__(self, path=CLUSTER_HISTORY_FILE, retention=7 * 24 * 3600):
+        self.path = Path(path)
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._connection = None
+        self._last_prune = 0.0
+
+    def _connect(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(_SCHEMA)
+            existing = {row[1] for row in self._connection.execute("PRAGMA table_info(samples)")}
+            with self._connection:
+                for name, column_type in _ADDED_COLUMNS:
+                    if name not in existing:
+                        self._connection.execute(f"ALTER TABLE samples ADD COLUMN {name} {column_type}")
+        return self._connection
+
+    def record(self, table, timestamp=None):
+        """Append one sample per host of a ClusterTable."""
+        if not len(table):
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        rows = table.rows
+        samples = zip(
+            [timestamp] * len(rows),
+            rows["host"].tolist(),
+            rows["load"].tolist(),
+            rows["cpu_avail"].tolist(),
+            rows["gb_avail"].tolist(),
+            rows["gb_total"].tolist(),
+            rows["cpu"].tolist(),
+            rows["cpu_type"].tolist(),
+            rows["has_gpu"].astype(int).tolist(),
+        )
+        insert = f"INSERT INTO samples ({', '.join(_SAMPLE_COLUMNS)}) VALUES ({', '.join('?' * len(_SAMPLE_COLUMNS))})"
+        try:
+            with self._lock:
+                connection = self._connect()
+                with connection:
+                    connection.executemany(insert, samples)
+                    if timestamp - self._last_prune > 3600:
+                        connection.execute("DELETE FROM samples WHERE ts < ?", (timestamp - self.retention,))
+                        self._last_prune = timestamp
+        except sqlite3.Error as e:
+            print(f"Could not record cluster history: {e}")
+
+    def stats(self, window=TREND_WINDOW, now=None):
+        """Rolling statistics per host over the last ``window`` seconds.
+
+        Returns ``{host: {"samples", "load_mean", "load_std", "cpu_avail_mean",
+        "cpu_avail_std", "gb_avail_mean", "gb_avail_std", "gb_avail_min",
+        "gb_avail_slope"}}``; the slope is in GB per second.
+        """
+        since = (time.time() if now is None else now) - window
+        try:
+            with self._lock:
+                result = self._connect().execute(_STATS_QUERY, (since, since)).fetchall()
+        except sqlite3.Error as e:
+            print(f"Could not read cluster history: {e}")
+            return {}
+        stats = {}
+        for host, count, load, load_sq, cpu, cpu_sq, gb, gb_sq, gb_min, t, t_sq, t_gb in result:
+            t_var = t_sq - t * t
+            stats[host] = {
+                "samples": count,
+                "load_mean": load,
+                "load_std": _std(load, load_sq),
+                "cpu_avail_mean": cpu,
+                "cpu_avail_std": _std(cpu, cpu_sq),
+                "gb_avail_mean": gb,
+                "gb_avail_std": _std(gb, gb_sq),
+                "gb_avail_min": gb_min,
+                "gb_avail_slope": (t_gb - t * gb) / t_var if t_var > 1e-9 else 0.0,
+            }
+        return stats
+
+    def trend_scores(self, table, window=TREND_WINDOW, now=None, stats=None):
+        """GB each host of a ClusterTable can be expected to keep free, as an array in row order.
+
+        A host's score is the lowest of what it has free right now, its mean
+        GB_AVAIL over the window minus one standard deviation, and, if its free
+        memory is falling, where that trend puts it ``TREND_HORIZON`` seconds
+        from now. A node that is filling up or swinging wildly thus scores below
+        one that has been steadily free. Hosts without enough history are
+        scored on the current value.
+        """
+        stats = self.stats(window, now) if stats is None else stats
+        current = table.rows["gb_avail"]
+        empty = {"samples": 0, "gb_avail_mean": 0.0, "gb_avail_std": 0.0, "gb_avail_slope": 0.0}
+        host_stats = [stats.get(host, empty) for host in table.hosts]
+        known = np.array([s["samples"] >= MIN_TREND_SAMPLES for s in host_stats], dtype=bool)
+        lower = np.array([s["gb_avail_mean"] - s["gb_avail_std"] for s in host_stats], dtype=np.float64)
+        slope = np.array([s["gb_avail_slope"] for s in host_stats], dtype=np.float64)
+        projected = current + np.minimum(slope, 0.0) * TREND_HORIZON
+        trended = np.minimum(np.minimum(current, lower), projected)
+        return np.where(known, trended, current)
+
+    def rank(self, table, window=TREND_WINDOW, now=None):
+        """Order the hosts of a ClusterTable by memory they have stayed able to offer (see ``trend_scores``).
+
+        Ties go to the lower load. Returns a list of dicts (host, its row
+        index, score, current values and the window statistics), best first.
+        """
+        stats = self.stats(window, now)
+        scores = self.trend_scores(table, stats=stats)
+        order = np.lexsort((table.rows["load"], -scores))
+        return [
+            dict(stats.get(table.hosts[index], {"samples": 0}), host=table.hosts[index], index=int(index),
+                 score=float(scores[index]), gb_avail=float(table.rows["gb_avail"][index]),
+                 load=float(table.rows["load"][index]))
+            for index in order
+        ]
+
+    def snapshots(self, since=None, until=None):
+        """Yield the recorded snapshots in time order as ``(timestamp, ClusterTable)``."""
+        query = f"SELECT {', '.join(_SAMPLE_COLUMNS)} FROM samples WHERE ts >= ? AND ts <= ? ORDER BY ts, rowid"
+        bounds = (since if since is not None else float("-inf"), until if until is not None else float("inf"))
+        try:
+            with self._lock:
+                result = self._connect().execute(query, bounds).fetchall()
+        except sqlite3.Error as e:
+            print(f"Could not read cluster history: {e}")
+            return
+        start = 0
+        for end in range(1, len(result) + 1):
+            if end < len(result) and result[end][0] == result[start][0]:
+                continue
+            rows = result[start:end]
+            yield rows[0][0], ClusterTable.from_columns({
+                "HOST": [row[1] for row in rows],
+                "LOAD": [row[2] for row in rows],
+                "CPU_AVAIL": [row[3] for row in rows],
+                "GB_AVAIL": [row[4] for row in rows],
+                "GB_TOTAL": [row[5] for row in rows],
+                "CPU": [row[6] or 0 for row in rows],
+                "CPU_TYPE": [row[7] or "" for row in rows],
+                "HAS_GPU": [bool(row[8]) for row in rows],
+            })
+            start = end
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,205 @@
+import sys
+
+import numpy as np
+
+# Column names of the 'ai' table as used in the server-data store, and the typed fields behind them
+COLUMNS = (
+    ("CPU_AVAIL", "cpu_avail"),
+    ("LOAD", "load"),
+    ("CPU", "cpu"),
+    ("HOST", "host"),
+    ("CPU_TYPE", "cpu_type"),
+    ("GB_AVAIL", "gb_avail"),
+    ("GB_TOTAL", "gb_total"),
+    ("PROGRAM", "program"),
+    ("HAS_GPU", "has_gpu"),
+    ("USER", "user"),
+)
+
+CLUSTER_DTYPE = np.dtype([
+    ("cpu_avail", "f8"),
+    ("load", "f8"),
+    ("cpu", "i4"),
+    ("host", object),
+    ("cpu_type", object),
+    ("gb_avail", "f8"),
+    ("gb_total", "f8"),
+    ("program", object),
+    ("has_gpu", "?"),
+    ("user", object),
+])
+
+_NUMERIC_FIELDS = ("cpu_avail", "load", "cpu", "gb_avail", "gb_total")
+_STRING_FIELDS = ("host", "cpu_type", "program", "user")
+
+
+def _to_numbers(values, dtype):
+    """Convert a column of strings in one pass; values that are not numbers become 0."""
+    try:
+        return np.asarray(values, dtype=np.float64).astype(dtype)
+    except ValueError:
+        converted = []
+        for value in values:
+            try:
+                converted.append(float(value))
+            except (TypeError, ValueError):
+                converted.append(0.0)
+        return np.asarray(converted, dtype=np.float64).astype(dtype)
+
+
+def _intern(values):
+    """Share one string object per distinct host, CPU type, program and user."""
+    return [sys.intern(str(value)) if value is not None else "" for value in values]
+
+
+def read_ai_columns(ai_output):
+    """Split the output of the 'ai' command into columns of the values as printed, keyed by store column name."""
+    columns = {name: [] for name, _ in COLUMNS}
+    table_start = False
+    for line in ai_output.splitlines():
+        # Skip lines until the table header is found
+        if line.startswith("#CPU"):
+            table_start = True
+            continue
+        if not table_start:
+            continue
+
+        # Skip error lines
+        if "rsh: fork" in line or "Resource temporarily unavailable" in line:
+            continue
+
+        parts = line.split()
+        if len(parts) < 8:
+            continue
+        try:
+            float(parts[0])
+        except ValueError:
+            continue
+        for index, name in enumerate(("CPU_AVAIL", "LOAD", "CPU", "HOST", "CPU_TYPE", "GB_AVAIL", "GB_TOTAL", "PROGRAM")):
+            columns[name].append(parts[index])
+        columns["HAS_GPU"].append("X" if "gpu" in parts[3].lower() else " ")
+        columns["USER"].append(parts[8] if len(parts) > 8 else "")
+    return columns
+
+
+class ClusterTable:
+    """The cluster table from the 'ai' command as a NumPy structured array.
+
+    CPU, load and memory columns are numbers, the GPU flag is a boolean and
+    the repeated host, CPU type, program and user strings are interned, so
+    sorting and filtering run as array operations instead of per-row
+    ``float()`` calls. ``to_store``/``from_store`` convert to and from the
+    columnar JSON form kept in the ``server-data`` store (the legacy list of
+    row dicts is accepted as well).
+    """
+
+    def __init__(self, rows=None):
+        self.rows = rows if rows is not None else np.empty(0, dtype=CLUSTER_DTYPE)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build a table from a dict of store column name -> list of raw values."""
+        count = len(columns.get("HOST") or [])
+        rows = np.empty(count, dtype=CLUSTER_DTYPE)
+        for name, field in COLUMNS:
+            values = columns.get(name)
+            if values is None or len(values) != count:
+                values = [""] * count if field in _STRING_FIELDS else [0] * count
+            if field in _NUMERIC_FIELDS:
+                rows[field] = _to_numbers(values, CLUSTER_DTYPE[field])
+            elif field == "has_gpu":
+                rows[field] = [value is True or (isinstance(value, str) and value.strip().upper() == "X")
+                               for value in values]
+            else:
+                rows[field] = _intern(values)
+        return cls(rows)
+
+    @classmethod
+    def from_ai_output(cls, ai_output):
+        """Parse the output of the 'ai' command (same rules as ``parse_ai_output``)."""
+        return cls.from_columns(read_ai_columns(ai_output))
+
+    @classmethod
+    def from_store(cls, data):
+        """Build a table from the server-data store (columnar dict, list of row dicts, or empty)."""
+        if isinstance(data, cls):
+            return data
+        if not data:
+            return cls()
+        if isinstance(data, dict):
+            return cls.from_columns(data)
+        return cls.from_columns({name: [row.get(name) for row in data] for name, _ in COLUMNS})
+
+    def to_store(self):
+        """Columnar, JSON-serializable form for the server-data store."""
+        return {name: self.rows[field].tolist() for name, field in COLUMNS}
+
+    def record(self, index):
+        """One row as a dict keyed by store column name, with numbers formatted for display."""
+        row = self.rows[index]
+        record = {}
+        for name, field in COLUMNS:
+            value = row[field]
+            if field == "has_gpu":
+                record[name] = "X" if value else " "
+            elif field == "cpu":
+                record[name] = str(int(value))
+            elif field in _NUMERIC_FIELDS:
+                record[name] = f"{value:g}"
+            else:
+                record[name] = value
+        return record
+
+    def to_records(self):
+        """All rows as display dicts; numbers are reformatted (a LOAD of "0.30" becomes "0.3")."""
+        return [self.record(index) for index in range(len(self))]
+
+    def column(self, name):
+        """A column by store name (e.g. "GB_AVAIL") or field name (e.g. "gb_avail")."""
+        return self.rows[dict(COLUMNS).get(name, name)]
+
+    @property
+    def hosts(self):
+        return self.rows["host"]
+
+    def index_of(self, host):
+        """Position of ``host`` in the table, or None."""
+        matches = np.flatnonzero(self.rows["host"] == host)
+        return int(matches[0]) if len(matches) else None
+
+    def take(self, indices):
+        """The rows at ``indices``, in that order, as a new table."""
+        return ClusterTable(self.rows[np.asarray(indices, dtype=np.intp)])
+
+    def filter(self, min_gb_avail=None, min_cpu_avail=None, max_load=None, gpu=None, program=None):
+        """Rows matching every given condition, as a new table."""
+        mask = np.ones(len(self), dtype=bool)
+        if min_gb_avail is not None:
+            mask &= self.rows["gb_avail"] >= min_gb_avail
+        if min_cpu_avail is not None:
+            mask &= self.rows["cpu_avail"] >= min_cpu_avail
+        if max_load is not None:
+            mask &= self.rows["load"] <= max_load
+        if gpu is not None:
+            mask &= self.rows["has_gpu"] == bool(gpu)
+        if program is not None:
+            mask &= self.rows["program"] == program
+        return ClusterTable(self.rows[mask])
+
+    def sort(self, by="GB_AVAIL", descending=True):
+        """The table ordered by a numeric column, as a new table (stable for ties)."""
+        order = np.argsort(-self.column(by) if descending else self.column(by), kind="stable")
+        return ClusterTable(self.rows[order])
+
+    def best(self, by="GB_AVAIL"):
+        """Host with the highest value in a numeric column, or None for an empty table."""
+        if not len(self):
+            return None
+        return self.rows["host"][int(np.argmax(self.column(by)))]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self.record(index)
@@ -0,0 +1,290 @@
+import json
+import re
+import shlex
+import time
+import urllib.error
+import urllib.request
+
+# Printed by the start command so the server's pid (and runtime file name) is known
+PID_PATTERN = r"__PID__:(\d+)"
+
+# Lines printed by the discovery command start with this tag (assembled in-script
+# from two halves so the command text echoed back by a PTY never matches)
+SERVER_TAG = "__JPSERVER__"
+
+# Where Jupyter writes runtime files when JUPYTER_RUNTIME_DIR is not set
+DEFAULT_RUNTIME_DIR = '"$HOME/.local/share/jupyter/runtime"'
+
+
+def runtime_dir(node, name=""):
+    """Runtime directory (or a file in it) for servers this app starts on ``node``, as a shell word."""
+    safe_node = re.sub(r"[^\w.-]", "_", node)
+    path = f"$HOME/.jupyter_launcher/runtime/{safe_node}"
+    return f'"{path}/{name}"' if name else f'"{path}"'
+
+
+def private_dir_command(node):
+    """Shell command that creates the runtime directory for ``node`` readable by its owner only."""
+    directory = runtime_dir(node)
+    return f"mkdir -p {directory} && chmod 700 {directory}"
+
+
+def start_command(jupyter, node, background=False, extra_args="--ip 0.0.0.0 --no-browser"):
+    """Build the command that starts Jupyter with a known runtime directory.
+
+    In the foreground (an exec channel) the shell prints its own pid and then
+    ``exec``s Jupyter, so the pid carries over. In the background (an
+    interactive shell) the server's output goes to a log file next to its
+    runtime file and the job's pid is printed. The runtime directory is kept
+    private and the log is created owner-only, since it carries the server's
+    token; Jupyter itself runs with the user's own umask.
+    """
+    directory = private_dir_command(node)
+    launch = f"{shlex.quote(jupyter)} notebook {extra_args}"
+    if background:
+        log_file = runtime_dir(node, "jupyter-$$.log")
+        return (f'{directory} && ( umask 077 && : > {log_file} ) && '
+                f'{{ JUPYTER_RUNTIME_DIR={runtime_dir(node)} {launch} > {log_file} 2>&1 & }} && echo "__PID__:$!"')
+    return f'{directory} && echo "__PID__:$$" && JUPYTER_RUNTIME_DIR={runtime_dir(node)} exec {launch}'
+
+
+def detached_start_command(jupyter, node, session_name, use_tmux=True, extra_args="--ip 0.0.0.0 --no-browser"):
+    """Build the command that starts Jupyter detached from the calling channel.
+
+    The current directory and environment are frozen into a launch script next
+    to the runtime files, which runs in the named tmux session when ``use_tmux``
+    is set and tmux is installed on the node, and under ``nohup`` otherwise.
+    Output goes to ``<session_name>.log``, the pid to ``<session_name>.pid``,
+    and the command prints ``__PID__:<pid> <launcher>``. The server is not tied
+    to the SSH channel, so it survives a dropped gateway connection and an app
+    restart. These files are created owner-only in a private directory, since
+    the log carries the server's token.
+    """
+    directory = runtime_dir(node)
+    script = runtime_dir(node, f"{session_name}.sh")
+    log_file = runtime_dir(node, f"{session_name}.log")
+    pid_file = runtime_dir(node, f"{session_name}.pid")
+    # stdin stays on the tmux pane: tmux treats a pane whose process closed the
+    # terminal as dead and hangs it up
+    launch = "exec %q notebook " + extra_args.replace("%", "%%") + " > %q 2>&1"
+    write_script = (
+        "printf 'cd %q && export PATH=%q CONDA_PREFIX=%q CONDA_DEFAULT_ENV=%q JUPYTER_RUNTIME_DIR=%q && "
+        + launch + "\\n' "
+        f'"$PWD" "$PATH" "${{CONDA_PREFIX:-}}" "${{CONDA_DEFAULT_ENV:-}}" {directory} {shlex.quote(jupyter)} {log_file} > {script}'
+    )
+    tmux = (
+        f'tmux new-session -d -s {shlex.quote(session_name)} "exec bash "{script} && '
+        f"__l=tmux && __p=$(tmux display-message -p -t {shlex.quote(session_name)} '#{{pane_pid}}')"
+    )
+    nohup = f"__l=nohup && __p=$( {{ nohup bash {script} > /dev/null 2>&1 < /dev/null & }}; echo $! )"
+    choose = f"if command -v tmux >/dev/null 2>&1; then {tmux}; else {nohup}; fi" if use_tmux else nohup
+    # Only the launcher's own files get umask 077; the server keeps the user's umask.
+    # The script's redirection truncates the log, which keeps its mode
+    prepare = f"{private_dir_command(node)} && ( umask 077 && : > {log_file} && {write_script} )"
+    return f'{prepare} && {choose} && ( umask 077 && echo "$__p" > {pid_file} ) && echo "__PID__:$__p $__l"'
+
+
+def parse_pid(output):
+    match = re.search(PID_PATTERN, output)
+    return int(match.group(1)) if match else None
+
+
+def parse_launcher(output):
+    """Return the launcher ("tmux" or "nohup") reported by the detached start command."""
+    match = re.search(PID_PATTERN + r" (\w+)", output)
+    return match.group(2) if match else None
+
+
+def log_follow_command(node, session_name, lines=200):
+    """Command that prints a detached server's log and keeps following it."""
+    return f"tail -n {lines} -F {runtime_dir(node, f'{session_name}.log')}"
+
+
+def read_server_log(runner, node, session_name, lines=50, timeout=15):
+    """Return the last ``lines`` lines of a detached server's log."""
+    result = runner.run(f"tail -n {lines} {runtime_dir(node, f'{session_name}.log')}", timeout=timeout)
+    return result.output
+
+
+def wait_for_runtime_file(runner, node, pid, timeout=60, poll_interval=0.1):
+    """Wait on the node for the server's runtime JSON and return it as a dict.
+
+    The polling loop runs remotely in a subshell, so it costs one round trip
+    and returns within ``poll_interval`` of the file appearing. Newer servers
+    write ``jpserver-<pid>.json``, classic notebook servers ``nbserver-<pid>.json``.
+    Raises an Exception if the server exits or the timeout passes first.
+    """
+    attempts = max(1, int(timeout / poll_interval))
+    script = (
+        f"( for i in $(seq 1 {attempts}); do "
+        f"for f in {runtime_dir(node, f'jpserver-{pid}.json')} {runtime_dir(node, f'nbserver-{pid}.json')}; do "
+        f'if [ -s "$f" ]; then cat "$f"; echo; exit 0; fi; done; '
+        f"kill -0 {pid} 2>/dev/null || exit 3; sleep {poll_interval}; done; exit 4 )"
+    )
+    result = runner.run(script, timeout=timeout + 15)
+    if result.exit_code == 3:
+        raise Exception(f"Jupyter server (pid {pid}) exited before it was ready")
+    if result.exit_code != 0:
+        raise Exception(f"Jupyter server (pid {pid}) did not report ready within {timeout}s")
+    return parse_server_info(result.output)
+
+
+def is_server_running(runner, pid, timeout=15):
+    """Return whether the process ``pid`` is alive on the node (zombies count as gone)."""
+    pid = int(pid)
+    result = runner.run(f"kill -0 {pid} 2>/dev/null && [ \"$(ps -o stat= -p {pid} | cut -c1)\" != Z ]", timeout=timeout)
+    return result.ok
+
+
+def stop_server_command(node, pid, grace_period=5):
+    """Build the command that stops a server this app started detached, found by its pid file.
+
+    Sends SIGTERM, waits up to ``grace_period`` seconds for Jupyter to shut its
+    kernels down (then SIGKILL), ends the tmux session and removes the
+    session's script, log and pid files, printing ``__STOPPED__:<session>``.
+    Servers with no pid file in this app's runtime directory (started by hand
+    or in the foreground) are left alone.
+    """
+    pid = int(pid)
+    directory = runtime_dir(node)
+    attempts = max(1, int(grace_period * 10))
+    return (
+        f"for f in {directory}/*.pid; do "
+        f'[ "$(cat "$f" 2>/dev/null)" = "{pid}" ] || continue; s=$(basename "$f" .pid); '
+        f"kill {pid} 2>/dev/null; "
+        f"for i in $(seq 1 {attempts}); do kill -0 {pid} 2>/dev/null || break; sleep 0.1; done; "
+        f"kill -9 {pid} 2>/dev/null; tmux kill-session -t \"$s\" 2>/dev/null; "
+        f'rm -f {directory}/"$s".sh {directory}/"$s".log "$f"; echo "__STOPPED__:$s"; done; true'
+    )
+
+
+def parse_stopped_session(output):
+    """Return the session name reported by the stop command, or None if nothing was stopped."""
+    match = re.search(r"__STOPPED__:([\w.-]+)", output)
+    return match.group(1) if match else None
+
+
+def parse_server_info(output):
+    """Extract the JSON object from runtime-file output (a PTY may add echo lines)."""
+    start, end = output.find("{"), output.rfind("}")
+    if start == -1 or end < start:
+        raise Exception(f"Could not read Jupyter runtime file. Output: {output[-500:]}")
+    info = json.loads(output[start:end + 1])
+    info.setdefault("base_url", "/")
+    info.setdefault("token", "")
+    return info
+
+
+def list_servers_command(node, dest_folder=None):
+    """Build one command that prints every live server's runtime file on the node.
+
+    Looks in this app's runtime directory and Jupyter's default one, skips files
+    whose pid is gone, and prints ``tag|pid|elapsed_seconds|exe|json`` per server.
+    With ``dest_folder`` it first prints ``tag|workdir|<absolute path>`` for that
+    folder, resolved the same way as the bootstrap script's ``cd``.
+    """
+    directories = " ".join(f"{d}/jpserver-*.json {d}/nbserver-*.json" for d in (runtime_dir(node), DEFAULT_RUNTIME_DIR))
+    workdir = f"( cd {dest_folder} 2>/dev/null && printf '%s|workdir|%s\\n' \"$__st\" \"$(pwd -P)\" ); " if dest_folder else ""
+    return (
+        f'__st="{SERVER_TAG[:6]}""{SERVER_TAG[6:]}"; '
+        + workdir +
+        f"for f in {directories}; do "
+        '[ -s "$f" ] || continue; p=${f##*-}; p=${p%.json}; kill -0 "$p" 2>/dev/null || continue; '
+        'printf \'%s|%s|%s|%s|\' "$__st" "$p" "$(ps -o etimes= -p "$p" | tr -d \' \')" "$(readlink /proc/$p/exe 2>/dev/null)"; '
+        'tr -d \'\\n\' < "$f"; echo; done; true'
+    )
+
+
+def parse_server_list(output):
+    """Parse discovery output into server dicts, newest first and one per pid."""
+    servers = {}
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith(SERVER_TAG + "|"):
+            continue
+        try:
+            _, pid, elapsed, exe, payload = line.split("|", 4)
+            pid = int(pid)
+            info = json.loads(payload)
+        except ValueError:
+            continue  # Truncated or garbled line
+        if not isinstance(info, dict) or "port" not in info:
+            continue
+        info.setdefault("base_url", "/")
+        info.setdefault("token", "")
+        info["pid"] = pid
+        info["uptime"] = int(elapsed) if elapsed.isdigit() else None
+        info["exe"] = exe
+        # Classic notebook servers call the root directory notebook_dir
+        info["root_dir"] = info.get("root_dir") or info.get("notebook_dir", "")
+        servers.setdefault(info["pid"], info)
+    return sorted(servers.values(), key=lambda s: s["uptime"] if s["uptime"] is not None else float("inf"))
+
+
+def parse_workdir(output):
+    """Return the absolute working directory reported by the discovery command, or None."""
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith(SERVER_TAG + "|workdir|"):
+            return line.split("|", 2)[2] or None
+    return None
+
+
+def discover_servers(runner, node, dest_folder, timeout=15):
+    """Return the live servers on the node and the absolute path of ``dest_folder``, in one round trip.
+
+    Needs no ``~/.bashrc`` or conda environment, so it can run before the
+    environment is set up. The path is None if the folder does not exist.
+    """
+    result = runner.run(list_servers_command(node, dest_folder), timeout=timeout)
+    return parse_server_list(result.output), parse_workdir(result.output)
+
+
+def server_env_prefix(server):
+    """Environment prefix a server runs from, derived from its interpreter path (``<prefix>/bin/python``)."""
+    exe = server.get("exe") or ""
+    return exe.rsplit("/bin/", 1)[0] if "/bin/" in exe else ""
+
+
+def find_matching_server(servers, workdir, env_prefix=""):
+    """Pick the newest server rooted at ``workdir`` and running from ``env_prefix``.
+
+    The interpreter check is skipped when the environment has no conda prefix
+    or the node does not expose ``/proc/<pid>/exe``.
+    """
+    for server in servers:
+        if server["root_dir"].rstrip("/") != workdir.rstrip("/"):
+            continue
+        if env_prefix and server["exe"] and not server["exe"].startswith(env_prefix.rstrip("/") + "/"):
+            continue
+        return server
+    return None
+
+
+def format_uptime(seconds):
+    if seconds is None:
+        return "unknown"
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes = remainder // 60
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m"
+
+
+def probe_jupyter(local_port, base_url="/", timeout=10, interval=0.05):
+    """Poll ``/api`` through the local forward until Jupyter answers.
+
+    ``/api`` needs no token and returns the server version. Returns the time
+    the first successful response took, or raises after ``timeout`` seconds.
+    """
+    url = f"http://127.0.0.1:{local_port}{base_url.rstrip('/')}/api"
+    deadline = time.monotonic() + timeout
+    last_error = None
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            with urllib.request.urlopen(url, timeout=max(0.5, deadline - started)) as response:
+                if response.status == 200:
+                    return time.monotonic() - started
+        except (urllib.error.URLError, OSError) as e:
+            last_error = e
+        time.sleep(interval)
+    raise Exception(f"Jupyter did not answer on {url} within {timeout}s: {last_error}")
@@ -0,0 +1,105 @@
+import threading
+import time
+
+
+class OutputLog:
+    """Bounded ring buffer of session output with monotonically increasing sequence numbers.
+
+    Each entry is ``{"seq", "timestamp", "message", "type"}``. Appending
+    overwrites the oldest slot once ``capacity`` entries are held, so nothing
+    is copied. Readers keep the last sequence number they saw and call
+    ``read_since`` to get only newer entries, in O(new) time. Writers take a
+    lock (normally uncontended, since the launch thread writes most of the
+    output). Readers never lock: an entry is stored in its slot before the
+    sequence counter that publishes it is advanced. Push readers can block in
+    ``wait`` until something newer than their cursor arrives.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._next_seq = 1  # Sequence number the next entry will get
+        self._first_seq = 1  # Oldest sequence number still visible (moves forward on clear)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def append(self, message, message_type="info"):
+        """Add an entry and return its sequence number."""
+        entry = {
+            "seq": 0,
+            "timestamp": time.strftime("%H:%M:%S"),
+            "message": message,
+            "type": message_type,
+        }
+        with self._lock:
+            seq = self._next_seq
+            entry["seq"] = seq
+            self._slots[seq % self.capacity] = entry
+            self._next_seq = seq + 1
+            self._changed.notify_all()
+        return seq
+
+    @property
+    def last_seq(self):
+        """Sequence number of the newest entry (0 before the first one)."""
+        return self._next_seq - 1
+
+    def read_since(self, seq=0, limit=None, end=None):
+        """Return the entries newer than ``seq``, oldest first.
+
+        Entries that were already overwritten are skipped, so a reader that
+        falls more than ``capacity`` entries behind continues from the oldest
+        one still held. ``limit`` caps the result to the newest ``limit``
+        entries; ``end`` (exclusive) stops at a sequence number read earlier.
+        """
+        end = self._next_seq if end is None else end
+        start = max(seq + 1, self._first_seq, end - self.capacity)
+        if limit is not None:
+            start = max(start, end - limit)
+        slots = self._slots
+        capacity = self.capacity
+        entries = []
+        for expected in range(start, end):
+            entry = slots[expected % capacity]
+            # A concurrent writer may have recycled the slot for a newer entry
+            if entry is not None and entry["seq"] == expected:
+                entries.append(entry)
+        return entries
+
+    def delta(self, seq=0, limit=None):
+        """Return what a reader that has seen up to ``seq`` needs to catch up.
+
+        ``reset`` is set when the log was cleared after ``seq``, meaning the
+        reader should drop what it has before appending ``entries``. A ``seq``
+        this log never handed out (a cursor kept across an app restart) is a
+        reset as well, and the reader gets everything still held.
+        """
+        # One read of the counter for both the entries and the cursor: an entry
+        # appended in between must still be newer than the returned cursor
+        end = self._next_seq
+        if seq >= end:
+            seq = 0
+        return {
+            "reset": seq < self._first_seq - 1 or seq == 0,
+            "entries": self.read_since(seq, limit, end),
+            "seq": end - 1,
+        }
+
+    def clear(self):
+        """Hide every current entry; sequence numbers keep increasing so reader cursors stay valid.
+
+        The clear itself consumes a sequence number, so a reader that has seen
+        it can be told apart from one that has not.
+        """
+        with self._lock:
+            self._next_seq += 1
+            self._first_seq = self._next_seq
+            self._changed.notify_all()
+
+    def wait(self, seq, timeout=None):
+        """Block until an entry (or a clear) newer than ``seq`` exists. Returns False on timeout."""
+        with self._changed:
+            return self._changed.wait_for(lambda: self._next_seq - 1 > seq, timeout)
+
+    def __len__(self):
+        return min(self._next_seq - self._first_seq, self.capacity)
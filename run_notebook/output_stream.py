@@ -0,0 +1,54 @@
+import json
+
+from flask import Response, request
+
+from session_manager import get_output_delta, wait_for_output
+
+# The terminal panel subscribes here with an EventSource
+STREAM_PATH = "/session/output-stream"
+
+# Comment lines sent while a session is idle, so proxies keep the connection open
+# and a closed browser tab is noticed
+KEEPALIVE_INTERVAL = 15
+
+
+def format_event(delta):
+    """Encode an output delta as a server-sent event; its id is the delta's sequence number."""
+    return f"id: {delta['seq']}\ndata: {json.dumps(delta)}\n\n"
+
+
+def stream_output(cursor=0, keepalive=KEEPALIVE_INTERVAL):
+    """Yield server-sent events for session output newer than ``cursor``, forever.
+
+    The first event brings the reader up to date. After that the generator
+    blocks on the output buffer and only wakes when new output (or a clear)
+    arrives, so an idle session costs one parked thread per subscriber.
+    """
+    delta = get_output_delta(cursor)
+    yield "retry: 2000\n\n"
+    yield format_event(delta)
+    cursor = delta["seq"]
+    while True:
+        if not wait_for_output(cursor, keepalive):
+            yield ": keepalive\n\n"
+            continue
+        delta = get_output_delta(cursor)
+        yield format_event(delta)
+        cursor = delta["seq"]
+
+
+def register_output_stream(server, path=STREAM_PATH):
+    """Add the session output event stream to the Flask server behind the Dash app."""
+
+    @server.route(path)
+    def session_output_stream():
+        # A reconnecting EventSource sends the id of the last event it received
+        since = request.headers.get("Last-Event-ID") or request.args.get("since") or "0"
+        cursor = int(since) if since.isdigit() else 0
+        return Response(
+            stream_output(cursor),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    return session_output_stream
@@ -7,7 +7,7 @@ import paramiko
 import dash
 import time
 import dash_bootstrap_components as dbc
-from session_manager import establish_ssh_session, run_command_with_paramiko, parse_ai_output
+from session_manager import establish_ssh_session, ensure_ssh_connection, get_cluster_snapshot, start_cluster_refresh, start_socks_proxy
 
 
 # Register this page with Dash Pages
@@ -166,6 +166,7 @@ def handle_login(n_clicks, username, gateway, env_name, dest_folder, remember):
 
     if remember:
         save_config({
+            **load_config(),  # Keep optional settings such as cluster_refresh_interval and socks_port
             "username": username,
             "gateway": gateway,
             "env_name": env_name,
@@ -176,15 +177,24 @@ def handle_login(n_clicks, username, gateway, env_name, dest_folder, remember):
         # Establish SSH session
         establish_ssh_session(username, gateway)
 
-        # Fetch server data
-        ai_output = run_command_with_paramiko("ai", load_config=load_config)
-        servers = parse_ai_output(ai_output)
-
-        if not servers:
+        # Fetch server data (answered from the cluster cache if it is fresh), then keep it fresh
+        ensure_ssh_connection(load_config)
+        servers = get_cluster_snapshot().table
+        start_cluster_refresh(load_config().get("cluster_refresh_interval"))
+        config = load_config()
+        if config.get("socks_port"):
+            # Optional SOCKS5 proxy to any node port through the gateway
+            try:
+                start_socks_proxy(config["socks_port"], config.get("socks_max_connections", 64),
+                                  config.get("socks_max_per_destination", 16))
+            except Exception as e:
+                print(f"Could not start SOCKS5 proxy: {e}")
+
+        if not len(servers):
             return [], True, "No servers found.", no_update, False, no_update, no_update
 
         # Store server data and navigate to /servers
-        return servers, False, "", "/servers", False, env_name, dest_folder
+        return servers.to_store(), False, "", "/servers", False, env_name, dest_folder
 
     except Exception as e:
         return no_update, True, f"An error occurred: {str(e)}", no_update, False, no_update, no_update
\ No newline at end of file
@@ -3,29 +3,57 @@ import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 import dash
 import time
+from output_stream import STREAM_PATH
 from session_manager import (
     close_ssh_session, 
     connect_and_run_jupyter_with_output, 
     get_output_buffer, 
+    get_output_delta,
+    get_output_seq,
     clear_output_buffer,
+    add_to_output_buffer,
     send_command_to_active_shell,
-    disconnect_session
+    disconnect_session,
+    get_saved_session,
+    get_session_metrics,
+    get_session_state,
+    get_tunnel_health,
+    add_port_forward,
+    remove_port_forward,
+    list_port_forwards
 )
 
 # Register this page with Dash Pages
 dash.register_page(__name__, path="/notebook")
 
+# Polling for tunnel and forward traffic counters; tunnel state changes arrive with the output stream.
+# The poll backs off while the counters stay the same
+TUNNEL_HEALTH_INTERVAL = 5000
+TUNNEL_HEALTH_MAX_INTERVAL = 60000
+
 layout = html.Div([
     dcc.Location(id="page-location-notebook", refresh=False),
     dcc.Store(id="notebook-session-data"),  # Store for session information
     dcc.Store(id="jupyter-process-running", data=False),  # Track if jupyter is running
+    dcc.Store(id="output-cursor", data=0),  # Sequence number of the newest rendered output entry
+    dcc.Store(id="terminal-delta"),  # New output entries for the clientside terminal renderer
+    dcc.Store(id="terminal-rendered-seq"),  # Last sequence number the browser appended
+    dcc.Store(id="session-state-version", data=0),  # Version of the session state last rendered
+    dcc.Store(id="forwards-version", data=0),  # Bumped when a port forward is added or removed
+    dcc.Store(id="forwards-rendered"),  # Counters shown in the forward table, to skip unchanged polls
     dmc.NotificationProvider(),  # Add notification provider
     dcc.Interval(
         id="output-interval",
-        interval=1000,  # Update every second
+        interval=1000,  # Fallback polling when the browser cannot keep the output stream open
         n_intervals=0,
         disabled=True  # Initially disabled
     ),
+    dcc.Interval(
+        id="tunnel-health-interval",
+        interval=TUNNEL_HEALTH_INTERVAL,  # Tunnel and forward traffic counters
+        n_intervals=0,
+        disabled=True
+    ),
     
     # Header with navigation buttons
     dmc.Flex(
@@ -89,6 +117,14 @@ layout = html.Div([
                         dmc.Text("Status:", fw=500),
                         dmc.Badge(id="status-badge", variant="filled")
                     ]),
+                    dmc.Group([
+                        dmc.Text("Tunnel:", fw=500),
+                        dmc.Text(id="tunnel-health-display", c="dimmed", size="sm")
+                    ]),
+                    dmc.Group([
+                        dmc.Text("Launch timings:", fw=500),
+                        dmc.Text(id="session-metrics-display", c="dimmed", size="sm")
+                    ]),
                 ]
             )
         ],
@@ -129,6 +165,12 @@ layout = html.Div([
                             color="purple",
                             leftSection=DashIconify(icon="mdi:notebook", width=16)
                         ),
+                        dmc.Switch(
+                            id="reuse-server-switch",
+                            label="Reuse running server",
+                            size="xs",
+                            checked=True,
+                        ),
                         dmc.Button(
                             "Starting Jupyter...",
                             id="start-jupyter-btn",
@@ -206,6 +248,57 @@ layout = html.Div([
         style={"marginTop": "20px"}
     ),
     
+    # Extra port forwards to the node (TensorBoard, Dask, RStudio, ...) over the same SSH connection
+    dmc.Card(
+        children=[
+            dmc.CardSection(
+                dmc.Group([
+                    DashIconify(icon="mdi:lan-connect", width=24),
+                    dmc.Text("Port Forwards", size="lg", fw=500)
+                ]),
+                withBorder=True,
+                inheritPadding=True,
+                py="xs",
+            ),
+            dmc.Group([
+                dmc.TextInput(id="forward-label", label="Label", placeholder="TensorBoard", size="xs", w=160),
+                dmc.TextInput(id="forward-node", label="Node", placeholder="Session node", size="xs", w=160),
+                dmc.NumberInput(id="forward-remote-port", label="Node port", min=1, max=65535, size="xs", w=120),
+                dmc.NumberInput(id="forward-local-port", label="Local port (optional)", min=1, max=65535,
+                                size="xs", w=150),
+                dmc.Button(
+                    "Add forward",
+                    id="add-forward-btn",
+                    size="xs",
+                    leftSection=DashIconify(icon="mdi:plus", width=16)
+                ),
+            ], align="flex-end", style={"marginTop": "10px", "marginBottom": "10px"}),
+            dmc.Table(
+                [
+                    dmc.TableThead(
+                        dmc.TableTr([
+                            dmc.TableTh("Label"),
+                            dmc.TableTh("Local"),
+                            dmc.TableTh("Target"),
+                            dmc.TableTh("Connections"),
+                            dmc.TableTh("In"),
+                            dmc.TableTh("Out"),
+                            dmc.TableTh("Status"),
+                            dmc.TableTh(""),
+                        ])
+                    ),
+                    dmc.TableTbody(id="forward-table-body"),
+                ],
+                striped=True,
+                highlightOnHover=True,
+            ),
+        ],
+        withBorder=True,
+        shadow="sm",
+        radius="md",
+        style={"marginTop": "20px"}
+    ),
+    
     # Hidden textarea for clipboard copying
     html.Textarea(
         id="clipboard-text",
@@ -261,6 +354,11 @@ def populate_server_info(pathname, hostname, env_name, dest_folder):
     if pathname != "/notebook":
         return no_update, no_update, no_update, no_update, no_update, no_update
     
+    # After a refresh or restart the stores are empty; show the persisted session instead
+    if not hostname:
+        saved = get_saved_session() or {}
+        hostname, env_name, dest_folder = saved.get("node"), saved.get("env_name"), saved.get("dest_folder")
+    
     return (
         hostname or "Unknown",
         env_name or "base", 
@@ -277,16 +375,22 @@ def populate_server_info(pathname, hostname, env_name, dest_folder):
      Output("status-badge", "children", allow_duplicate=True),
      Output("status-badge", "color", allow_duplicate=True),
      Output("start-jupyter-btn", "disabled"),
-     Output("port-display", "children", allow_duplicate=True)],
+     Output("port-display", "children", allow_duplicate=True),
+     Output("tunnel-health-interval", "disabled")],
     Input("start-jupyter-btn", "n_clicks"),
     [State("selected-hostname", "data"),
      State("stored-env-name", "data"),
-     State("stored-dest-folder", "data")],
+     State("stored-dest-folder", "data"),
+     State("reuse-server-switch", "checked")],
     prevent_initial_call=True
 )
-def start_jupyter_session(n_clicks, hostname, env_name, dest_folder):
+def start_jupyter_session(n_clicks, hostname, env_name, dest_folder, reuse_existing):
+    if n_clicks and not hostname:
+        # After a refresh or restart the stores are empty; reattach to the persisted session
+        saved = get_saved_session() or {}
+        hostname, env_name, dest_folder = saved.get("node"), saved.get("env_name"), saved.get("dest_folder")
     if not n_clicks or not hostname:
-        return no_update, no_update, no_update, no_update, no_update, no_update
+        return no_update, no_update, no_update, no_update, no_update, no_update, no_update
     
     try:
         # Clear the output buffer before starting
@@ -296,86 +400,127 @@ def start_jupyter_session(n_clicks, hostname, env_name, dest_folder):
         import threading
         
         def run_jupyter():
-            connect_and_run_jupyter_with_output(hostname, env_name, dest_folder)
+            connect_and_run_jupyter_with_output(hostname, env_name, dest_folder,
+                                                reuse_existing=reuse_existing is not False)
         
         # Start Jupyter session in background
         jupyter_thread = threading.Thread(target=run_jupyter)
         jupyter_thread.daemon = True
         jupyter_thread.start()
         
-        # Enable real-time updates and update status
-        return True, False, "Starting...", "yellow", True, "Detecting..."
+        # Output arrives over the push stream; polling stays off unless the stream fails
+        return True, True, "Starting...", "yellow", True, "Detecting...", False
         
     except Exception as e:
-        return False, True, "Error", "red", False, "Error"
+        return False, True, "Error", "red", False, "Error", True
 
-# Real-time terminal output update callback
+# Output entries are sent to the browser as plain dicts; the clientside callback renders them
+def to_terminal_delta(delta):
+    return {
+        "reset": delta["reset"],
+        "seq": delta["seq"],
+        "entries": [
+            {"seq": e["seq"], "timestamp": e["timestamp"], "message": e["message"], "type": e["type"]}
+            for e in delta["entries"]
+        ],
+    }
+
+# Polling fallback for terminal output (the push stream normally delivers it)
 @callback(
-    [Output("terminal-output", "children", allow_duplicate=True),
-     Output("jupyter-url-display", "children", allow_duplicate=True),
-     Output("status-badge", "children", allow_duplicate=True),
-     Output("status-badge", "color", allow_duplicate=True),
-     Output("port-display", "children", allow_duplicate=True),
-     Output("start-jupyter-btn", "children", allow_duplicate=True)],
+    [Output("terminal-delta", "data"),
+     Output("output-cursor", "data")],
     Input("output-interval", "n_intervals"),
-    State("jupyter-process-running", "data"),
+    [State("jupyter-process-running", "data"),
+     State("output-cursor", "data")],
     prevent_initial_call=True
 )
-def update_terminal_output(n_intervals, is_running):
+def update_terminal_output(n_intervals, is_running, cursor):
     if not is_running:
-        return no_update, no_update, no_update, no_update, no_update, no_update
-    
-    # Get the latest output from buffer
-    output_buffer = get_output_buffer()
+        return no_update, no_update
     
-    if not output_buffer:
-        return no_update, no_update, no_update, no_update, no_update, no_update
+    # Nothing new since the last render
+    cursor = cursor or 0
+    if get_output_seq() == cursor:
+        return no_update, no_update
     
-    # Convert buffer to terminal display elements
-    terminal_elements = []
-    jupyter_url = None
-    current_status = "Running"
-    status_color = "green"
-    detected_port = None
-    jupyter_started = False
+    # Only the entries the browser has not seen yet
+    delta = get_output_delta(cursor)
+    return to_terminal_delta(delta), delta["seq"]
+
+# Session status badge for each state the session_manager snapshot can be in
+STATUS_BADGES = {
+    "starting": ("Starting...", "yellow"),
+    "running": ("Running", "green"),
+    "error": ("Error", "red"),
+    "stopped": ("Stopped", "gray"),
+}
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+def status_badge(state, health=None):
+    """Badge text and color for a session state; while running, the tunnel's health is shown too."""
+    status, color = STATUS_BADGES.get(state["status"], (state["status"].title(), "gray"))
+    if state["status"] == "starting" and state["phase"]:
+        status = f"Starting ({state['phase']})..."
+    elif state["status"] == "running":
+        tunnel = health or state.get("tunnel")
+        if tunnel and tunnel.get("state") == "unresponsive":
+            return "Not responding", "orange"
+        if tunnel and not tunnel["healthy"]:
+            return "Reconnecting...", "orange"
+        if health and health["rtt"] is not None:
+            status = f"Running · {health['rtt'] * 1000:.0f} ms"
+    return status, color
+
+def format_tunnel_health(health):
+    text = (f"↓ {format_bytes(health['bytes_in'])} ({format_bytes(health['rate_in'])}/s) · "
+            f"↑ {format_bytes(health['bytes_out'])} · {health['active_connections']} open")
+    if health["reconnects"]:
+        text += f" · {health['reconnects']} reconnect{'s' if health['reconnects'] != 1 else ''}"
+    if not health["healthy"] and health["last_error"]:
+        text += f" · {health['last_error']}"
+    return text
+
+def format_session_metrics(metrics):
+    """Last and mean duration of each launch phase, and how many launches got a URL."""
+    if not metrics["phases"]:
+        return ""
+    phases = " · ".join(f"{name} {stats['last']:.1f}s (avg {stats['mean']:.1f}s)"
+                        for name, stats in metrics["phases"].items())
+    return f"{phases} · {metrics['ready']}/{metrics['sessions']} ready"
+
+# Session status from the session state snapshot, refreshed whenever new output arrives
+@callback(
+    [Output("jupyter-url-display", "children", allow_duplicate=True),
+     Output("status-badge", "children", allow_duplicate=True),
+     Output("status-badge", "color", allow_duplicate=True),
+     Output("port-display", "children", allow_duplicate=True),
+     Output("start-jupyter-btn", "children", allow_duplicate=True),
+     Output("session-metrics-display", "children"),
+     Output("tunnel-health-display", "children", allow_duplicate=True),
+     Output("session-state-version", "data")],
+    Input("terminal-delta", "data"),
+    [State("jupyter-process-running", "data"),
+     State("session-state-version", "data")],
+    prevent_initial_call=True
+)
+def update_session_status(delta, is_running, version):
+    state = get_session_state()
+    # Nothing changed since the last render
+    if not is_running or state["version"] == version or state["status"] == "idle":
+        return no_update, no_update, no_update, no_update, no_update, no_update, no_update, no_update
     
-    for entry in output_buffer:
-        timestamp = entry["timestamp"]
-        message = entry["message"]
-        msg_type = entry["type"]
-        
-        # Check for Jupyter URL in messages
-        if "http://localhost:" in message and "token=" in message:
-            jupyter_url = message.split("http://localhost:")[1].split()[0]
-            if not jupyter_url.startswith("http"):
-                jupyter_url = "http://localhost:" + jupyter_url
-            jupyter_started = True
-            
-        # Extract port from various messages
-        if "Port " in message and "is available" in message:
-            import re
-            port_match = re.search(r"Port (\d+) is available", message)
-            if port_match:
-                detected_port = port_match.group(1)
-        elif "Using alternative port:" in message:
-            import re
-            port_match = re.search(r"Using alternative port: (\d+)", message)
-            if port_match:
-                detected_port = port_match.group(1)
-        elif "localhost:" in message and "token=" in message:
-            import re
-            port_match = re.search(r"localhost:(\d+)", message)
-            if port_match:
-                detected_port = port_match.group(1)
-        
-        # Determine CSS class based on message type
-        css_class = f"terminal-line {msg_type}"
-        terminal_elements.append(
-            html.Div(f"[{timestamp}] {message}", className=css_class)
-        )
+    health = get_tunnel_health()
+    status, color = status_badge(state, health)
     
-    # Update URL display if Jupyter URL found
+    # Update URL display once the session is ready
     url_display = no_update
+    button_text = no_update
+    jupyter_url = state["url"]
     if jupyter_url:
         url_display = dmc.Group([
             dmc.Text("Jupyter Notebook URL:", fw=500),
@@ -395,47 +540,145 @@ def update_terminal_output(n_intervals, is_running):
                 target="_blank"
             )
         ])
-        current_status = "Running"
-        status_color = "green"
+        button_text = "✅ Jupyter Running"
     
     # Update port display
-    port_display = detected_port if detected_port else "Detecting..."
+    port_display = str(state["local_port"]) if state["local_port"] else no_update
     
-    # Update start button
-    button_text = "✅ Jupyter Running" if jupyter_started else "Starting Jupyter..."
+    health_display = format_tunnel_health(health) if health is not None else no_update
+    return (url_display, status, color, port_display, button_text, format_session_metrics(get_session_metrics()),
+            health_display, state["version"])
+
+# Tunnel traffic while the session is running; polled less often while it stays the same
+@callback(
+    [Output("status-badge", "children", allow_duplicate=True),
+     Output("status-badge", "color", allow_duplicate=True),
+     Output("tunnel-health-display", "children", allow_duplicate=True),
+     Output("tunnel-health-interval", "interval")],
+    Input("tunnel-health-interval", "n_intervals"),
+    [State("jupyter-process-running", "data"),
+     State("tunnel-health-display", "children"),
+     State("tunnel-health-interval", "interval")],
+    prevent_initial_call=True
+)
+def update_tunnel_health(n_intervals, is_running, shown, interval):
+    state = get_session_state()
+    health = get_tunnel_health()
+    if not is_running or health is None or state["status"] != "running":
+        return no_update, no_update, no_update, no_update
+    
+    text = format_tunnel_health(health)
+    if text == shown:
+        return no_update, no_update, no_update, min(interval * 2, TUNNEL_HEALTH_MAX_INTERVAL)
+    status, color = status_badge(state, health)
+    return status, color, text, TUNNEL_HEALTH_INTERVAL
+
+def forward_rows(forwards):
+    if not forwards:
+        return [dmc.TableTr(html.Td(dmc.Text("No extra forwards", c="dimmed", size="sm"), colSpan=8))]
+    rows = []
+    for forward in forwards:
+        local_url = f"http://localhost:{forward['local_port']}"
+        rows.append(dmc.TableTr([
+            dmc.TableTd(forward["label"]),
+            dmc.TableTd(dmc.Anchor(str(forward["local_port"]), href=local_url, target="_blank")),
+            dmc.TableTd(forward["target"]),
+            dmc.TableTd(f"{forward['active_connections']} open / {forward['total_connections']} total"),
+            dmc.TableTd(format_bytes(forward["bytes_in"])),
+            dmc.TableTd(format_bytes(forward["bytes_out"])),
+            dmc.TableTd(dmc.Badge("Up" if forward["alive"] else "Down", color="green" if forward["alive"] else "red",
+                                  variant="light")),
+            dmc.TableTd(dmc.Button("Remove", id={"type": "remove-forward", "port": forward["local_port"]},
+                                   size="compact-xs", variant="subtle", color="red")),
+        ]))
+    return rows
+
+# Add or remove a port forward; the table below re-renders from the forward manager
+@callback(
+    Output("forwards-version", "data"),
+    [Input("add-forward-btn", "n_clicks"),
+     Input({"type": "remove-forward", "port": dash.ALL}, "n_clicks")],
+    [State("forward-remote-port", "value"),
+     State("forward-node", "value"),
+     State("forward-local-port", "value"),
+     State("forward-label", "value"),
+     State("forwards-version", "data")],
+    prevent_initial_call=True
+)
+def manage_port_forwards(add_clicks, remove_clicks, remote_port, node, local_port, label, version):
+    triggered = dash.callback_context.triggered
+    # Re-rendered remove buttons fire with no clicks
+    if not triggered or not triggered[0]["value"]:
+        return no_update
     
-    return terminal_elements, url_display, current_status, status_color, port_display, button_text
+    triggered_id = dash.callback_context.triggered_id
+    if isinstance(triggered_id, dict):
+        remove_port_forward(triggered_id["port"])
+    elif not remote_port:
+        add_to_output_buffer("Enter the node port to forward", "warning")
+        return no_update
+    else:
+        try:
+            add_port_forward(remote_port, node=(node or "").strip() or None, local_port=local_port,
+                             label=(label or "").strip() or None)
+        except Exception as e:
+            add_to_output_buffer(f"Could not add port forward: {e}", "error")
+            return no_update
+    return (version or 0) + 1
+
+def forward_counters(forwards):
+    """What the forward table shows of each forward, to tell whether a poll changed anything."""
+    return [[forward["local_port"], forward["active_connections"], forward["total_connections"],
+             forward["bytes_in"], forward["bytes_out"], forward["alive"]] for forward in forwards]
+
+@callback(
+    [Output("forward-table-body", "children"),
+     Output("forwards-rendered", "data")],
+    [Input("forwards-version", "data"),
+     Input("tunnel-health-interval", "n_intervals"),
+     Input("page-location-notebook", "pathname")],
+    State("forwards-rendered", "data")
+)
+def update_forward_table(version, n_intervals, pathname, rendered):
+    forwards = list_port_forwards()
+    counters = forward_counters(forwards)
+    if dash.callback_context.triggered_id == "tunnel-health-interval" and counters == rendered:
+        return no_update, no_update
+    return forward_rows(forwards), counters
 
 # Callback to clear terminal
 @callback(
-    Output("terminal-output", "children", allow_duplicate=True),
+    [Output("terminal-delta", "data", allow_duplicate=True),
+     Output("output-cursor", "data", allow_duplicate=True)],
     Input("clear-terminal-btn", "n_clicks"),
+    State("output-cursor", "data"),
     prevent_initial_call=True
 )
-def clear_terminal(n_clicks):
+def clear_terminal(n_clicks, cursor):
     if not n_clicks:
-        return no_update
+        return no_update, no_update
     
     clear_output_buffer()
-    return [
-        html.Div(f"[{time.strftime('%H:%M:%S')}] Terminal cleared", className="terminal-line info"),
-        html.Div(f"[{time.strftime('%H:%M:%S')}] Ready for new session...", className="terminal-line success"),
-    ]
+    add_to_output_buffer("Terminal cleared", "info")
+    add_to_output_buffer("Ready for new session...", "success")
+    delta = get_output_delta(cursor or 0)
+    return to_terminal_delta(delta), delta["seq"]
 
 # Callback to handle command sending
 @callback(
     [Output("command-input", "value"),
-     Output("terminal-output", "children", allow_duplicate=True)],
+     Output("terminal-delta", "data", allow_duplicate=True),
+     Output("output-cursor", "data", allow_duplicate=True)],
     Input("send-command-btn", "n_clicks"),
-    State("command-input", "value"),
+    [State("command-input", "value"),
+     State("output-cursor", "data")],
     prevent_initial_call=True
 )
-def send_command(n_clicks, command):
+def send_command(n_clicks, command, cursor):
     if not n_clicks or not command:
-        return no_update, no_update
+        return no_update, no_update, no_update
     
     # Add command to output buffer for immediate feedback
-    from session_manager import add_to_output_buffer
     add_to_output_buffer(f"Command sent: {command}", "info")
     
     # Send command to active shell
@@ -444,21 +687,9 @@ def send_command(n_clicks, command):
     if not success:
         add_to_output_buffer("Warning: Command may not have been sent (no active shell)", "warning")
     
-    # Get updated terminal content
-    output_buffer = get_output_buffer()
-    terminal_elements = []
-    
-    for entry in output_buffer:
-        timestamp = entry["timestamp"]
-        message = entry["message"]
-        msg_type = entry["type"]
-        css_class = f"terminal-line {msg_type}"
-        terminal_elements.append(
-            html.Div(f"[{timestamp}] {message}", className=css_class)
-        )
-    
-    # Clear the input field and return updated terminal
-    return "", terminal_elements
+    # Clear the input field and send the new terminal lines
+    delta = get_output_delta(cursor or 0)
+    return "", to_terminal_delta(delta), delta["seq"]
 
 # Callback to handle logout
 @callback(
@@ -717,22 +948,87 @@ clientside_callback(
     prevent_initial_call=True
 )
 
-# Clientside callback to auto-scroll terminal to bottom when new content is added
+# Clientside callback to subscribe to the session output stream while Jupyter is running
 clientside_callback(
     """
-    function(children) {
-        if (children && children.length > 0) {
-            setTimeout(function() {
-                var terminalDiv = document.getElementById('terminal-output');
-                if (terminalDiv) {
-                    terminalDiv.scrollTop = terminalDiv.scrollHeight;
-                }
-            }, 100);  // Small delay to ensure content is rendered
+    function(isRunning) {
+        var dc = window.dash_clientside;
+        if (window.sessionOutputStream) {
+            window.sessionOutputStream.close();
+            window.sessionOutputStream = null;
         }
-        return window.dash_clientside.no_update;
+        if (!isRunning) {
+            return dc.no_update;
+        }
+        if (typeof EventSource === 'undefined') {
+            return false;  // No push support: poll instead
+        }
+        var terminalDiv = document.getElementById('terminal-output');
+        var since = terminalDiv ? Number(terminalDiv.dataset.seq || 0) : 0;
+        var stream = new EventSource('""" + STREAM_PATH + """?since=' + since);
+        stream.onmessage = function(event) {
+            // The page was left; stop listening
+            if (!document.getElementById('terminal-output')) {
+                stream.close();
+                window.sessionOutputStream = null;
+                return;
+            }
+            var delta = JSON.parse(event.data);
+            dc.set_props('terminal-delta', {data: delta});
+            dc.set_props('output-cursor', {data: delta.seq});
+        };
+        stream.onerror = function() {
+            // The browser retries on its own and resumes from the last event id;
+            // only fall back to polling once it has given up
+            if (stream.readyState === EventSource.CLOSED) {
+                dc.set_props('output-interval', {disabled: false});
+            }
+        };
+        window.sessionOutputStream = stream;
+        return true;
+    }
+    """,
+    Output("output-interval", "disabled", allow_duplicate=True),
+    Input("jupyter-process-running", "data"),
+    prevent_initial_call=True
+)
+
+# Clientside callback to append new output to the terminal and keep it scrolled to the bottom
+clientside_callback(
+    """
+    function(delta) {
+        var terminalDiv = document.getElementById('terminal-output');
+        if (!delta || !terminalDiv) {
+            return window.dash_clientside.no_update;
+        }
+        var renderedSeq = Number(terminalDiv.dataset.seq || 0);
+        if (delta.reset) {
+            terminalDiv.replaceChildren();
+            renderedSeq = 0;
+        }
+        var fragment = document.createDocumentFragment();
+        delta.entries.forEach(function(entry) {
+            // Two callbacks can deliver the same entries; append each one once
+            if (entry.seq <= renderedSeq) {
+                return;
+            }
+            var line = document.createElement('div');
+            line.className = 'terminal-line ' + entry.type;
+            line.textContent = '[' + entry.timestamp + '] ' + entry.message;
+            fragment.appendChild(line);
+            renderedSeq = entry.seq;
+        });
+        terminalDiv.appendChild(fragment);
+        // Same limit as the server-side buffer
+        while (terminalDiv.childElementCount > 1000) {
+            terminalDiv.removeChild(terminalDiv.firstElementChild);
+        }
+        terminalDiv.dataset.seq = renderedSeq;
+        terminalDiv.scrollTop = terminalDiv.scrollHeight;
+        return renderedSeq;
     }
     """,
-    Output("terminal-output", "style", allow_duplicate=True),
-    Input("terminal-output", "children"),
+    Output("terminal-rendered-seq", "data"),
+    Input("terminal-delta", "data"),
     prevent_initial_call=True
 )
@@ -2,7 +2,10 @@ from dash import html, dcc, Output, Input, State, no_update, callback, clientsid
 import dash
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
-from session_manager import run_command_with_paramiko, parse_ai_output, close_ssh_session
+from cluster_table import ClusterTable
+from cluster_history import MIN_TREND_SAMPLES
+from placement import PlacementRequest
+from session_manager import get_cluster_snapshot, get_cluster_trends, rank_cluster_table, close_ssh_session
 
 # Register this page with Dash Pages
 dash.register_page(__name__, path="/servers")
@@ -10,10 +13,35 @@ dash.register_page(__name__, path="/servers")
 
 caption = dmc.TableCaption("Click a row to select a server.")
 
+# "Fetch Servers" reuses a cluster snapshot younger than this many seconds
+FETCH_MAX_AGE = 10
+
+
+def format_trend(trend):
+    """Mean ± standard deviation of free RAM over the trend window, once there is enough history."""
+    if not trend or trend["samples"] < MIN_TREND_SAMPLES:
+        return "—"
+    return f"{trend['gb_avail_mean']:.0f} ± {trend['gb_avail_std']:.0f} GB"
+
+
+def row_style(top_pick, eligible):
+    """Highlight the top placement pick and fade hosts that do not satisfy the request."""
+    style = {"cursor": "pointer", "backgroundColor": "#e6fcf5" if top_pick else "white"}
+    if not eligible:
+        style["opacity"] = 0.5
+    return style
+
+
+def format_age(seconds):
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    return f"{int(seconds // 60)}m {int(seconds % 60):02d}s"
+
 
 layout = html.Div([
     dcc.Location(id="page-location-servers", refresh=False),  # Detect page load
     dcc.Store(id="selected-row-index"),  # Store for selected row index
+    dcc.Store(id="best-server-host"),  # Top placement pick for the current request
     # Custom confirmation modal
     dmc.Modal(
         title=dmc.Text("Confirmation Required", className="confirmationTitle"),  # Use dmc.Text with the className
@@ -82,6 +110,25 @@ layout = html.Div([
         justify={"sm": "space-between", "base": "center"},
         align="center",
     ),    
+    # What the notebook needs from a node; the best match is highlighted and can be launched directly
+    dmc.Group(
+        [
+            dmc.NumberInput(id="placement-min-gb", label="Min free RAM (GB)", value=0, min=0, size="xs", w=140),
+            dmc.NumberInput(id="placement-min-cpu", label="Min free CPUs", value=0, min=0, size="xs", w=120),
+            dmc.TextInput(id="placement-cpu-type", label="CPU type", placeholder="Any", size="xs", w=120),
+            dmc.Switch(id="placement-gpu", label="GPU required", size="xs", checked=False),
+            dmc.Button(
+                "Launch on best server",
+                id="launch-best-btn",
+                disabled=True,
+                size="sm",
+                leftSection=DashIconify(icon="mdi:rocket-launch"),
+            ),
+        ],
+        align="flex-end",
+        gap="md",
+        style={"marginTop": "1rem"},
+    ),
     html.Div(
         className="server-table-container",
         children=[
@@ -100,6 +147,8 @@ layout = html.Div([
                                 dmc.TableTh(dmc.Group([DashIconify(icon="mdi:application", width=20), "Program"])),
                                 dmc.TableTh(dmc.Group([DashIconify(icon="mdi:gpu", width=20), "GPU"])),
                                 dmc.TableTh(dmc.Group([DashIconify(icon="mdi:account", width=20), "User"])),
+                                dmc.TableTh(dmc.Group([DashIconify(icon="mdi:chart-line", width=20), "RAM Trend (30 min)"])),
+                                dmc.TableTh(dmc.Group([DashIconify(icon="mdi:podium", width=20), "Score"])),
                             ]
                         )
                     ),
@@ -144,24 +193,46 @@ clientside_callback(
     Output("jupyter-status", "children", allow_duplicate=True),         # Update the status message
     Output("loading-overlay-servers", "visible"),  # Update loading overlay visibility
     Output("server-data", "data", allow_duplicate=True),
+    Output("best-server-host", "data"),
+    Output("launch-best-btn", "children"),
+    Output("launch-best-btn", "disabled"),
     Input("fetch-servers-btn", "n_clicks"),       # Triggered by button click
     Input("page-location-servers", "pathname"),  
     Input("server-data", "data"), 
+    Input("placement-min-gb", "value"),
+    Input("placement-min-cpu", "value"),
+    Input("placement-cpu-type", "value"),
+    Input("placement-gpu", "checked"),
     prevent_initial_call=True
 )
-def update_server_table(n_clicks, pathname, server_data): 
-    if pathname != "/servers" and (n_clicks is None or n_clicks == 0) and (server_data is None or server_data == []):
-        return [], "⚠️ No servers fetched yet.", False, server_data
+def update_server_table(n_clicks, pathname, server_data, min_gb, min_cpu, cpu_type, gpu): 
+    table = ClusterTable.from_store(server_data)
+    no_pick = (None, "Launch on best server", True)
+    if pathname != "/servers" and (n_clicks is None or n_clicks == 0) and not len(table):
+        return [], "⚠️ No servers fetched yet.", False, server_data, *no_pick
 
     # Use the shared SSH session to fetch server data
     try:
-        if server_data is None or server_data == [] or (n_clicks is not None and n_clicks > 0):
-            # Fetch server data using the 'ai' command
-            ai_output = run_command_with_paramiko("ai")
-            server_data = parse_ai_output(ai_output)
+        triggered = dash.callback_context.triggered_id
+        if triggered == "fetch-servers-btn" and n_clicks:
+            # An explicit fetch only waits for the gateway if the snapshot is not recent
+            snapshot = get_cluster_snapshot(max_age=FETCH_MAX_AGE)
+        elif not len(table):
+            snapshot = get_cluster_snapshot()
+        else:
+            # Show what the page has and pick up a newer background snapshot if there is one
+            snapshot = get_cluster_snapshot(block=False)
+        if snapshot is not None:
+            table = snapshot.table
+        # Hosts that satisfy the request come first, best placement score first
+        request = PlacementRequest(min_gb=min_gb, min_cpu=min_cpu, gpu=gpu, cpu_type=cpu_type)
+        table, ranking = rank_cluster_table(table, request)
+        trends = get_cluster_trends()
+        server_data = table.to_store()
 
-        if not server_data:
-            return [], "⚠️ No servers found.", False, server_data
+        if not len(table):
+            return [], "⚠️ No servers found.", False, server_data, *no_pick
+        best_host = ranking[0]["host"] if ranking[0]["eligible"] else None
 
         # Generate table rows dynamically
         rows = [
@@ -170,8 +241,8 @@ def update_server_table(n_clicks, pathname, server_data):
                 html.Td(
                     [
                         DashIconify(icon="mdi:server", width=28, style={"marginRight": "6px", "color": "#0000ee"}),
-                        html.Span(server.get("HOST", ""), style={"fontWeight": "bold", "color": "#0000ee"})
-                    ]
+                        html.Span(server.get("HOST", ""), style={"fontWeight": "bold", "color": "#0000ee"}),
+                    ] + ([dmc.Badge("Top pick", color="teal", size="sm", ml=8)] if idx == 0 and best_host else [])
                 ),
                 html.Td(server.get("CPU_AVAIL", "")),
                 html.Td(server.get("LOAD", "")),
@@ -182,16 +253,22 @@ def update_server_table(n_clicks, pathname, server_data):
                 html.Td(server.get("PROGRAM", "")),
                 html.Td(server.get("HAS_GPU", "")),
                 html.Td(server.get("USER", "")),
+                html.Td(format_trend(trends.get(server["HOST"]))),
+                html.Td(f"{candidate['score']:.2f}"),
             ],
             id={"type": "row", "index": idx},
             n_clicks=0,
-            style={"cursor": "pointer", "backgroundColor": "white"},
-        ) for idx, server in enumerate(server_data)
+            style=row_style(idx == 0 and best_host is not None, candidate["eligible"]),
+        ) for idx, (server, candidate) in enumerate(zip(table, ranking))
         ]
-        return rows, "🟢 Servers fetched successfully.", False, server_data
+        age = f" (updated {format_age(snapshot.age)} ago)" if snapshot is not None else ""
+        if best_host is None:
+            return rows, f"⚠️ No server matches the request{age}.", False, server_data, *no_pick
+        return (rows, f"🟢 Servers fetched successfully{age}.", False, server_data,
+                best_host, f"Launch on {best_host}", False)
     except Exception as e:
         print(f"Error fetching server data: {e}")
-        return [], f"❌ Error fetching server data: {str(e)}", False, server_data
+        return [], f"❌ Error fetching server data: {str(e)}", False, server_data, *no_pick
 
 
 @callback(
@@ -224,15 +301,15 @@ def select_row(n_clicks):
     prevent_initial_call=True
 )
 def on_select_server(selected_index, server_data):
-    if selected_index is None or not server_data:
+    table = ClusterTable.from_store(server_data)
+    if selected_index is None or not len(table):
         return False, "⚠️ No server selected.", None
 
-    if selected_index >= len(server_data):
+    if selected_index >= len(table):
         return False, "⚠️ Invalid selection.", None
 
     # Extract the hostname from the selected server
-    selected_server = server_data[selected_index]
-    hostname = selected_server.get("HOST", "Unknown")
+    hostname = table.hosts[selected_index] or "Unknown"
 
     # Show confirmation modal with bold server name
     message = html.Div([
@@ -278,6 +355,19 @@ def handle_confirmation(yes_clicks, no_clicks, hostname, server_data, env_name,
 
     return no_update, False, no_update
 
+@callback(
+    [Output("selected-hostname", "data", allow_duplicate=True),
+     Output("_pages_location", "pathname", allow_duplicate=True)],
+    Input("launch-best-btn", "n_clicks"),
+    State("best-server-host", "data"),
+    prevent_initial_call=True
+)
+def launch_best_server(n_clicks, hostname):
+    # One click: the notebook page starts the session as soon as it loads
+    if not n_clicks or not hostname:
+        return no_update, no_update
+    return hostname, "/notebook"
+
 @callback(
     Output("_pages_location", "pathname", allow_duplicate=True),
     Input("logout-btn", "n_clicks"),
@@ -0,0 +1,162 @@
+import numpy as np
+
+from cluster_history import TREND_WINDOW
+
+# Weight of each criterion in the placement score; a criterion with weight 0 is skipped
+DEFAULT_WEIGHTS = {
+    "trend": 1.0,
+    "gb_avail": 0.5,
+    "cpu_avail": 0.5,
+    "load": 0.5,
+}
+
+# name -> function(table, scheduler) returning one value per host, higher is better, scaled to [0, 1]
+CRITERIA = {}
+
+
+def criterion(name):
+    """Register a placement criterion under ``name`` so weights can refer to it."""
+    def register(function):
+        CRITERIA[name] = function
+        return function
+    return register
+
+
+def _scaled(values):
+    """Scale non-negative values to [0, 1] by the largest one."""
+    values = np.clip(np.asarray(values, dtype=np.float64), 0.0, None)
+    peak = values.max() if len(values) else 0.0
+    return values / peak if peak > 0 else np.zeros_like(values)
+
+
+@criterion("gb_avail")
+def free_memory(table, scheduler):
+    return _scaled(table.rows["gb_avail"])
+
+
+@criterion("cpu_avail")
+def free_cpus(table, scheduler):
+    return _scaled(table.rows["cpu_avail"])
+
+
+@criterion("load")
+def idle_share(table, scheduler):
+    """Share of the host's cores that the load leaves idle."""
+    cores = np.maximum(table.rows["cpu"], 1)
+    return 1.0 - np.clip(table.rows["load"] / cores, 0.0, 1.0)
+
+
+@criterion("trend")
+def steady_free_memory(table, scheduler):
+    """Free memory the host has kept over the trend window (the current value without history)."""
+    if scheduler.history is None:
+        return _scaled(table.rows["gb_avail"])
+    return _scaled(scheduler.history.trend_scores(table, scheduler.window))
+
+
+class PlacementRequest:
+    """What a notebook session needs from a node."""
+    __slots__ = ("min_gb", "min_cpu", "gpu", "cpu_type")
+
+    def __init__(self, min_gb=0, min_cpu=0, gpu=False, cpu_type=None):
+        self.min_gb = float(min_gb or 0)
+        self.min_cpu = float(min_cpu or 0)
+        self.gpu = bool(gpu)
+        self.cpu_type = (cpu_type or "").strip() or None
+
+    def mask(self, table):
+        """Boolean array of the hosts that satisfy the request."""
+        rows = table.rows
+        mask = (rows["gb_avail"] >= self.min_gb) & (rows["cpu_avail"] >= self.min_cpu)
+        if self.gpu:
+            mask &= rows["has_gpu"]
+        if self.cpu_type:
+            cpu_types = np.char.lower(rows["cpu_type"].astype(str))
+            mask &= np.char.startswith(cpu_types, self.cpu_type.lower())
+        return mask
+
+    def __repr__(self):
+        return (f"PlacementRequest(min_gb={self.min_gb:g}, min_cpu={self.min_cpu:g}, gpu={self.gpu}, "
+                f"cpu_type={self.cpu_type!r})")
+
+
+class PlacementScheduler:
+    """Rank cluster hosts for a PlacementRequest by a weighted score.
+
+    Each criterion in ``weights`` maps every host to a value in [0, 1]
+    (higher is better) in one array operation, and the score is their
+    weighted sum divided by the total weight. Criteria are looked up in
+    ``CRITERIA``; register new ones with ``@criterion(name)``. With a
+    ClusterHistory the "trend" criterion prefers hosts that have stayed free
+    over ``window`` seconds.
+    """
+
+    def __init__(self, weights=None, history=None, window=TREND_WINDOW):
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.history = history
+        self.window = window
+        unknown = set(self.weights) - set(CRITERIA)
+        if unknown:
+            raise ValueError(f"Unknown placement criteria: {', '.join(sorted(unknown))}")
+
+    def scores(self, table):
+        """Weighted score of every host, and the value of each criterion, as arrays in row order."""
+        components = {}
+        total = np.zeros(len(table), dtype=np.float64)
+        weight_sum = 0.0
+        for name, weight in self.weights.items():
+            if not weight or not len(table):
+                continue
+            components[name] = CRITERIA[name](table, self)
+            total += weight * components[name]
+            weight_sum += abs(weight)
+        return (total / weight_sum if weight_sum else total), components
+
+    def rank(self, table, request=None):
+        """All hosts, eligible ones first, each group best first.
+
+        Returns a list of dicts with the host, its row index, whether it
+        satisfies ``request``, its score and its criterion values.
+        """
+        if not len(table):
+            return []
+        scores, components = self.scores(table)
+        eligible = request.mask(table) if request is not None else np.ones(len(table), dtype=bool)
+        order = np.lexsort((-scores, ~eligible))
+        return [
+            {
+                "host": table.hosts[index],
+                "index": int(index),
+                "eligible": bool(eligible[index]),
+                "score": float(scores[index]),
+                "components": {name: float(values[index]) for name, values in components.items()},
+            }
+            for index in order
+        ]
+
+    def _pick(self, table, request):
+        scores, components = self.scores(table)
+        masked = np.where(request.mask(table), scores, -np.inf) if request is not None else scores
+        index = int(np.argmax(masked))
+        return (index if masked[index] > -np.inf else None), scores, components
+
+    def best_index(self, table, request=None):
+        """Row index of the best eligible host, or None; no per-host results are built."""
+        if not len(table):
+            return None
+        return self._pick(table, request)[0]
+
+    def best(self, table, request=None):
+        """The top eligible candidate, or None if no host satisfies ``request``."""
+        if not len(table):
+            return None
+        index, scores, components = self._pick(table, request)
+        if index is None:
+            return None
+        return {
+            "host": table.hosts[index],
+            "index": index,
+            "eligible": True,
+            "score": float(scores[index]),
+            "components": {name: float(values[index]) for name, values in components.items()},
+        }
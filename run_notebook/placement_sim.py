@@ -0,0 +1,322 @@
+import argparse
+import heapq
+import time
+from collections import deque
+
+import numpy as np
+
+from cluster_history import CLUSTER_HISTORY_FILE, ClusterHistory
+from cluster_table import ClusterTable
+from placement import PlacementRequest, PlacementScheduler
+
+# name -> factory(seed) returning choose(table, request) -> row index or None
+POLICIES = {}
+
+
+def policy(name):
+    """Register a placement policy factory under ``name`` for the simulator."""
+    def register(factory):
+        POLICIES[name] = factory
+        return factory
+    return register
+
+
+@policy("max_gb")
+def max_gb_policy(seed):
+    """The original find_best_server rule: the host with the most free GB, if it fits."""
+    def choose(table, request):
+        if not len(table):
+            return None
+        index = int(np.argmax(table.rows["gb_avail"]))
+        return index if request.mask(table.take([index]))[0] else None
+    return choose
+
+
+@policy("weighted")
+def weighted_policy(seed):
+    """PlacementScheduler with its default weights (no history, so "trend" is current free GB)."""
+    return PlacementScheduler().best_index
+
+
+@policy("least_loaded")
+def least_loaded_policy(seed):
+    def choose(table, request):
+        if not len(table):
+            return None
+        busy = table.rows["load"] / np.maximum(table.rows["cpu"], 1)
+        busy = np.where(request.mask(table), busy, np.inf)
+        index = int(np.argmin(busy))
+        return index if busy[index] < np.inf else None
+    return choose
+
+
+@policy("random")
+def random_policy(seed):
+    rng = np.random.default_rng(seed)
+
+    def choose(table, request):
+        eligible = np.flatnonzero(request.mask(table)) if len(table) else []
+        return int(rng.choice(eligible)) if len(eligible) else None
+    return choose
+
+
+class SimRequest:
+    """A notebook session in the synthetic workload."""
+    __slots__ = ("arrival", "duration", "request")
+
+    def __init__(self, arrival, duration, request):
+        self.arrival = arrival
+        self.duration = duration
+        self.request = request
+
+
+def synthetic_cluster(hosts=1000, seed=0):
+    """A cluster table with a mix of node sizes, CPU types and a few GPU nodes."""
+    rng = np.random.default_rng(seed)
+    cpu = rng.choice([16, 32, 48, 64, 128], hosts)
+    gb_total = rng.choice([64, 128, 256, 512, 1024], hosts).astype(float)
+    gpu = rng.random(hosts) < 0.05
+    load = rng.uniform(0, 0.5, hosts) * cpu
+    return ClusterTable.from_columns({
+        "HOST": [f"{'gpu' if g else 'node'}{i:04d}" for i, g in enumerate(gpu)],
+        "CPU": cpu,
+        "CPU_TYPE": rng.choice(["AMD-7", "AMD-9", "INTEL-6", "INTEL-9"], hosts).tolist(),
+        "GB_TOTAL": gb_total,
+        "GB_AVAIL": np.round(gb_total * rng.uniform(0.3, 0.95, hosts), 1),
+        "LOAD": np.round(load, 2),
+        "CPU_AVAIL": np.round(cpu - load, 1),
+        "HAS_GPU": gpu.tolist(),
+    })
+
+
+def synthetic_snapshots(hosts=1000, steps=48, interval=300, seed=0, start=0.0):
+    """Yield ``(timestamp, ClusterTable)`` with background usage drifting as a random walk."""
+    rng = np.random.default_rng(seed + 1)
+    base = synthetic_cluster(hosts, seed)
+    rows = base.rows.copy()
+    for step in range(steps):
+        rows = rows.copy()
+        drift = rng.normal(0, 0.03, len(rows)) * rows["gb_total"]
+        rows["gb_avail"] = np.clip(rows["gb_avail"] + drift, 0.05 * rows["gb_total"], rows["gb_total"])
+        rows["load"] = np.clip(rows["load"] + rng.normal(0, 0.03, len(rows)) * rows["cpu"], 0, rows["cpu"])
+        rows["cpu_avail"] = rows["cpu"] - rows["load"]
+        yield start + step * interval, ClusterTable(rows)
+
+
+def synthetic_requests(count, start, end, seed=0, median_gb=16, gpu_share=0.05, mean_duration=3600):
+    """Notebook requests arriving uniformly over ``[start, end)``, sorted by arrival."""
+    rng = np.random.default_rng(seed + 2)
+    arrivals = np.sort(rng.uniform(start, end, count))
+    gb = np.round(rng.lognormal(np.log(median_gb), 0.8, count))
+    cpus = rng.choice([1, 2, 4, 8, 16], count, p=[0.3, 0.3, 0.2, 0.15, 0.05])
+    gpu = rng.random(count) < gpu_share
+    durations = rng.exponential(mean_duration, count)
+    return [
+        SimRequest(float(arrivals[i]), float(durations[i]),
+                   PlacementRequest(min_gb=gb[i], min_cpu=cpus[i], gpu=gpu[i]))
+        for i in range(count)
+    ]
+
+
+def _fits(row, request):
+    """Scalar form of ``PlacementRequest.mask`` for a single row."""
+    if row["gb_avail"] < request.min_gb or row["cpu_avail"] < request.min_cpu:
+        return False
+    if request.gpu and not row["has_gpu"]:
+        return False
+    return not request.cpu_type or str(row["cpu_type"]).lower().startswith(request.cpu_type.lower())
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else 0.0
+
+
+class Simulation:
+    """Replay cluster snapshots and a stream of notebook requests against a placement policy.
+
+    Between two snapshots the cluster is the earlier snapshot minus what the
+    simulated sessions still hold. A request the policy cannot place waits
+    and is retried, oldest first, at every snapshot and whenever a session
+    ends on a host it would fit (at most ``retry_limit`` policy calls per
+    ended session); requests behind it may still be placed.
+    After ``max_wait`` seconds it counts as a failure. ``mem_util_max`` can
+    exceed 1 when the replayed background usage grows onto nodes that
+    simulated sessions already occupy.
+    """
+
+    def __init__(self, snapshots, requests, max_wait=1800, retry_limit=32):
+        self.snapshots = list(snapshots)
+        self.requests = sorted(requests, key=lambda r: r.arrival)
+        self.max_wait = max_wait
+        self.retry_limit = retry_limit
+        gaps = np.diff([ts for ts, _ in self.snapshots])
+        self.interval = float(np.median(gaps)) if len(gaps) else 300.0
+
+    def run(self, choose):
+        """Run one policy and return its report."""
+        started = time.perf_counter()
+        allocations = {}  # host -> [gb, cpus] held by simulated sessions
+        releases = []  # heap of (end time, sequence, host, gb, cpus)
+        pending = deque()
+        latencies = []
+        waits = []
+        sessions_per_host = {}
+        mem_util_std, mem_util_max, load_std = [], [], []
+        failed = overcommits = sequence = 0
+        next_request = 0
+
+        def apply(rows, positions, host, gb, cpus):
+            index = positions.get(host)
+            if index is not None:
+                rows["gb_avail"][index] -= gb
+                rows["cpu_avail"][index] -= cpus
+                rows["load"][index] += cpus
+
+        def try_place(table, positions, item, now):
+            nonlocal overcommits, sequence
+            t0 = time.perf_counter()
+            index = choose(table, item.request)
+            latencies.append(time.perf_counter() - t0)
+            if index is None:
+                return False
+            host = table.rows["host"][index]
+            gb, cpus = item.request.min_gb, item.request.min_cpu
+            apply(table.rows, positions, host, gb, cpus)
+            if table.rows["gb_avail"][index] < 0:
+                overcommits += 1
+            held = allocations.setdefault(host, [0.0, 0.0])
+            held[0] += gb
+            held[1] += cpus
+            sequence += 1
+            heapq.heappush(releases, (now + item.duration, sequence, host, gb, cpus))
+            waits.append(now - item.arrival)
+            sessions_per_host[host] = sessions_per_host.get(host, 0) + 1
+            return True
+
+        def drain_pending(table, positions, now, host=None):
+            # After a release only ``host`` has more room, so only requests that now fit there are retried
+            nonlocal failed
+            freed = positions.get(host) if host is not None else None
+            attempts = 0
+            for _ in range(len(pending)):
+                item = pending.popleft()
+                if now - item.arrival > self.max_wait:
+                    failed += 1
+                    continue
+                if freed is not None and (attempts >= self.retry_limit or not _fits(table.rows[freed], item.request)):
+                    pending.append(item)
+                    continue
+                attempts += 1
+                if not try_place(table, positions, item, now):
+                    pending.append(item)
+
+        for step, (ts, snapshot) in enumerate(self.snapshots):
+            end = self.snapshots[step + 1][0] if step + 1 < len(self.snapshots) else ts + self.interval
+            table = ClusterTable(snapshot.rows.copy())
+            positions = {host: index for index, host in enumerate(table.hosts)}
+            for host, (gb, cpus) in allocations.items():
+                apply(table.rows, positions, host, gb, cpus)
+            drain_pending(table, positions, ts)
+
+            while True:
+                release_at = releases[0][0] if releases and releases[0][0] < end else np.inf
+                arrival_at = (self.requests[next_request].arrival
+                              if next_request < len(self.requests) and self.requests[next_request].arrival < end
+                              else np.inf)
+                if release_at == np.inf and arrival_at == np.inf:
+                    break
+                if release_at <= arrival_at:
+                    _, _, host, gb, cpus = heapq.heappop(releases)
+                    held = allocations[host]
+                    held[0] -= gb
+                    held[1] -= cpus
+                    apply(table.rows, positions, host, -gb, -cpus)
+                    if host in positions:
+                        drain_pending(table, positions, release_at, host)
+                else:
+                    item = self.requests[next_request]
+                    next_request += 1
+                    if not try_place(table, positions, item, arrival_at):
+                        pending.append(item)
+
+            rows = table.rows
+            sized = rows["gb_total"] > 0
+            mem_util = 1.0 - rows["gb_avail"][sized] / rows["gb_total"][sized]
+            if len(mem_util):
+                mem_util_std.append(float(mem_util.std()))
+                mem_util_max.append(float(mem_util.max()))
+            load_std.append(float((rows["load"] / np.maximum(rows["cpu"], 1)).std()))
+
+        # Whatever never got a node (or arrived after the last snapshot) failed
+        failed += len(pending) + len(self.requests) - next_request
+        total = len(self.requests)
+        return {
+            "requests": total,
+            "placed": total - failed,
+            "failed": failed,
+            "failure_rate": failed / total if total else 0.0,
+            "wait_mean_s": float(np.mean(waits)) if waits else 0.0,
+            "wait_p95_s": _percentile(waits, 95),
+            "decisions": len(latencies),
+            "latency_mean_us": float(np.mean(latencies)) * 1e6 if latencies else 0.0,
+            "latency_p50_us": _percentile(latencies, 50) * 1e6,
+            "latency_p99_us": _percentile(latencies, 99) * 1e6,
+            "mem_util_std": float(np.mean(mem_util_std)) if mem_util_std else 0.0,
+            "mem_util_max": float(np.mean(mem_util_max)) if mem_util_max else 0.0,
+            "load_std": float(np.mean(load_std)) if load_std else 0.0,
+            "hosts_used": len(sessions_per_host),
+            "max_sessions_per_host": max(sessions_per_host.values(), default=0),
+            "overcommits": overcommits,
+            "runtime_s": time.perf_counter() - started,
+        }
+
+
+def benchmark(snapshots, requests, policies=None, seed=0, max_wait=1800):
+    """Run every policy in ``policies`` (default: all registered) on the same replay."""
+    simulation = Simulation(snapshots, requests, max_wait=max_wait)
+    return {name: simulation.run(POLICIES[name](seed)) for name in (policies or POLICIES)}
+
+
+def format_report(reports):
+    columns = (
+        ("policy", "{}"), ("placed", "{}"), ("failed", "{}"), ("failure_rate", "{:.1%}"),
+        ("wait_mean_s", "{:.0f}"), ("wait_p95_s", "{:.0f}"), ("latency_p50_us", "{:.0f}"),
+        ("latency_p99_us", "{:.0f}"), ("mem_util_std", "{:.3f}"), ("mem_util_max", "{:.2f}"),
+        ("load_std", "{:.3f}"), ("hosts_used", "{}"), ("max_sessions_per_host", "{}"), ("overcommits", "{}"),
+        ("runtime_s", "{:.2f}"),
+    )
+    table = [[name for name, _ in columns]]
+    for name, report in reports.items():
+        table.append([fmt.format(name if key == "policy" else report[key]) for key, fmt in columns])
+    widths = [max(len(row[i]) for row in table) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark node placement policies by replaying cluster snapshots.")
+    parser.add_argument("--history", type=str, default=None,
+                        help=f"Replay snapshots from a cluster history file (e.g. {CLUSTER_HISTORY_FILE})")
+    parser.add_argument("--hosts", type=int, default=1000, help="Hosts in the synthetic cluster")
+    parser.add_argument("--steps", type=int, default=48, help="Synthetic snapshots to generate")
+    parser.add_argument("--interval", type=float, default=300, help="Seconds between synthetic snapshots")
+    parser.add_argument("--requests", type=int, default=5000, help="Notebook requests to simulate")
+    parser.add_argument("--median_gb", type=float, default=16, help="Median RAM per request (GB)")
+    parser.add_argument("--gpu_share", type=float, default=0.05, help="Share of requests that need a GPU")
+    parser.add_argument("--mean_duration", type=float, default=3600, help="Mean session length (s)")
+    parser.add_argument("--max_wait", type=float, default=1800, help="Seconds a request may wait for a node")
+    parser.add_argument("--policies", type=str, default=",".join(POLICIES), help="Comma-separated policies")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    if args.history:
+        snapshots = list(ClusterHistory(args.history).snapshots())
+        if len(snapshots) < 2:
+            raise SystemExit(f"{args.history} holds {len(snapshots)} snapshot(s); at least 2 are needed to replay.")
+    else:
+        snapshots = list(synthetic_snapshots(args.hosts, args.steps, args.interval, args.seed))
+    start, end = snapshots[0][0], snapshots[-1][0]
+    requests = synthetic_requests(args.requests, start, end, args.seed, args.median_gb, args.gpu_share,
+                                  args.mean_duration)
+    print(f"Replaying {len(snapshots)} snapshots of up to {max(len(t) for _, t in snapshots)} hosts "
+          f"with {len(requests)} requests")
+    print(format_report(benchmark(snapshots, requests, args.policies.split(","), args.seed, args.max_wait)))
@@ -0,0 +1,401 @@
+import queue
+import selectors
+import socket
+import threading
+import time
+
+
+class ForwardedConnection:
+    """One accepted local connection relayed over a direct-tcpip channel."""
+    __slots__ = ("client_sock", "channel", "peer", "destination", "opened", "bytes_in", "bytes_out",
+                 "to_client", "to_channel", "client_eof", "channel_eof", "client_shut", "channel_shut")
+
+    def __init__(self, client_sock, channel, peer, destination=None):
+        self.client_sock = client_sock
+        self.channel = channel
+        self.peer = peer
+        self.destination = destination  # (host, port) the channel was opened to, if not the forward's target
+        self.opened = time.time()
+        self.bytes_in = 0  # Remote -> local
+        self.bytes_out = 0  # Local -> remote
+        self.to_client = bytearray()  # Read from the channel, not yet accepted by the client socket
+        self.to_channel = bytearray()  # Read from the client, not yet accepted by the channel window
+        # Each side's EOF is passed on (shutdown of the other side's write half) once
+        # its buffer is written; the other direction keeps relaying until it ends too
+        self.client_eof = False
+        self.channel_eof = False
+        self.client_shut = False  # The client socket's write half was shut down
+        self.channel_shut = False  # EOF was sent on the channel
+
+    def as_dict(self):
+        return {
+            "peer": f"{self.peer[0]}:{self.peer[1]}",
+            "destination": f"{self.destination[0]}:{self.destination[1]}" if self.destination else None,
+            "opened": self.opened,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+class LocalPortForwarder:
+    """In-process equivalent of ``ssh -L local_port:remote_host:remote_port``.
+
+    Listens on a local port and relays every accepted connection over a
+    ``direct-tcpip`` channel on an already-authenticated paramiko transport. A
+    single selector thread moves the bytes for all connections; opening the
+    channel (one round trip to the gateway) happens on a short-lived thread so a
+    slow open never stalls traffic on the other connections. Both ends are
+    non-blocking: bytes a sink does not take yet wait in a per-direction
+    buffer, and the source is not read again until that buffer has drained,
+    so a client that stops reading (or a channel with a full window) only
+    holds up its own connection.
+    """
+
+    stop_with_transport = True  # Stop relaying once the transport dies (subclasses may reconnect instead)
+
+    def __init__(self, transport, remote_host, remote_port, local_port=0, local_host="127.0.0.1",
+                 open_timeout=10, buffer_size=65536):
+        self.transport = transport
+        self.remote_host = remote_host
+        self.remote_port = int(remote_port)
+        self.local_host = local_host
+        self.local_port = int(local_port)
+        self.open_timeout = open_timeout
+        self.buffer_size = buffer_size
+        self.ready = threading.Event()  # Set as soon as the local socket is listening
+        self.error = None
+        self.total_connections = 0
+        self.failed_connections = 0
+        self.closed_bytes_in = 0
+        self.closed_bytes_out = 0
+        self._connections = {}
+        self._backlogged = set()  # Connections with bytes waiting for channel window
+        self._pending = queue.Queue()
+        self._stopping = threading.Event()
+        self._listener = None
+        self._thread = None
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+
+    @property
+    def target(self):
+        return f"{self.remote_host}:{self.remote_port}"
+
+    def start(self, listen_socket=None):
+        """Start listening (or adopt an already-bound socket) and begin relaying."""
+        if listen_socket is None:
+            listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listen_socket.bind((self.local_host, self.local_port))
+        listen_socket.listen(64)
+        listen_socket.setblocking(False)
+        self._listener = listen_socket
+        self.local_port = listen_socket.getsockname()[1]
+
+        self._thread = threading.Thread(target=self._run, name=f"forward-{self.local_port}")
+        self._thread.daemon = True
+        self._thread.start()
+        self.ready.set()
+        return self
+
+    def stop(self, timeout=2):
+        """Stop accepting, close every relayed connection and wait for the loop to exit."""
+        self._stopping.set()
+        self._wake()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopping.is_set()
+
+    def stats(self):
+        """Return traffic counters for the forward and each open connection."""
+        connections = [conn.as_dict() for conn in list(self._connections.values())]
+        return {
+            "local_port": self.local_port,
+            "target": self.target,
+            "active_connections": len(connections),
+            "total_connections": self.total_connections,
+            "failed_connections": self.failed_connections,
+            "bytes_in": self.closed_bytes_in + sum(c["bytes_in"] for c in connections),
+            "bytes_out": self.closed_bytes_out + sum(c["bytes_out"] for c in connections),
+            "connections": connections,
+        }
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _open_channel(self, client_sock, peer):
+        try:
+            channel = self.transport.open_channel(
+                "direct-tcpip", (self.remote_host, self.remote_port), peer, timeout=self.open_timeout
+            )
+        except Exception as e:
+            print(f"Forward {self.local_port} -> {self.target}: channel open failed: {e}")
+            self.failed_connections += 1
+            client_sock.close()
+            return
+        self._queue_connection(ForwardedConnection(client_sock, channel, peer))
+
+    def _queue_connection(self, conn):
+        """Hand an opened connection to the relay loop, or close it if the forward has stopped."""
+        self._pending.put(conn)
+        if self._stopping.is_set():
+            # The loop may already have drained _pending for the last time
+            self._discard_pending()
+        else:
+            self._wake()
+
+    def _discard_pending(self):
+        while True:
+            try:
+                conn = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            conn.client_sock.close()
+            conn.channel.close()
+
+    def _close_connection(self, selector, conn):
+        for endpoint in (conn.client_sock, conn.channel):
+            try:
+                selector.unregister(endpoint)
+            except (KeyError, ValueError):
+                pass
+            try:
+                endpoint.close()
+            except Exception:
+                pass
+        self._backlogged.discard(conn)
+        if self._connections.pop(id(conn), None) is not None:
+            self.closed_bytes_in += conn.bytes_in
+            self.closed_bytes_out += conn.bytes_out
+
+    def _drop(self, selector, conn, e):
+        print(f"Forward {self.local_port} -> {self.target}: connection from {conn.peer} dropped: {e}")
+        self._close_connection(selector, conn)
+
+    def _watch(self, selector, endpoint, events, conn, from_channel):
+        """Set the events the selector waits for on one endpoint (none unregisters it)."""
+        try:
+            registered = selector.get_key(endpoint).events
+        except KeyError:
+            registered = 0
+        if events == registered:
+            return
+        if not events:
+            selector.unregister(endpoint)
+        elif registered:
+            selector.modify(endpoint, events, (conn, from_channel))
+        else:
+            selector.register(endpoint, events, (conn, from_channel))
+
+    def _update_interest(self, selector, conn):
+        """Read a source only while its sink has taken everything; wait for the client to become writable.
+
+        Channels have no write readiness to select on, so connections with
+        bytes waiting for channel window are kept in ``_backlogged`` and
+        retried on every loop iteration.
+        """
+        client_events = 0 if conn.client_eof or conn.to_channel else selectors.EVENT_READ
+        if conn.to_client:
+            client_events |= selectors.EVENT_WRITE
+        channel_events = 0 if conn.channel_eof or conn.to_client else selectors.EVENT_READ
+        self._watch(selector, conn.client_sock, client_events, conn, False)
+        self._watch(selector, conn.channel, channel_events, conn, True)
+        if conn.to_channel:
+            self._backlogged.add(conn)
+        else:
+            self._backlogged.discard(conn)
+
+    def _flush(self, selector, conn):
+        """Write as much of both buffers as the sinks take without blocking. Returns False if it closed conn."""
+        try:
+            while conn.to_client:
+                del conn.to_client[:conn.client_sock.send(conn.to_client)]
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            self._drop(selector, conn, e)
+            return False
+        try:
+            while conn.to_channel and conn.channel.send_ready():
+                del conn.to_channel[:conn.channel.send(bytes(conn.to_channel[:self.buffer_size]))]
+        except socket.timeout:
+            pass
+        except (OSError, EOFError) as e:
+            self._drop(selector, conn, e)
+            return False
+        try:
+            if conn.client_eof and not conn.to_channel and not conn.channel_shut:
+                conn.channel.shutdown_write()
+                conn.channel_shut = True
+            if conn.channel_eof and not conn.to_client and not conn.client_shut:
+                conn.client_sock.shutdown(socket.SHUT_WR)
+                conn.client_shut = True
+        except OSError as e:
+            self._drop(selector, conn, e)
+            return False
+        # A channel the remote closed outright takes no more data, so don't wait for the client's EOF
+        if conn.client_shut and (conn.channel_shut or conn.channel.closed) and not conn.to_channel:
+            self._close_connection(selector, conn)
+            return False
+        self._update_interest(selector, conn)
+        return True
+
+    def _relay(self, selector, conn, from_channel):
+        source = conn.channel if from_channel else conn.client_sock
+        try:
+            data = source.recv(self.buffer_size)
+        except (BlockingIOError, socket.timeout):
+            return
+        except (OSError, EOFError) as e:
+            self._drop(selector, conn, e)
+            return
+        if not data:
+            if from_channel:
+                conn.channel_eof = True
+            else:
+                conn.client_eof = True
+        elif from_channel:
+            conn.bytes_in += len(data)
+            conn.to_client += data
+        else:
+            conn.bytes_out += len(data)
+            conn.to_channel += data
+        self._flush(selector, conn)
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._listener, selectors.EVENT_READ, "accept")
+        selector.register(self._wake_r, selectors.EVENT_READ, "wake")
+        try:
+            while not self._stopping.is_set():
+                if self.stop_with_transport and not self.transport.is_active():
+                    self.error = "SSH transport closed"
+                    print(f"Forward {self.local_port} -> {self.target}: transport closed, stopping")
+                    break
+                for key, events in selector.select(timeout=0.05 if self._backlogged else 1):
+                    if key.data == "accept":
+                        try:
+                            client_sock, peer = self._listener.accept()
+                        except BlockingIOError:
+                            continue
+                        client_sock.setblocking(True)
+                        self.total_connections += 1
+                        opener = threading.Thread(target=self._open_channel, args=(client_sock, peer))
+                        opener.daemon = True
+                        opener.start()
+                    elif key.data == "wake":
+                        try:
+                            self._wake_r.recv(4096)
+                        except BlockingIOError:
+                            pass
+                        while not self._pending.empty():
+                            conn = self._pending.get_nowait()
+                            conn.client_sock.setblocking(False)
+                            conn.channel.setblocking(False)
+                            self._connections[id(conn)] = conn
+                            self._update_interest(selector, conn)
+                    else:
+                        conn, from_channel = key.data
+                        if id(conn) in self._connections and events & selectors.EVENT_WRITE:
+                            self._flush(selector, conn)
+                        if id(conn) in self._connections and events & selectors.EVENT_READ:
+                            self._relay(selector, conn, from_channel)
+                for conn in list(self._backlogged):
+                    self._flush(selector, conn)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Forward {self.local_port} -> {self.target} failed: {e}")
+        finally:
+            self._stopping.set()  # Before draining, so late openers close their own connections
+            for conn in list(self._connections.values()):
+                self._close_connection(selector, conn)
+            self._discard_pending()
+            selector.close()
+            self._listener.close()
+            self._wake_r.close()
+            self._wake_w.close()
+
+
+class ForwardManager:
+    """Local port forwards added and removed at runtime, all over one SSH transport.
+
+    Each forward is a LocalPortForwarder on a port from ``registry`` (a
+    PortRegistry) that opens its ``direct-tcpip`` channels on the transport
+    returned by ``get_transport``, so ten forwards to TensorBoard, Dask or
+    RStudio on the node share one authenticated gateway connection instead
+    of ten ``ssh -L`` processes and handshakes. ``revive`` rebuilds the
+    forwards whose transport died, on the same local ports.
+    """
+
+    def __init__(self, get_transport, registry):
+        self.get_transport = get_transport
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._forwards = {}  # local port -> (label, LocalPortForwarder)
+
+    def add(self, remote_host, remote_port, local_port=None, label=None):
+        """Start forwarding a local port (``local_port`` if free, else any) to ``remote_host:remote_port``."""
+        label = label or f"{remote_host}:{remote_port}"
+        lease = self.registry.allocate(local_port, owner=label)
+        try:
+            forwarder = LocalPortForwarder(self.get_transport(), remote_host, remote_port, local_port=lease.port)
+            forwarder.start(lease.detach())
+        except Exception:
+            self.registry.release(lease.port)
+            raise
+        with self._lock:
+            self._forwards[forwarder.local_port] = (label, forwarder)
+        return forwarder
+
+    def remove(self, local_port):
+        """Stop a forward and release its port. Returns whether it existed."""
+        with self._lock:
+            entry = self._forwards.pop(local_port, None)
+        if entry is None:
+            return False
+        entry[1].stop()
+        self.registry.release(local_port)
+        return True
+
+    def revive(self):
+        """Rebuild every forward that stopped (e.g. because its transport died). Returns how many."""
+        with self._lock:
+            dead = [(port, label, forwarder) for port, (label, forwarder) in self._forwards.items()
+                    if not forwarder.is_alive() or not forwarder.transport.is_active()]
+        revived = 0
+        for port, label, forwarder in dead:
+            forwarder.stop(timeout=1)
+            try:
+                replacement = LocalPortForwarder(self.get_transport(), forwarder.remote_host, forwarder.remote_port,
+                                                 local_port=port).start()
+            except Exception as e:
+                print(f"Could not revive forward {port} -> {forwarder.target}: {e}")
+                continue
+            with self._lock:
+                if port in self._forwards:
+                    self._forwards[port] = (label, replacement)
+                    revived += 1
+                    continue
+            replacement.stop()
+        return revived
+
+    def stats(self):
+        """Traffic counters of every forward, ordered by local port."""
+        with self._lock:
+            forwards = sorted(self._forwards.items())
+        return [
+            dict(forwarder.stats(), label=label, alive=forwarder.is_alive(), error=forwarder.error)
+            for _, (label, forwarder) in forwards
+        ]
+
+    def stop_all(self):
+        with self._lock:
+            ports = list(self._forwards)
+        for port in ports:
+            self.remove(port)
+        return len(ports)
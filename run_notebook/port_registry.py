@@ -0,0 +1,280 @@
+import json
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+import psutil
+
+PORT_REGISTRY_FILE = Path("jupyter_ports.json")
+
+BROWSER_PROCESSES = ("chrome", "firefox", "edge", "safari", "msedge", "chromium")
+
+
+def _process_started(pid):
+    """Start time of a running process, or None if it is gone or not visible."""
+    try:
+        return psutil.Process(pid).create_time()
+    except (psutil.NoSuchProcess, psutil.AccessDenied, ValueError):
+        return None
+
+
+def terminate_processes(pids, timeout=3):
+    """Terminate processes concurrently and wait once, for at most ``timeout`` seconds.
+
+    Whatever is still alive after the wait is killed. Returns ``(stopped,
+    failed)``: ``(pid, name)`` of each process that exited and ``(pid,
+    reason)`` of each that could not be stopped.
+    """
+    processes, failed = [], []
+    for pid in set(pids):
+        try:
+            process = psutil.Process(pid)
+            process.info = {"name": process.name()}
+            process.terminate()
+            processes.append(process)
+        except psutil.NoSuchProcess:
+            continue
+        except psutil.AccessDenied:
+            failed.append((pid, "access denied"))
+    gone, alive = psutil.wait_procs(processes, timeout=timeout)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.NoSuchProcess:
+            pass
+    killed, still_alive = psutil.wait_procs(alive, timeout=0.5) if alive else ([], [])
+    stopped = [(process.pid, process.info["name"]) for process in gone + killed]
+    failed += [(process.pid, "still running after kill") for process in still_alive]
+    return stopped, failed
+
+
+class PortIndex:
+    """Which processes hold which local ports, from a single snapshot of the connection table.
+
+    ``snapshot`` reads the system connection table once (or, where that
+    needs privileges, every process's connections in one pass) and indexes
+    it by local port, so each ``connections``/``usage`` lookup is a dict
+    access. Build one per operation; it does not follow later changes.
+    """
+
+    def __init__(self, connections=()):
+        self._by_port = {}  # port -> [(pid, status)]
+        self._names = {}
+        for port, pid, status in connections:
+            self._by_port.setdefault(port, []).append((pid, status))
+
+    @classmethod
+    def snapshot(cls):
+        try:
+            return cls((conn.laddr.port, conn.pid, conn.status)
+                       for conn in psutil.net_connections(kind="inet") if conn.laddr)
+        except psutil.AccessDenied:
+            pass
+        connections = []
+        for process in psutil.process_iter(["pid"]):
+            try:
+                connections.extend((conn.laddr.port, process.pid, conn.status)
+                                   for conn in process.net_connections(kind="inet") if conn.laddr)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return cls(connections)
+
+    def connections(self, port):
+        """``(pid, status)`` of every socket bound to ``port``; pid is None when it is not visible."""
+        return self._by_port.get(port, [])
+
+    def in_use(self, port):
+        return any(status in (psutil.CONN_LISTEN, psutil.CONN_ESTABLISHED) for _, status in self.connections(port))
+
+    def pids(self, port):
+        return {pid for pid, _ in self.connections(port) if pid}
+
+    def process_name(self, pid):
+        if pid not in self._names:
+            try:
+                self._names[pid] = psutil.Process(pid).name()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                self._names[pid] = "unknown"
+        return self._names[pid]
+
+    def usage(self, port):
+        """What holds ``port``: ``{"is_free", "browser_connection", "process_name", "connection_type", "pid"}``."""
+        result = {
+            "is_free": not self.in_use(port),
+            "browser_connection": False,
+            "process_name": "unknown",
+            "connection_type": "none",
+            "pid": None,
+        }
+        if result["is_free"]:
+            return result
+        # Prefer a socket whose owner is visible, and the listener over client connections
+        pid, status = min(self.connections(port), key=lambda c: (c[0] is None, c[1] != psutil.CONN_LISTEN))
+        result["connection_type"] = status
+        if pid is None:
+            result["browser_connection"] = status == psutil.CONN_ESTABLISHED  # Likely a browser tab
+            return result
+        name = self.process_name(pid)
+        result["pid"] = pid
+        result["process_name"] = name
+        if any(browser in name.lower() for browser in BROWSER_PROCESSES):
+            result["browser_connection"] = True
+        elif status == psutil.CONN_ESTABLISHED and name in ("jupyter-notebook", "jupyter", "python"):
+            # This might be a browser connection to Jupyter
+            result["browser_connection"] = True
+        return result
+
+
+class PortLease:
+    """A local port reserved by this app, and the listening socket that holds it."""
+    __slots__ = ("port", "host", "owner", "socket", "created")
+
+    def __init__(self, port, host, owner, sock):
+        self.port = port
+        self.host = host
+        self.owner = owner
+        self.socket = sock
+        self.created = time.time()
+
+    def detach(self):
+        """Hand the listening socket over (e.g. to ``LocalPortForwarder.start``); the port stays registered."""
+        sock, self.socket = self.socket, None
+        return sock
+
+    def __repr__(self):
+        return f"PortLease({self.host}:{self.port}, owner={self.owner!r})"
+
+
+class PortRegistry:
+    """Local ports this app has allocated, and the processes it started on them.
+
+    ``allocate`` binds the preferred port if nothing holds it, otherwise a
+    port from ``port_range`` or, without a range, port 0 so the kernel picks
+    a free one. The socket is left listening in the lease until the forwarder
+    adopts it, so nothing else can take the port in between, and no process
+    or connection tables are scanned. Every port is recorded with the pid
+    that owns it (this process for in-process forwarders, or a child such as
+    an ``ssh -L`` registered with ``register_process``) and that pid's start
+    time, in a JSON file. ``cleanup`` only ever stops processes recorded
+    there, and entries whose process has exited are dropped on load.
+    """
+
+    def __init__(self, path=PORT_REGISTRY_FILE, host="127.0.0.1", port_range=None):
+        self.path = Path(path)
+        self.host = host
+        self.port_range = port_range
+        self._lock = threading.Lock()
+        self._entries = None  # str(port) -> {"port", "owner", "pid", "pid_started", "created"}
+        self._leases = {}  # port -> PortLease whose socket this process still holds
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                entries = {}
+            # A recorded pid that has exited (or was reused by another program) owns nothing anymore
+            self._entries = {
+                key: entry for key, entry in entries.items()
+                if entry.get("pid_started") is not None and _process_started(entry["pid"]) == entry["pid_started"]
+            }
+            if len(self._entries) != len(entries):
+                self._save()
+        return self._entries
+
+    def _save(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save port registry: {e}")
+
+    def _record(self, port, owner, pid):
+        self._load()[str(port)] = {
+            "port": port,
+            "owner": owner,
+            "pid": pid,
+            "pid_started": _process_started(pid),
+            "created": time.time(),
+        }
+        self._save()
+
+    def _listen(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Our own connections in TIME_WAIT must not block the port; another listener still does
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((self.host, port))
+            sock.listen(64)
+        except OSError:
+            sock.close()
+            return None
+        return sock
+
+    def allocate(self, preferred=None, owner="jupyter"):
+        """Reserve a local port, the preferred one if it is free. Raises an Exception if none is."""
+        candidates = [preferred] if preferred else []
+        candidates += list(self.port_range) if self.port_range else [0]
+        with self._lock:
+            for port in candidates:
+                if port in self._leases:
+                    continue
+                sock = self._listen(port)
+                if sock is not None:
+                    lease = PortLease(sock.getsockname()[1], self.host, owner, sock)
+                    self._leases[lease.port] = lease
+                    self._record(lease.port, owner, os.getpid())
+                    return lease
+        span = f"{self.port_range[0]}-{self.port_range[-1]}" if self.port_range else "any port"
+        raise Exception(f"No free local port (tried {preferred or 'none'} and {span})")
+
+    def register_process(self, port, pid, owner="tunnel"):
+        """Record a process this app started that listens on ``port`` (e.g. ``ssh -L``)."""
+        with self._lock:
+            lease = self._leases.pop(port, None)
+            if lease is not None and lease.socket is not None:
+                lease.socket.close()
+            self._record(port, owner, pid)
+
+    def release(self, port):
+        """Forget a port, closing its socket if it was never handed over."""
+        with self._lock:
+            lease = self._leases.pop(port, None)
+            if lease is not None and lease.socket is not None:
+                lease.socket.close()
+            if self._load().pop(str(port), None) is not None:
+                self._save()
+
+    def owns(self, port):
+        with self._lock:
+            return str(port) in self._load()
+
+    def owned(self):
+        """Registry entries, oldest first."""
+        with self._lock:
+            return sorted(self._load().values(), key=lambda entry: entry["created"])
+
+    def cleanup(self, timeout=3):
+        """Release every port this app owns and stop the processes it started on them.
+
+        The processes are terminated together with one wait of at most
+        ``timeout`` seconds. Returns a description of each stopped process;
+        nothing outside the registry is touched.
+        """
+        entries = self.owned()
+        ports = {}
+        for entry in entries:
+            pid = entry["pid"]
+            if pid != os.getpid() and _process_started(pid) == entry["pid_started"]:
+                ports.setdefault(pid, []).append(entry["port"])
+        stopped, failed = terminate_processes(ports, timeout) if ports else ([], [])
+        for pid, reason in failed:
+            print(f"Could not stop PID {pid} on port(s) {ports[pid]}: {reason}")
+        for entry in entries:
+            self.release(entry["port"])
+        return [f"port {', '.join(map(str, ports[pid]))}: PID {pid} ({name})" for pid, name in stopped]
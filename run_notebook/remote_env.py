@@ -0,0 +1,216 @@
+import json
+import os
+import shlex
+import threading
+import time
+from pathlib import Path
+
+# Lines the bootstrap script prints start with this tag. The script assembles it
+# from two halves so the command text echoed back by a PTY never matches.
+BOOT_TAG = "__BOOT__"
+
+ENV_CACHE_FILE = Path("jupyter_env_cache.json")
+
+# Steps whose failure aborts the launch (sourcing ~/.bashrc only warns, as before)
+REQUIRED_STEPS = ("activate", "cd")
+
+
+def build_bootstrap_script(env_name, dest_folder):
+    """Build one compound shell command that prepares the node for Jupyter.
+
+    It sources ``~/.bashrc``, activates the conda environment and changes into
+    ``dest_folder``, timing each step, then reports the resolved environment
+    prefix, python and jupyter paths and the absolute working directory. Every
+    line of interest is printed as ``__BOOT__|kind|name|...`` so the whole
+    sequence costs a single round trip.
+    """
+    parts = [
+        f'__bt="{BOOT_TAG[:4]}""{BOOT_TAG[4:]}"',
+        '__blog=$(mktemp 2>/dev/null || echo "/tmp/.jupyter_boot_$$")',
+        '__bms() { echo $(( $(date +%s%N) / 1000000 )); }',
+        '__bstep() { local __n=$1 __t0=$(__bms) __rc; shift; "$@" >/dev/null 2>"$__blog"; __rc=$?; '
+        'printf \'%s|step|%s|%s|%s|%s\\n\' "$__bt" "$__n" "$__rc" $(( $(__bms) - __t0 )) '
+        '"$(head -c 300 "$__blog" | tr \'\\n|\' \'  \')"; return $__rc; }',
+        "__bstep source source ~/.bashrc",
+    ]
+    chain = []
+    if env_name:
+        chain.append(f"__bstep activate conda activate {shlex.quote(env_name)}")
+    chain.append(f"__bstep cd cd {dest_folder}")
+    report = "; ".join(
+        f'printf \'%s|path|{name}|%s\\n\' "$__bt" "{value}"'
+        for name, value in (
+            ("prefix", "${CONDA_PREFIX:-}"),
+            ("python", "$(command -v python)"),
+            ("jupyter", "$(command -v jupyter)"),
+            ("workdir", "$(pwd -P)"),
+        )
+    )
+    chain.append("{ " + report + "; }")
+    parts.append(" && ".join(chain))
+    parts.append('rm -f "$__blog"; unset -f __bms __bstep')
+    return "; ".join(parts)
+
+
+def parse_bootstrap_output(output):
+    """Parse the ``__BOOT__`` lines printed by the bootstrap script."""
+    result = {
+        "ok": False,
+        "steps": [],
+        "failed_step": None,
+        "env_prefix": "",
+        "python": "",
+        "jupyter": "",
+        "workdir": "",
+    }
+    paths = {"prefix": "env_prefix", "python": "python", "jupyter": "jupyter", "workdir": "workdir"}
+
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith(BOOT_TAG + "|"):
+            continue
+        fields = line.split("|")
+        if fields[1] == "step" and len(fields) >= 5 and fields[3].isdigit():
+            result["steps"].append({
+                "name": fields[2],
+                "status": int(fields[3]),
+                "duration_ms": int(fields[4]) if fields[4].lstrip("-").isdigit() else None,
+                "error": "|".join(fields[5:]).strip(),
+            })
+        elif fields[1] == "path" and len(fields) >= 4 and fields[2] in paths:
+            result[paths[fields[2]]] = "|".join(fields[3:]).strip()
+
+    for step in result["steps"]:
+        if step["name"] in REQUIRED_STEPS and step["status"] != 0:
+            result["failed_step"] = step["name"]
+            return result
+    if not result["workdir"]:
+        result["failed_step"] = "report"
+    elif not result["jupyter"]:
+        result["failed_step"] = "jupyter"
+    else:
+        result["ok"] = True
+    return result
+
+
+def bootstrap_environment(runner, env_name, dest_folder, timeout=120):
+    """Run the bootstrap script through a runner in one round trip and parse the result."""
+    script = build_bootstrap_script(env_name, dest_folder)
+    step = runner.run(script, timeout=timeout, interactive=True)
+    result = parse_bootstrap_output(step.output)
+    result["duration"] = step.duration
+    if not result["steps"]:
+        result["failed_step"] = "bootstrap"
+        result["error"] = step.error or step.output[-500:]
+    return result
+
+
+def activation_prelude(result, env_name):
+    """Commands that recreate the bootstrapped environment without ~/.bashrc or conda.
+
+    Used to start later exec channels directly in the resolved environment.
+    """
+    prelude = []
+    prefix = result.get("env_prefix")
+    if prefix:
+        quoted = shlex.quote(prefix)
+        prelude.append(
+            f"export CONDA_PREFIX={quoted} CONDA_DEFAULT_ENV={shlex.quote(env_name or 'base')} "
+            f"PATH={quoted}/bin:$PATH"
+        )
+    prelude.append(f"cd {shlex.quote(result['workdir'])}")
+    return prelude
+
+
+class EnvironmentCache:
+    """Persistent cache of resolved environment paths per (gateway, node, env_name).
+
+    Entries hold the conda prefix, python and jupyter paths and the absolute
+    directory each ``dest_folder`` resolved to. They expire after ``ttl``
+    seconds and are re-validated on the node before use, so a relaunch can
+    start Jupyter by absolute path without sourcing ``~/.bashrc`` or running
+    ``conda activate``.
+    """
+
+    def __init__(self, path=ENV_CACHE_FILE, ttl=7 * 24 * 3600):
+        self.path = Path(path)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = None
+
+    @staticmethod
+    def key(gateway, node, env_name):
+        return f"{gateway}|{node}|{env_name or ''}"
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self._entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save environment cache: {e}")
+
+    def get(self, gateway, node, env_name, dest_folder):
+        """Return a bootstrap-shaped result for a fresh cache hit, or None."""
+        with self._lock:
+            entry = self._load().get(self.key(gateway, node, env_name))
+        if not entry or time.time() - entry.get("saved_at", 0) > self.ttl:
+            return None
+        workdir = entry.get("workdirs", {}).get(dest_folder)
+        if not workdir or not entry.get("jupyter"):
+            return None
+        return {
+            "ok": True,
+            "cached": True,
+            "steps": [],
+            "failed_step": None,
+            "env_prefix": entry.get("env_prefix", ""),
+            "python": entry.get("python", ""),
+            "jupyter": entry["jupyter"],
+            "workdir": workdir,
+            "saved_at": entry["saved_at"],
+        }
+
+    def put(self, gateway, node, env_name, dest_folder, result):
+        """Store the paths from a successful bootstrap result."""
+        key = self.key(gateway, node, env_name)
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if not entry or entry.get("env_prefix") != result["env_prefix"]:
+                entry = {"workdirs": {}}
+            entry.update({
+                "env_prefix": result["env_prefix"],
+                "python": result["python"],
+                "jupyter": result["jupyter"],
+                "saved_at": time.time(),
+            })
+            entry["workdirs"][dest_folder] = result["workdir"]
+            entries[key] = entry
+            self._save()
+
+    def invalidate(self, gateway, node, env_name):
+        with self._lock:
+            if self._load().pop(self.key(gateway, node, env_name), None) is not None:
+                self._save()
+
+
+def validate_cached_environment(runner, cached, env_name, timeout=15):
+    """Check that a cached environment still exists and enter it.
+
+    Runs the activation exports, the ``cd`` and a ``test -x`` on the jupyter
+    binary as one command. On an interactive shell this also leaves the shell
+    in the environment; for an ExecRunner the caller sets the prelude.
+    """
+    command = " && ".join(activation_prelude(cached, env_name) + [f"test -x {shlex.quote(cached['jupyter'])}"])
+    return runner.run(command, timeout=timeout).ok
@@ -0,0 +1,184 @@
+import codecs
+import re
+import shlex
+import socket
+import time
+import uuid
+
+
+class ShellStepError(Exception):
+    """Raised when a shell step fails or the channel closes underneath it."""
+
+
+class ShellStepTimeout(ShellStepError):
+    """Raised when a shell step does not finish within its timeout."""
+
+
+class StepResult:
+    """Outcome of a single shell step."""
+    __slots__ = ("command", "exit_code", "output", "duration", "error")
+
+    def __init__(self, command, exit_code, output, duration, error=""):
+        self.command = command
+        self.exit_code = exit_code
+        self.output = output
+        self.duration = duration
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+    def __repr__(self):
+        return f"StepResult({self.command!r}, exit_code={self.exit_code}, duration={self.duration:.3f})"
+
+
+class ShellStepEngine:
+    """Expect-style driver for an interactive paramiko shell.
+
+    Every command is followed by an ``echo`` of a unique end marker that carries
+    ``$?``, so a step returns as soon as the marker comes back instead of after a
+    fixed sleep. The marker is sent as its own line, which means it is typed into
+    whatever shell is in the foreground once the command finishes - for a nested
+    ``ssh`` that is the shell on the remote node.
+    """
+
+    def __init__(self, shell, poll_interval=0.2):
+        self.shell = shell
+        self.poll_interval = poll_interval
+        self.buffer = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def _read_chunk(self, deadline):
+        """Read whatever is available before the deadline into the buffer."""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        self.shell.settimeout(min(remaining, self.poll_interval))
+        try:
+            chunk = self.shell.recv(4096)
+        except socket.timeout:
+            return False
+        if not chunk:
+            raise ShellStepError("Shell channel closed")
+        self.buffer += self._decoder.decode(chunk)
+        return True
+
+    def drain(self):
+        """Discard any output that is already buffered (banners, prompts)."""
+        while self.shell.recv_ready():
+            self.buffer += self._decoder.decode(self.shell.recv(4096))
+        self.buffer = ""
+
+    def start(self, command):
+        """Send a long-running command (e.g. a server) and return self for ``expect``."""
+        self.shell.send(command + "\n")
+        return self
+
+    def run(self, command, timeout=30, persist=False, interactive=False):
+        """Send a command and wait for its end marker. Returns a StepResult.
+
+        ``persist`` and ``interactive`` are accepted for parity with ExecRunner;
+        this shell is interactive and keeps its state between commands anyway.
+        """
+        token = uuid.uuid4().hex[:12]
+        marker = re.compile(rf"__STEP_{token}__:(\d+)")
+        started = time.monotonic()
+        deadline = started + timeout
+
+        self.shell.send(command + "\n")
+        # The marker line is echoed back by the PTY with a literal "$?", so only
+        # the expanded exit code can match the pattern.
+        self.shell.send(f"echo __STEP_{token}__:$?\n")
+
+        scan_from = 0
+        while True:
+            match = marker.search(self.buffer, scan_from)
+            if match:
+                break
+            scan_from = max(0, self.buffer.rfind("\n") + 1)
+            if time.monotonic() >= deadline:
+                raise ShellStepTimeout(f"Step timed out after {timeout}s: {command}. Output: {self.buffer[-500:]}")
+            self._read_chunk(deadline)
+
+        raw_output = self.buffer[:match.start()]
+        line_end = self.buffer.find("\n", match.end())
+        self.buffer = self.buffer[line_end + 1:] if line_end != -1 else self.buffer[match.end():]
+
+        lines = [line for line in raw_output.splitlines() if token not in line]
+        output = "\n".join(lines).strip()
+        return StepResult(command, int(match.group(1)), output, time.monotonic() - started)
+
+    def expect(self, pattern, timeout=60, flags=0):
+        """Wait until ``pattern`` appears in the shell output and return the match.
+
+        Only the unread tail of the buffer is rescanned on each chunk, starting
+        at the last incomplete line, so long outputs are not searched repeatedly.
+        """
+        regex = re.compile(pattern, flags) if isinstance(pattern, str) else pattern
+        deadline = time.monotonic() + timeout
+        scan_from = 0
+        while True:
+            match = regex.search(self.buffer, scan_from)
+            if match:
+                self.buffer = self.buffer[match.end():]
+                return match
+            scan_from = max(0, self.buffer.rfind("\n") + 1)
+            if time.monotonic() >= deadline:
+                raise ShellStepTimeout(f"Pattern {regex.pattern!r} not seen after {timeout}s. Output: {self.buffer[-500:]}")
+            self._read_chunk(deadline)
+
+
+# Warnings an interactive bash prints when it has no terminal to control
+_NO_TTY_NOISE = ("cannot set terminal process group", "no job control in this shell")
+
+
+class ExecRunner:
+    """Run commands on a host through independent exec channels.
+
+    Unlike the interactive shell every command starts in a fresh shell, so
+    steps that change shell state (``export``, ``cd``) are run with
+    ``persist=True`` or put in ``prelude`` and replayed in front of every later
+    command. Plain commands run under ``bash -c`` and skip ``~/.bashrc``;
+    ``interactive=True`` uses an interactive bash that does not read its rc
+    file by itself, so a script can ``source ~/.bashrc`` explicitly (and get
+    past an interactive-only guard such as the one around ``conda init``).
+    """
+
+    def __init__(self, client, shell="bash -c", interactive_shell="bash --norc -ic"):
+        self.client = client
+        self.shell = shell
+        self.interactive_shell = interactive_shell
+        self.prelude = []
+
+    def wrap(self, command, interactive=False):
+        script = "; ".join(self.prelude + [command])
+        shell = self.interactive_shell if interactive else self.shell
+        return f"{shell} {shlex.quote(script)}"
+
+    def run(self, command, timeout=30, persist=False, interactive=False):
+        """Run a command on its own channel and return a StepResult."""
+        started = time.monotonic()
+        try:
+            stdin, stdout, stderr = self.client.exec_command(self.wrap(command, interactive), timeout=timeout)
+            stdin.close()
+            output = stdout.read().decode("utf-8", errors="replace")
+            error = stderr.read().decode("utf-8", errors="replace")
+            error = "\n".join(line for line in error.splitlines() if not any(n in line for n in _NO_TTY_NOISE))
+            exit_code = stdout.channel.recv_exit_status()
+        except socket.timeout:
+            raise ShellStepTimeout(f"Step timed out after {timeout}s: {command}")
+        if persist and exit_code == 0:
+            self.prelude.append(command)
+        return StepResult(command, exit_code, output.strip(), time.monotonic() - started, error.strip())
+
+    def start(self, command):
+        """Start a long-running command on a PTY channel and return an engine to ``expect`` on.
+
+        The PTY merges stderr into the stream and makes the remote process
+        receive SIGHUP when the channel closes.
+        """
+        channel = self.client.get_transport().open_session()
+        channel.get_pty()
+        channel.exec_command(self.wrap(command))
+        return ShellStepEngine(channel)
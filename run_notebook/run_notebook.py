@@ -8,6 +8,10 @@ import sys
 import threading
 import queue
 import argparse
+from cluster_history import ClusterHistory
+from cluster_table import ClusterTable
+from placement import PlacementRequest, PlacementScheduler
+from port_registry import PortRegistry
 
 # Configuration
 remote_host = "wildtype1.bio.uu.nl"
@@ -15,14 +19,6 @@ gateway_host = "alive.bio.uu.nl"
 username = "bar"
 local_port = 8888
 
-def is_port_free(port):
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        return s.connect_ex(('localhost', port)) != 0
-
-# Find a free local port
-while not is_port_free(local_port):
-    local_port += 1
-
 def enqueue_output(out, queue):
     for line in iter(out.readline, b''):
         queue.put(line.decode('utf-8'))
@@ -43,23 +39,25 @@ def get_command_output(q, timeout=10):
                 break
     return output
 
-def find_best_server(awi_output):
+def find_best_server(awi_output, history=None, request=None, weights=None):
     lines = awi_output.splitlines()
-    best_server = None
-    max_gb_avail = 0.0
+    columns = {"CPU_AVAIL": [], "LOAD": [], "CPU": [], "HOST": [], "CPU_TYPE": [], "GB_AVAIL": [], "HAS_GPU": []}
 
     for line in lines:
-        match = re.search(r'(\d+\.\d+)\s+\d+\.\d+\s+\d+\s+(\w+)\s+\w+-\d+\s+(\d+\.\d+)', line)
+        match = re.search(r'(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+)\s+(\w+)\s+(\w+-\d+)\s+(\d+\.\d+)', line)
         if match:
-            gb_avail = float(match.group(3))
-            server = match.group(2)
-            if gb_avail > max_gb_avail:
-                max_gb_avail = gb_avail
-                best_server = server
-
-    return best_server
-
-def set_up(username="bar", gateway_host="alive.bio.uu.nl", env_name="bio", dest_folder="Projects"):
+            for name, value in zip(columns, match.groups()):
+                columns[name].append(value)
+            columns["HAS_GPU"].append("gpu" in match.group(4).lower())
+
+    # Same placement rules as the web app; with a history, nodes that stayed free rank first
+    table = ClusterTable.from_columns(columns)
+    if history is not None:
+        history.record(table)
+    candidate = PlacementScheduler(weights, history).best(table, request)
+    return candidate["host"] if candidate else None
+
+def set_up(username="bar", gateway_host="alive.bio.uu.nl", env_name="bio", dest_folder="Projects", request=None):
     # Step 1: SSH into the gateway and run the 'awi' command
     ssh_cmd = f'ssh -tt -o StrictHostKeyChecking=no {username}@{gateway_host}'
     process = subprocess.Popen(ssh_cmd, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -78,8 +76,8 @@ def set_up(username="bar", gateway_host="alive.bio.uu.nl", env_name="bio", dest_
     process.stdin.flush()
     awi_output = get_command_output(q, timeout=6)
 
-    # Step 2: Find the best server based on available GB
-    best_server = find_best_server(awi_output)
+    # Step 2: Find the best server for the request (free memory, CPUs, load and their trend)
+    best_server = find_best_server(awi_output, ClusterHistory(), request)
     if not best_server:
         raise Exception("No suitable server found.")
 
@@ -138,15 +136,20 @@ def run_jupyter(process, q, username, gateway_host, best_server):
         remote_port = port_match.group(1)
         token = port_match.group(2)
 
-        # Step 7: Create an SSH tunnel to the Jupyter port
-        tunnel_cmd = f'ssh {username}@{gateway_host} -L {local_port}:{best_server}:{remote_port}'
+        # Step 7: Create an SSH tunnel to the Jupyter port (8888 if free, else one the kernel picks)
+        port_registry = PortRegistry()
+        lease = port_registry.allocate(local_port, owner="cli")
+        tunnel_port = lease.port
+        lease.detach().close()  # ssh binds the port itself
+        tunnel_cmd = f'exec ssh {username}@{gateway_host} -L {tunnel_port}:{best_server}:{remote_port}'
         tunnel_process = subprocess.Popen(tunnel_cmd, shell=True)
+        port_registry.register_process(tunnel_port, tunnel_process.pid, owner="ssh -L")
 
         # Give some time for the tunnel to establish
         time.sleep(5)
 
         # Step 8: Open the Jupyter Notebook in the local browser
-        notebook_url = f"http://localhost:{local_port}/?token={token}"
+        notebook_url = f"http://localhost:{tunnel_port}/?token={token}"
         webbrowser.open(notebook_url)
 
         print(f"Jupyter Notebook should now be accessible at {notebook_url}")
@@ -158,6 +161,8 @@ def run_jupyter(process, q, username, gateway_host, best_server):
             tunnel_process.terminate()
         else:
             raise Exception("Failed to parse Jupyter Notebook port and token.")
+        finally:
+            port_registry.release(tunnel_port)
         
 
 if __name__ == "__main__":
@@ -166,8 +171,13 @@ if __name__ == "__main__":
     parser.add_argument("--gateway_host", type=str, default="alive.bio.uu.nl", help="Gateway host for SSH")
     parser.add_argument("--env_name", type=str, default="bio", help="Conda environment name")
     parser.add_argument("--dest_folder", type=str, default="Projects", help="Destination folder")
+    parser.add_argument("--min_gb", type=float, default=0, help="Minimum free RAM (GB) on the node")
+    parser.add_argument("--min_cpu", type=float, default=0, help="Minimum free CPUs on the node")
+    parser.add_argument("--gpu", action="store_true", help="Only consider nodes with a GPU")
+    parser.add_argument("--cpu_type", type=str, default=None, help="Only consider nodes whose CPU type starts with this")
 
     args = parser.parse_args()
+    request = PlacementRequest(min_gb=args.min_gb, min_cpu=args.min_cpu, gpu=args.gpu, cpu_type=args.cpu_type)
 
-    process, q, best_server = set_up(username=args.username, gateway_host=args.gateway_host, env_name=args.env_name, dest_folder=args.dest_folder)
+    process, q, best_server = set_up(username=args.username, gateway_host=args.gateway_host, env_name=args.env_name, dest_folder=args.dest_folder, request=request)
     run_jupyter(process, q, username, gateway_host, best_server)
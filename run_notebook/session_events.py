@@ -0,0 +1,249 @@
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+# Event kinds published by session_manager
+SESSION_STARTED = "session_started"
+PHASE_STARTED = "phase_started"
+PHASE_FINISHED = "phase_finished"
+PORT_CHOSEN = "port_chosen"
+URL_READY = "url_ready"
+SESSION_ERROR = "error"
+SESSION_STOPPED = "stopped"
+TUNNEL_STATE = "tunnel"
+
+SESSION_EVENT_LOG = Path("jupyter_session_events.log")
+
+# Query parameter carrying the Jupyter token in a notebook URL
+TOKEN_PATTERN = re.compile(r"([?&]token=)[^&#]+")
+
+
+class SessionEvent:
+    """A typed session event: its kind, a sequence number, a timestamp and kind-specific data."""
+    __slots__ = ("seq", "kind", "timestamp", "data")
+
+    def __init__(self, seq, kind, data, timestamp=None):
+        self.seq = seq
+        self.kind = kind
+        self.data = data
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    def to_dict(self):
+        return {"seq": self.seq, "kind": self.kind, "timestamp": self.timestamp, **self.data}
+
+    def __repr__(self):
+        return f"SessionEvent({self.seq}, {self.kind!r}, {self.data!r})"
+
+
+def initial_state():
+    return {
+        "version": 0,
+        "status": "idle",  # idle, starting, running, error or stopped
+        "node": None,
+        "env_name": None,
+        "dest_folder": None,
+        "phase": None,  # Phase in progress
+        "phases": {},  # name -> {"ok", "duration", "error"} for finished phases
+        "local_port": None,
+        "remote_port": None,
+        "url": None,
+        "error": None,
+        "tunnel": None,  # {"healthy", "state", "reconnects", "error"} of the session's forward, once monitored
+        "updated_at": None,
+    }
+
+
+def apply_event(state, event):
+    """Return the session state after ``event``; ``state`` itself is not modified."""
+    data = event.data
+    if event.kind == SESSION_STARTED:
+        state = dict(initial_state(), status="starting", node=data.get("node"),
+                     env_name=data.get("env_name"), dest_folder=data.get("dest_folder"))
+    else:
+        state = dict(state, phases=dict(state["phases"]))
+        if event.kind == PHASE_STARTED:
+            state["phase"] = data["phase"]
+        elif event.kind == PHASE_FINISHED:
+            state["phases"][data["phase"]] = {
+                "ok": data.get("ok", True),
+                "duration": data.get("duration"),
+                "error": data.get("error"),
+            }
+            if state["phase"] == data["phase"]:
+                state["phase"] = None
+        elif event.kind == PORT_CHOSEN:
+            state["local_port"] = data["local_port"]
+        elif event.kind == URL_READY:
+            state.update(status="running", url=data["url"], error=None)
+            for key in ("local_port", "remote_port", "node"):
+                if data.get(key) is not None:
+                    state[key] = data[key]
+        elif event.kind == SESSION_ERROR:
+            state.update(status="error", error=data.get("error"))
+        elif event.kind == TUNNEL_STATE:
+            state["tunnel"] = {key: data.get(key) for key in ("healthy", "state", "reconnects", "error")}
+        elif event.kind == SESSION_STOPPED:
+            state.update(status="stopped", phase=None, url=None, tunnel=None)
+    state["version"] = event.seq
+    state["updated_at"] = event.timestamp
+    return state
+
+
+class SessionEventBus:
+    """In-process publish/subscribe bus for session events, plus a current-state snapshot.
+
+    ``publish`` applies the event to the snapshot and then calls every
+    subscriber interested in its kind on the publishing thread, so
+    subscribers should be quick. A subscriber that raises is reported and
+    skipped; it does not stop the others or the publisher. Readers that only
+    need the current state call ``snapshot`` instead of replaying events.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = []  # (callback, kinds or None for every kind)
+        self._seq = 0
+        self._state = initial_state()
+        self._phase_started = None  # (name, monotonic start time) of the phase in progress
+
+    def subscribe(self, callback, kinds=None):
+        """Call ``callback(event)`` for every event, or only for the given kinds. Returns the callback."""
+        with self._lock:
+            self._subscribers.append((callback, frozenset(kinds) if kinds else None))
+        return callback
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s[0] is not callback]
+
+    def publish(self, kind, **data):
+        with self._lock:
+            self._seq += 1
+            event = SessionEvent(self._seq, kind, data)
+            self._state = apply_event(self._state, event)
+            subscribers = list(self._subscribers)
+        for callback, kinds in subscribers:
+            if kinds is not None and kind not in kinds:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Session event subscriber {callback!r} failed on {kind}: {e}")
+        return event
+
+    def start_phase(self, name, **data):
+        """Finish the phase in progress (successfully) and start ``name``."""
+        self.finish_phase()
+        self._phase_started = (name, time.monotonic())
+        return self.publish(PHASE_STARTED, phase=name, **data)
+
+    def finish_phase(self, ok=True, error=None, **data):
+        """Finish the phase in progress, if any, with its duration."""
+        if self._phase_started is None:
+            return None
+        name, started = self._phase_started
+        self._phase_started = None
+        return self.publish(PHASE_FINISHED, phase=name, ok=ok, duration=time.monotonic() - started,
+                            error=error, **data)
+
+    def fail(self, error):
+        """Fail the phase in progress and publish the error."""
+        self.finish_phase(ok=False, error=error)
+        return self.publish(SESSION_ERROR, error=error)
+
+    def snapshot(self):
+        """Return a copy of the current session state."""
+        with self._lock:
+            return dict(self._state, phases=dict(self._state["phases"]))
+
+
+class SessionEventLog:
+    """Subscriber that appends every event to a JSON-lines file.
+
+    When the file would grow past ``max_bytes`` it is rotated like
+    logging's RotatingFileHandler: ``<path>.1`` is the previous file, up to
+    ``backups`` of them are kept and the oldest is deleted. Tokens are masked
+    in the URLs it writes, and the files are created owner-only.
+    """
+
+    def __init__(self, path=SESSION_EVENT_LOG, max_bytes=5 * 1024 * 1024, backups=3):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{index}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backups > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+
+    def __call__(self, event):
+        record = event.to_dict()
+        if isinstance(record.get("url"), str):
+            record["url"] = TOKEN_PATTERN.sub(r"\1<hidden>", record["url"])
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            try:
+                if self.max_bytes and self.path.exists() and self.path.stat().st_size + len(line) > self.max_bytes:
+                    self._rotate()
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                with os.fdopen(fd, "a") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"Could not write session event log: {e}")
+
+
+class SessionMetrics:
+    """Subscriber that aggregates phase durations and outcome counts across sessions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phases = {}  # name -> {"count", "failures", "total", "last"}
+        self.sessions = 0
+        self.ready = 0
+        self.errors = 0
+        self.tunnel_drops = 0
+        self.tunnel_reconnects = 0
+
+    def __call__(self, event):
+        with self._lock:
+            if event.kind == SESSION_STARTED:
+                self.sessions += 1
+            elif event.kind == URL_READY:
+                self.ready += 1
+            elif event.kind == SESSION_ERROR:
+                self.errors += 1
+            elif event.kind == TUNNEL_STATE:
+                # Jupyter not answering over a live forward is neither a drop nor a reconnect
+                if event.data.get("event") == "reconnected":
+                    self.tunnel_reconnects += 1
+                elif event.data.get("event") == "down":
+                    self.tunnel_drops += 1
+            elif event.kind == PHASE_FINISHED and event.data.get("duration") is not None:
+                stats = self.phases.setdefault(event.data["phase"], {"count": 0, "failures": 0, "total": 0.0, "last": 0.0})
+                stats["count"] += 1
+                stats["failures"] += 0 if event.data.get("ok", True) else 1
+                stats["total"] += event.data["duration"]
+                stats["last"] = event.data["duration"]
+
+    def summary(self):
+        with self._lock:
+            return {
+                "sessions": self.sessions,
+                "ready": self.ready,
+                "errors": self.errors,
+                "tunnel_drops": self.tunnel_drops,
+                "tunnel_reconnects": self.tunnel_reconnects,
+                "phases": {
+                    name: dict(stats, mean=stats["total"] / stats["count"])
+                    for name, stats in self.phases.items()
+                },
+            }
@@ -1,81 +1,154 @@
-import paramiko
+import os
 import time
 import re
 import webbrowser
-import subprocess
 import threading
 import queue
 import psutil
+from cluster_cache import ClusterCache
+from cluster_history import TREND_WINDOW, ClusterHistory
+from cluster_table import ClusterTable, read_ai_columns
+from jupyter_remote import (
+    PID_PATTERN, detached_start_command, discover_servers, find_matching_server, format_uptime, is_server_running,
+    log_follow_command, parse_launcher, parse_pid, parse_stopped_session, probe_jupyter, read_server_log,
+    server_env_prefix, start_command, stop_server_command, wait_for_runtime_file
+)
+from output_log import OutputLog
+from placement import PlacementScheduler
+from port_registry import PortIndex, PortRegistry
+from remote_env import EnvironmentCache, activation_prelude, bootstrap_environment, validate_cached_environment
+from remote_shell import ExecRunner, ShellStepEngine, ShellStepTimeout
+from session_events import (
+    PORT_CHOSEN, SESSION_STARTED, SESSION_STOPPED, TUNNEL_STATE, URL_READY, SessionEventBus, SessionEventLog,
+    SessionMetrics
+)
+from session_store import SessionStore
+from ssh_pool import SSHConnectionPool, connect_via_jump
+from port_forward import ForwardManager, LocalPortForwarder
+from socks_proxy import SocksProxy
+from tunnel_monitor import TunnelMonitor
 
 # Global variables for session management
-ssh_client = None
-session_output_buffer = []  # Store session output for real-time display
+ssh_pool = SSHConnectionPool()  # Shared transports keyed by (username, gateway)
+current_connection_key = None  # (username, gateway) the app is logged in with
+session_connection_key = None  # Connection held by the active notebook session
+session_output_buffer = OutputLog(capacity=1000)  # Session output for real-time display
 active_shell = None  # Store active shell session
-active_tunnel_process = None  # Store active tunnel process
+active_forwarder = None  # Store active local port forwarder
+tunnel_monitor = None  # Supervises active_forwarder and re-establishes it when it drops
+active_runner = None  # Command runner on the node (ExecRunner or ShellStepEngine)
+active_node_client = None  # SSH client to the node when reached through the gateway
+env_cache = EnvironmentCache()  # Resolved environment paths per (gateway, node, env_name)
+session_store = SessionStore()  # Session descriptors that survive page refreshes and app restarts
+active_session = None  # Descriptor of the attached session, as persisted in session_store
+session_events = SessionEventBus()  # Typed session events and the current session state
+session_metrics = session_events.subscribe(SessionMetrics())  # Phase timings across sessions
+session_events.subscribe(SessionEventLog())  # Every event, as JSON lines
+cluster_history = ClusterHistory()  # Every fetched 'ai' snapshot, per host
+cluster_cache = ClusterCache(lambda: fetch_cluster_table())  # Latest 'ai' snapshot
+placement_scheduler = PlacementScheduler(history=cluster_history)  # Ranks hosts for a notebook session
+port_registry = PortRegistry()  # Local ports this app allocated, and the processes it started on them
+forward_manager = ForwardManager(lambda: get_session_client().get_transport(), port_registry)  # Extra node forwards
+socks_proxy = None  # Local SOCKS5 proxy to any host:port behind the gateway
 
 def add_to_output_buffer(message, message_type="info"):
-    """Add a message to the output buffer for real-time display."""
-    global session_output_buffer
-    timestamp = time.strftime("%H:%M:%S")
-    session_output_buffer.append({
-        "timestamp": timestamp,
-        "message": message,
-        "type": message_type
-    })
-    # Keep only last 1000 messages to prevent memory issues
-    if len(session_output_buffer) > 1000:
-        session_output_buffer = session_output_buffer[-1000:]
+    """Add a message to the output buffer for real-time display and return its sequence number."""
+    return session_output_buffer.append(message, message_type)
 
 def get_output_buffer():
-    """Get the current output buffer."""
-    global session_output_buffer
-    return session_output_buffer.copy()
+    """Get every entry currently held in the output buffer."""
+    return session_output_buffer.read_since(0)
+
+def read_output_since(seq, limit=None):
+    """Get only the entries added after sequence number ``seq``."""
+    return session_output_buffer.read_since(seq, limit)
+
+def get_output_delta(seq):
+    """Get the entries after ``seq`` and whether the buffer was cleared since (see OutputLog.delta)."""
+    return session_output_buffer.delta(seq)
+
+def wait_for_output(seq, timeout=None):
+    """Block until the output buffer has something newer than ``seq``; False on timeout."""
+    return session_output_buffer.wait(seq, timeout)
+
+def get_output_seq():
+    """Get the sequence number of the newest entry in the output buffer."""
+    return session_output_buffer.last_seq
 
 def clear_output_buffer():
     """Clear the output buffer."""
-    global session_output_buffer
-    session_output_buffer = []
+    session_output_buffer.clear()
+
+def get_session_state():
+    """Get a snapshot of the current session state (status, phase, ports, URL, error)."""
+    return session_events.snapshot()
 
 def establish_ssh_session(username, gateway):
-    """Establish and store an SSH session."""
-    global ssh_client
-    if ssh_client is None:
-        ssh_client = paramiko.SSHClient()
-        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh_client.connect(hostname=gateway, username=username)
-    return ssh_client
+    """Make (username, gateway) the app's current connection, reusing a pooled transport."""
+    global current_connection_key
+    key = (username, gateway)
+    if current_connection_key != key:
+        # The cluster view depends on who asks for it
+        cluster_cache.invalidate()
+        client = ssh_pool.acquire(username, gateway)
+        if current_connection_key is not None:
+            ssh_pool.release(*current_connection_key)
+        current_connection_key = key
+        return client
+    return ssh_pool.get(username, gateway)
+
+def get_ssh_client():
+    """Return the pooled client for the current connection, reconnecting if needed."""
+    if current_connection_key is None:
+        raise Exception("No SSH session established. Please log in first.")
+    return ssh_pool.get(*current_connection_key)
+
+def get_session_client():
+    """Return the pooled client of the notebook session, or of the current login without one."""
+    key = session_connection_key or current_connection_key
+    if key is None:
+        raise Exception("No SSH session established. Please log in first.")
+    return ssh_pool.get(*key)
 
 def is_ssh_client_valid():
-    """Check if the SSH client is valid and connected."""
-    global ssh_client
-    if ssh_client is None:
-        return False
-    try:
-        # Test the connection by sending a simple command
-        ssh_client.exec_command("echo test", timeout=5)
-        return True
-    except Exception:
+    """Check if the SSH client is connected and answering keepalives (no remote command)."""
+    if current_connection_key is None:
         return False
+    return ssh_pool.is_healthy(*current_connection_key)
+
+def get_connection_health():
+    """Return the current connection's liveness snapshot (healthy, rtt, last_seen_age)."""
+    if current_connection_key is None:
+        return {"healthy": False, "rtt": None, "last_seen_age": None, "refcount": 0}
+    return ssh_pool.health(*current_connection_key)
 
 
 def ensure_ssh_connection(load_config):
     """Ensure the SSH client is valid, and reconnect if necessary."""
-    global ssh_client
-    if not is_ssh_client_valid():
-        print("SSH client is invalid. Attempting to reconnect...")
+    if current_connection_key is None:
+        print("No SSH session. Attempting to reconnect from saved settings...")
         if load_config is None:
             raise Exception("No load_config function provided. Cannot reconnect.")
         config = load_config()
         if not config:
             raise Exception("No saved login settings found. Cannot reconnect.")
         establish_ssh_session(config["username"], config["gateway"])
+    elif not is_ssh_client_valid():
+        print("SSH client is invalid. Attempting to reconnect...")
+        get_ssh_client()
 
 def close_ssh_session():
-    """Close the SSH session."""
-    global ssh_client
-    if ssh_client:
-        ssh_client.close()
-        ssh_client = None
+    """Release the app's reference to the current connection.
+
+    The transport stays pooled (and keeps serving any running notebook session)
+    until it has been idle for the pool's idle timeout.
+    """
+    global current_connection_key
+    cluster_cache.stop()
+    stop_socks_proxy()
+    if current_connection_key is not None:
+        ssh_pool.release(*current_connection_key)
+        current_connection_key = None
 
 
 def run_command_with_paramiko(command, timeout=30, max_retries=5, load_config=None):
@@ -85,7 +158,7 @@ def run_command_with_paramiko(command, timeout=30, max_retries=5, load_config=No
     
     for attempt in range(max_retries):
         try:
-            stdin, stdout, stderr = ssh_client.exec_command(command, timeout=timeout)
+            stdin, stdout, stderr = get_ssh_client().exec_command(command, timeout=timeout)
             output = stdout.read().decode("utf-8")
             error = stderr.read().decode("utf-8")
 
@@ -100,7 +173,9 @@ def run_command_with_paramiko(command, timeout=30, max_retries=5, load_config=No
             time.sleep(2)  # Wait before retrying
             
         except Exception as e:
-            print(f"Attempt {attempt + 1} failed with exception: {e}")
+            health = get_connection_health()
+            print(f"Attempt {attempt + 1} failed with exception: {e} "
+                  f"(healthy={health['healthy']}, rtt={health['rtt']})")
             if attempt < max_retries - 1:
                 time.sleep(2)
             else:
@@ -118,40 +193,43 @@ def is_float(s):
 
 def parse_ai_output(ai_output):
     """Parse the output of the 'ai' command to extract server information."""
-    lines = ai_output.splitlines()
-    table_start = False
-    servers = []
-
-    for line in lines:
-        # Skip lines until the table header is found
-        if line.startswith("#CPU"):
-            table_start = True
-            continue
-        if not table_start:
-            continue
-
-        # Skip error lines
-        if "rsh: fork" in line or "Resource temporarily unavailable" in line:
-            continue
-
-        # Parse table rows
-        parts = line.split()            
-
-        if len(parts) >= 8 and is_float(parts[0]):  # Ensure the line has enough columns
-            servers.append({
-                "CPU_AVAIL": parts[0],
-                "LOAD": parts[1],
-                "CPU": parts[2],
-                "HOST": parts[3],
-                "CPU_TYPE": parts[4],
-                "GB_AVAIL": parts[5],
-                "GB_TOTAL": parts[6],
-                "PROGRAM": parts[7],
-                "HAS_GPU": 'X' if 'gpu' in parts[3].lower() else ' ',
-                "USER": parts[8] if len(parts) > 8 else ""
-            })
-
-    return servers
+    columns = read_ai_columns(ai_output)
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+def parse_cluster_table(ai_output):
+    """Parse the output of the 'ai' command into a typed ClusterTable."""
+    return ClusterTable.from_ai_output(ai_output)
+
+def fetch_cluster_table():
+    """Run the 'ai' command, parse its table and add it to the cluster history."""
+    table = parse_cluster_table(run_command_with_paramiko("ai"))
+    cluster_history.record(table)
+    return table
+
+def rank_cluster_table(table, request=None):
+    """Order a ClusterTable by placement score, hosts that satisfy ``request`` first.
+
+    Returns the reordered table and the candidates in the same order (see PlacementScheduler.rank).
+    """
+    ranking = placement_scheduler.rank(table, request)
+    return table.take([candidate["index"] for candidate in ranking]), ranking
+
+def get_cluster_trends(window=TREND_WINDOW):
+    """Rolling statistics per host from the cluster history (see ClusterHistory.stats)."""
+    return cluster_history.stats(window)
+
+def get_cluster_snapshot(max_age=None, block=True):
+    """Return the cached cluster snapshot (``.table``, ``.age``), fetching it if older than ``max_age``.
+
+    Concurrent callers share a single run of the 'ai' command. With
+    ``block=False`` a stale or missing snapshot is returned as is and refreshed
+    in the background.
+    """
+    return cluster_cache.get(max_age, block)
+
+def start_cluster_refresh(interval=None):
+    """Keep the cluster snapshot fresh from a background thread until logout."""
+    cluster_cache.start(interval)
 
 
 def read_output_with_timeout(stdout, timeout=3, max_empty_reads=15):
@@ -194,123 +272,52 @@ def read_output_with_timeout(stdout, timeout=3, max_empty_reads=15):
 
 def connect_and_run_jupyter(best_server, env_name, dest_folder, local_port=8888):
     """Connect to the selected server, activate the environment, and start Jupyter Notebook."""
-    try:
-        # Create a shell session
-        shell = ssh_client.invoke_shell()
-        shell.settimeout(30)
-        
-        # Function to send command and wait for output
-        def send_command_and_wait(command, wait_time=2):
-            shell.send(command + '\n')
-            time.sleep(wait_time)
-            output = ""
-            while shell.recv_ready():
-                chunk = shell.recv(4096).decode('utf-8')
-                output += chunk
-                time.sleep(0.1)  # Small delay to collect all output
-            return output
+    result = connect_and_run_jupyter_with_output(best_server, env_name, dest_folder, local_port=local_port)
+    if not result["success"]:
+        raise Exception(f"An error occurred while starting Jupyter Notebook: {result['error']}")
+    return result["message"]
 
-        # Wait for initial prompt
-        time.sleep(2)
-        initial_output = ""
-        while shell.recv_ready():
-            initial_output += shell.recv(4096).decode('utf-8')
-        
-        # Step 1: SSH into the selected server
-        ssh_output = send_command_and_wait(f"ssh {best_server}", wait_time=5)
-        if "Last login" not in ssh_output and "Welcome" not in ssh_output:
-            raise Exception(f"Failed to connect to {best_server}. Output: {ssh_output}")
-        
-        # Step 2: Source bashrc and activate conda environment
-        send_command_and_wait("source ~/.bashrc", wait_time=1)
-        
-        # Activate conda environment
-        conda_output = send_command_and_wait(f"conda activate {env_name}", wait_time=3)
-        
-        # Verify environment activation
-        env_check = send_command_and_wait("echo $CONDA_DEFAULT_ENV", wait_time=2)
-        if env_name not in env_check:
-            raise Exception(f"Failed to activate conda environment: {env_name}. Output: {env_check}")
-        
-        # Step 3: Navigate to destination folder
-        cd_output = send_command_and_wait(f"cd {dest_folder}", wait_time=1)
-        
-        # Verify directory change
-        pwd_output = send_command_and_wait("pwd", wait_time=1)
-        if dest_folder not in pwd_output:
-            raise Exception(f"Failed to change directory to: {dest_folder}. Current dir: {pwd_output}")
-        
-        # Step 4: Start Jupyter Notebook
-        jupyter_output = send_command_and_wait("jupyter notebook --ip 0.0.0.0 --no-browser", wait_time=3)
-        
-        # Wait for Jupyter to fully start and collect output over time
-        full_jupyter_output = jupyter_output
-        max_wait_time = 60  # Maximum wait time in seconds
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait_time:
-            time.sleep(2)  # Wait before checking for more output
-            if shell.recv_ready():
-                additional_output = ""
-                while shell.recv_ready():
-                    chunk = shell.recv(4096).decode('utf-8')
-                    additional_output += chunk
-                    time.sleep(0.1)
-                full_jupyter_output += additional_output
-                
-                # Check if we have the URL with port and token
-                if "http://" in full_jupyter_output and "token=" in full_jupyter_output:
-                    break
-        
-        # Extract port and token from the output with more comprehensive patterns
-        patterns = [
-            r"http://.*?:(\d+)/.*?\?token=([a-f0-9]+)",
-            r"http://localhost:(\d+)/.*?\?token=([a-f0-9]+)",
-            r"http://[\w\-\.]+:(\d+)/\?token=([a-f0-9]+)",
-            r"Or copy and paste one of these URLs:\s*http://.*?:(\d+)/.*?\?token=([a-f0-9]+)"
-        ]
-        
-        port_match = None
-        for pattern in patterns:
-            port_match = re.search(pattern, full_jupyter_output, re.MULTILINE | re.DOTALL)
-            if port_match:
-                break
-        
-        if not port_match:
-            raise Exception(f"Failed to parse Jupyter Notebook port and token. Output: {full_jupyter_output}")
-        
-        remote_port = port_match.group(1)
-        token = port_match.group(2)
-        
-        # Step 5: Create an SSH tunnel using the gateway host
-        gateway_host = ssh_client.get_transport().getpeername()[0]
-        username = ssh_client.get_transport().get_username()
-        
-        tunnel_cmd = f"ssh -L {local_port}:{best_server}:{remote_port} -N {username}@{gateway_host}"
-        
-        # Start the tunnel in a separate process
-        tunnel_process = subprocess.Popen(
-            tunnel_cmd, 
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        # Give some time for the tunnel to establish
-        time.sleep(3)
-        
-        # Step 6: Open the Jupyter Notebook in the local browser
-        notebook_url = f"http://localhost:{local_port}/?token={token}"
-        webbrowser.open(notebook_url)
-        
-        return f"🟢 Jupyter Notebook started successfully! Access it at {notebook_url}"
-        
-    except Exception as e:
-        raise Exception(f"An error occurred while starting Jupyter Notebook: {str(e)}")
+def open_node_session(ssh_client, best_server, username, use_jump_host=True, log_output=add_to_output_buffer):
+    """Open a command runner on the compute node.
+
+    With ``use_jump_host`` the node is reached through a direct-tcpip channel
+    from the gateway and commands run on their own exec channels (an
+    ExecRunner). If that fails, or the jump host mode is off, fall back to an
+    interactive gateway shell that types ``ssh best_server`` (a ShellStepEngine).
+    """
+    global active_node_client
+    if active_node_client is not None:
+        active_node_client.close()
+        active_node_client = None
+    if use_jump_host:
+        try:
+            node_client = connect_via_jump(ssh_client, best_server, username)
+            active_node_client = node_client
+            log_output(f"Connected to {best_server} through a direct gateway channel", "success")
+            return ExecRunner(node_client)
+        except Exception as e:
+            log_output(f"Direct connection to {best_server} failed ({e}); falling back to nested ssh", "warning")
+
+    shell = ssh_client.invoke_shell()
+    engine = ShellStepEngine(shell)
+    log_output("SSH shell session created", "success")
+
+    # Wait for the initial prompt
+    engine.run("true", timeout=15)
 
-def connect_and_run_jupyter_with_output(best_server, env_name, dest_folder, local_port=8888, output_callback=None):
+    log_output(f"Executing: ssh {best_server}", "info")
+    ssh_result = engine.run(f"ssh {best_server}", timeout=30)
+    if not ssh_result.ok:
+        log_output(f"Connection failed: {ssh_result.output}", "error")
+        shell.close()
+        raise Exception(f"Failed to connect to {best_server}. Output: {ssh_result.output}")
+    return engine
+
+def connect_and_run_jupyter_with_output(best_server, env_name, dest_folder, local_port=8888, output_callback=None,
+                                        use_jump_host=True, use_env_cache=True, reuse_existing=True,
+                                        detached=True, resume=True):
     """Connect to the selected server, activate the environment, and start Jupyter Notebook with step-by-step output."""
-    global active_shell
+    global active_shell, active_forwarder, active_runner, active_session, session_connection_key
     
     def log_output(message, message_type="info"):
         """Helper function to log output"""
@@ -319,165 +326,217 @@ def connect_and_run_jupyter_with_output(best_server, env_name, dest_folder, loca
             output_callback(message, message_type)
         print(f"[{message_type.upper()}] {message}")
     
+    lease = None
     try:
         clear_output_buffer()  # Clear previous session output
+        session_events.publish(SESSION_STARTED, node=best_server, env_name=env_name, dest_folder=dest_folder)
         log_output("Starting Jupyter Notebook session...", "info")
         log_output(f"Target server: {best_server}", "info")
         log_output(f"Environment: {env_name}", "info")
         log_output(f"Directory: {dest_folder}", "info")
         
-        # Smart port management
+        # Reattach to the persisted session for this node if its server is still running
+        if resume:
+            saved = session_store.find(best_server, env_name, dest_folder, current_connection_key)
+            if saved is not None:
+                try:
+                    return reattach_session(saved, log_output)
+                except Exception as e:
+                    session_events.finish_phase(ok=False, error=str(e))
+                    log_output(f"Could not reattach to the previous session: {e}", "warning")
+        
+        # The tunnel runs inside this process, so release a previous one before allocating a port
+        stop_tunnel_monitor()
+        if active_forwarder:
+            stop_forwarder(active_forwarder)
+            active_forwarder = None
+        
+        session_events.start_phase("ports")
         log_output("Checking port availability...", "info")
         try:
-            local_port = smart_port_cleanup_and_find(local_port)
+            lease = reserve_local_port(local_port, log_output)
         except Exception as e:
             log_output(f"Port management error: {e}", "error")
             raise Exception(f"Could not secure a port: {e}")
+        local_port = lease.port
         
+        session_events.publish(PORT_CHOSEN, local_port=local_port)
         log_output(f"Using local port: {local_port}", "success")
         
-        # Create a shell session
-        shell = ssh_client.invoke_shell()
-        shell.settimeout(30)
-        active_shell = shell  # Store for potential interaction
-        
-        log_output("SSH shell session created", "success")
-        
-        # Function to send command and wait for output
-        def send_command_and_wait(command, wait_time=2, log_command=True):
-            if log_command:
-                log_output(f"Executing: {command}", "info")
-            shell.send(command + '\n')
-            time.sleep(wait_time)
-            output = ""
-            while shell.recv_ready():
-                chunk = shell.recv(4096).decode('utf-8')
-                output += chunk
-                time.sleep(0.1)  # Small delay to collect all output
-            return output
-
-        # Wait for initial prompt
-        time.sleep(2)
-        initial_output = ""
-        while shell.recv_ready():
-            initial_output += shell.recv(4096).decode('utf-8')
+        # Hold our own reference on the pooled transport for the lifetime of the session
+        if current_connection_key is None:
+            raise Exception("No SSH session established. Please log in first.")
+        ssh_client = ssh_pool.acquire(*current_connection_key)
+        if session_connection_key is not None:
+            ssh_pool.release(*session_connection_key)
+        session_connection_key = current_connection_key
         
-        # Step 1: SSH into the selected server
+        # Step 1: Connect to the selected server
+        session_events.start_phase("connect", node=best_server)
         log_output("Connecting to remote server...", "info")
-        ssh_output = send_command_and_wait(f"ssh {best_server}", wait_time=5)
-        if "Last login" not in ssh_output and "Welcome" not in ssh_output:
-            log_output(f"Connection failed: {ssh_output}", "error")
-            raise Exception(f"Failed to connect to {best_server}. Output: {ssh_output}")
+        runner = open_node_session(ssh_client, best_server, session_connection_key[0],
+                                   use_jump_host=use_jump_host, log_output=log_output)
+        active_runner = runner
         
         log_output("Successfully connected to remote server", "success")
         
-        # Step 2: Source bashrc and activate conda environment
-        log_output("Setting up environment...", "info")
-        send_command_and_wait("source ~/.bashrc", wait_time=1, log_command=False)
-        
-        # Activate conda environment
-        log_output(f"Activating conda environment: {env_name}", "info")
-        conda_output = send_command_and_wait(f"conda activate {env_name}", wait_time=3, log_command=False)
-        
-        # Verify environment activation
-        env_check = send_command_and_wait("echo $CONDA_DEFAULT_ENV", wait_time=2, log_command=False)
-        if env_name not in env_check:
-            log_output(f"Environment activation failed: {env_check}", "error")
-            raise Exception(f"Failed to activate conda environment: {env_name}. Output: {env_check}")
-        
-        log_output(f"Environment '{env_name}' activated successfully", "success")
-        
-        # Step 3: Navigate to destination folder
-        log_output(f"Navigating to directory: {dest_folder}", "info")
-        cd_output = send_command_and_wait(f"cd {dest_folder}", wait_time=1, log_command=False)
-        
-        # Verify directory change
-        pwd_output = send_command_and_wait("pwd", wait_time=1, log_command=False)
-        if dest_folder not in pwd_output:
-            log_output(f"Directory change failed. Current: {pwd_output}", "error")
-            raise Exception(f"Failed to change directory to: {dest_folder}. Current dir: {pwd_output}")
-        
-        log_output(f"Successfully changed to directory: {dest_folder}", "success")
-        
-        # Step 4: Start Jupyter Notebook
-        log_output("Starting Jupyter Notebook...", "info")
-        jupyter_output = send_command_and_wait("jupyter notebook --ip 0.0.0.0 --no-browser", wait_time=3, log_command=False)
-        
-        log_output("Waiting for Jupyter to initialize...", "info")
-        
-        # Wait for Jupyter to fully start and collect output over time
-        full_jupyter_output = jupyter_output
-        max_wait_time = 60  # Maximum wait time in seconds
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait_time:
-            time.sleep(2)  # Wait before checking for more output
-            if shell.recv_ready():
-                additional_output = ""
-                while shell.recv_ready():
-                    chunk = shell.recv(4096).decode('utf-8')
-                    additional_output += chunk
-                    time.sleep(0.1)
-                full_jupyter_output += additional_output
+        gateway_host = session_connection_key[1]
+        cached_boot = env_cache.get(gateway_host, best_server, env_name, dest_folder) if use_env_cache else None
+        
+        # Step 2: Reattach to a matching server that is still running. Discovery needs no
+        # environment, so a reattach skips ~/.bashrc and conda activate altogether
+        server_info = None
+        session_name = None  # tmux/nohup session of a server started detached here
+        boot = None
+        if reuse_existing:
+            session_events.start_phase("discover")
+            log_output("Looking for running Jupyter servers...", "info")
+            servers, workdir = discover_servers(runner, best_server, dest_folder)
+            for server in servers:
+                log_output(f"Found Jupyter (pid {server['pid']}) on port {server['port']}, root {server['root_dir']}, "
+                           f"up {format_uptime(server['uptime'])}", "info")
+            if workdir:
+                server_info = find_matching_server(servers, workdir, cached_boot["env_prefix"] if cached_boot else "")
+            if server_info is not None:
+                log_output(f"Reusing Jupyter server (pid {server_info['pid']}) instead of starting a new one", "success")
+                boot = {
+                    "env_prefix": cached_boot["env_prefix"] if cached_boot else server_env_prefix(server_info),
+                    "python": server_info["exe"],
+                    "jupyter": cached_boot["jupyter"] if cached_boot else "",
+                    "workdir": workdir,
+                }
+                if not isinstance(runner, ExecRunner):
+                    # Put the node shell in the server's environment without the bootstrap
+                    runner.run("; ".join(activation_prelude(boot, env_name)))
+                    active_shell = runner.shell
+        
+        # Step 3: Source bashrc, activate the conda environment and cd, in one round trip,
+        # unless the environment's paths are cached for this node and still valid
+        if boot is None:
+            session_events.start_phase("environment")
+            log_output("Setting up environment...", "info")
+            boot = cached_boot
+            if boot is not None:
+                if validate_cached_environment(runner, boot, env_name):
+                    log_output(f"Using cached environment for {best_server} (skipping ~/.bashrc and conda activate)", "success")
+                else:
+                    log_output("Cached environment is no longer valid, bootstrapping again", "warning")
+                    env_cache.invalidate(gateway_host, best_server, env_name)
+                    boot = None
+            if boot is None:
+                boot = bootstrap_environment(runner, env_name, dest_folder)
+                step_labels = {
+                    "source": "Source ~/.bashrc",
+                    "activate": f"Activate conda environment '{env_name}'",
+                    "cd": f"Change to directory {dest_folder}",
+                }
+                for step in boot["steps"]:
+                    label = step_labels.get(step["name"], step["name"])
+                    if step["status"] == 0:
+                        log_output(f"{label}: ok ({step['duration_ms']} ms)", "success")
+                    else:
+                        log_output(f"{label}: failed with exit code {step['status']} {step['error']}".rstrip(),
+                                   "warning" if step["name"] == "source" else "error")
                 
-                # Check if we have the URL with port and token
-                if "http://" in full_jupyter_output and "token=" in full_jupyter_output:
-                    log_output("Jupyter Notebook URL detected!", "success")
-                    break
-        
-        # Extract port and token from the output with more comprehensive patterns
-        patterns = [
-            r"http://.*?:(\d+)/.*?\?token=([a-f0-9]+)",
-            r"http://localhost:(\d+)/.*?\?token=([a-f0-9]+)",
-            r"http://[\w\-\.]+:(\d+)/\?token=([a-f0-9]+)",
-            r"Or copy and paste one of these URLs:\s*http://.*?:(\d+)/.*?\?token=([a-f0-9]+)"
-        ]
-        
-        port_match = None
-        for pattern in patterns:
-            port_match = re.search(pattern, full_jupyter_output, re.MULTILINE | re.DOTALL)
-            if port_match:
-                break
-        
-        if not port_match:
-            log_output("Failed to parse Jupyter output for port and token", "error")
-            log_output(f"Jupyter output: {full_jupyter_output}", "error")
-            raise Exception(f"Failed to parse Jupyter Notebook port and token. Output: {full_jupyter_output}")
+                if not boot["ok"]:
+                    failed = boot["failed_step"]
+                    if failed == "activate":
+                        raise Exception(f"Failed to activate conda environment: {env_name}")
+                    if failed == "cd":
+                        raise Exception(f"Failed to change directory to: {dest_folder}")
+                    if failed == "jupyter":
+                        raise Exception(f"No jupyter executable found in environment: {env_name}")
+                    raise Exception(f"Environment setup failed at step '{failed}'. {boot.get('error', '')}")
+                
+                if use_env_cache:
+                    env_cache.put(gateway_host, best_server, env_name, dest_folder, boot)
+                log_output(f"Environment ready in {boot['duration']:.2f}s: {boot['env_prefix'] or 'no conda prefix'}", "success")
+            log_output(f"Jupyter: {boot['jupyter']}", "info")
+        log_output(f"Working directory: {boot['workdir']}", "info")
+        
+        # Later exec channels start straight in the resolved environment
+        if isinstance(runner, ExecRunner):
+            runner.prelude = activation_prelude(boot, env_name)
+        
+        # Step 4: Start a new server if none could be reused
+        if server_info is None:
+            session_events.start_phase("server")
+            log_output("Starting Jupyter Notebook...", "info")
+            if detached:
+                # Not tied to any channel, so the server outlives this connection and the app
+                session_name = f"jupyter-{int(time.time())}"
+                start_result = runner.run(detached_start_command(boot["jupyter"], best_server, session_name))
+                jupyter_pid = parse_pid(start_result.output)
+                if not start_result.ok or jupyter_pid is None:
+                    raise Exception(f"Jupyter did not start. Output: {start_result.output} {start_result.error}".rstrip())
+                log_output(f"Jupyter started detached under {parse_launcher(start_result.output)} "
+                           f"(session {session_name})", "info")
+                if isinstance(runner, ExecRunner):
+                    # Follow the server's log on a separate channel
+                    log_follower = runner.start(log_follow_command(best_server, session_name))
+                    active_shell = log_follower.shell
+                    start_output_pump(log_follower)
+                else:
+                    active_shell = runner.shell
+            elif isinstance(runner, ExecRunner):
+                # Foreground on its own PTY channel; closing the channel stops the server
+                jupyter = runner.start(start_command(boot["jupyter"], best_server))
+                active_shell = jupyter.shell
+                try:
+                    jupyter_pid = int(jupyter.expect(PID_PATTERN, timeout=15).group(1))
+                except ShellStepTimeout as e:
+                    raise Exception(f"Jupyter did not start. {e}")
+                start_output_pump(jupyter)
+            else:
+                # Background job of the node shell, which stays free for commands
+                start_result = runner.run(start_command(boot["jupyter"], best_server, background=True))
+                jupyter_pid = parse_pid(start_result.output)
+                if not start_result.ok or jupyter_pid is None:
+                    raise Exception(f"Jupyter did not start. Output: {start_result.output}")
+                active_shell = runner.shell
+            
+            log_output(f"Waiting for Jupyter to initialize (pid {jupyter_pid})...", "info")
+            server_info = wait_for_runtime_file(runner, best_server, jupyter_pid)
+            if detached and not isinstance(runner, ExecRunner):
+                for line in read_server_log(runner, best_server, session_name).splitlines():
+                    add_to_output_buffer(line.rstrip("\r"), "output")
         
-        remote_port = port_match.group(1)
-        token = port_match.group(2)
+        remote_port = str(server_info["port"])
+        token = server_info["token"]
+        base_url = server_info["base_url"]
         
         log_output(f"Jupyter running on port {remote_port}", "success")
-        log_output(f"Access token: {token[:8]}...", "info")
-        
-        # Step 5: Create an SSH tunnel using the gateway host
-        log_output("Creating SSH tunnel...", "info")
-        gateway_host = ssh_client.get_transport().getpeername()[0]
-        username = ssh_client.get_transport().get_username()
-        
-        tunnel_cmd = f"ssh -L {local_port}:{best_server}:{remote_port} -N {username}@{gateway_host}"
-        
-        log_output(f"Tunnel: localhost:{local_port} -> {best_server}:{remote_port}", "info")
-        
-        # Start the tunnel in a separate process
-        tunnel_process = subprocess.Popen(
-            tunnel_cmd, 
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        # Store tunnel process for cleanup
-        global active_tunnel_process
-        active_tunnel_process = tunnel_process
-        
-        # Give some time for the tunnel to establish
-        time.sleep(3)
-        
-        # Step 6: Create the local URL
-        notebook_url = f"http://localhost:{local_port}/?token={token}"
-        log_output("SSH tunnel established successfully", "success")
+        if token:
+            log_output(f"Access token: {token[:8]}...", "info")
+        
+        # Step 5: Forward a local port to the node over the pooled gateway transport
+        session_events.start_phase("tunnel")
+        forwarder, notebook_url = open_jupyter_tunnel(ssh_client, best_server, remote_port, local_port,
+                                                      base_url, token, log_output, listen_socket=lease.detach())
+        active_forwarder = forwarder
+        
+        # Step 6: Remember the session so a page refresh or app restart can reattach to it
+        session_events.finish_phase()
+        session_events.publish(URL_READY, url=notebook_url, local_port=local_port, remote_port=int(remote_port),
+                               node=best_server)
         log_output(f"Jupyter Notebook URL: {notebook_url}", "success")
+        active_session = session_store.save({
+            "username": session_connection_key[0],
+            "gateway": session_connection_key[1],
+            "node": best_server,
+            "env_name": env_name,
+            "dest_folder": dest_folder,
+            "env_prefix": boot["env_prefix"],
+            "workdir": boot["workdir"],
+            "remote_port": int(remote_port),
+            "token": token,
+            "base_url": base_url,
+            "pid": server_info.get("pid"),
+            "session_name": session_name,
+            "local_port": local_port,
+            "url": notebook_url,
+        })
+        start_tunnel_monitor(active_session)
         
         # Open in browser
         webbrowser.open(notebook_url)
@@ -489,11 +548,14 @@ def connect_and_run_jupyter_with_output(best_server, env_name, dest_folder, loca
             "message": f"🟢 Jupyter Notebook started successfully! Access it at {notebook_url}",
             "port": remote_port,
             "token": token,
-            "tunnel_process": tunnel_process
+            "forwarder": forwarder
         }
         
     except Exception as e:
         error_msg = f"An error occurred while starting Jupyter Notebook: {str(e)}"
+        if lease is not None and lease.socket is not None:
+            port_registry.release(lease.port)
+        session_events.fail(str(e))
         log_output(error_msg, "error")
         return {
             "success": False,
@@ -501,9 +563,314 @@ def connect_and_run_jupyter_with_output(best_server, env_name, dest_folder, loca
             "message": f"❌ {error_msg}"
         }
 
+def open_jupyter_tunnel(ssh_client, node, remote_port, local_port, base_url, token, log_output=add_to_output_buffer,
+                        probe_timeout=10, listen_socket=None):
+    """Forward a local port to Jupyter on the node and wait until it answers through the tunnel.
+
+    ``listen_socket`` is the socket of a PortLease for ``local_port``, adopted by
+    the forwarder. Returns the running forwarder and the local notebook URL.
+    """
+    log_output("Creating SSH tunnel...", "info")
+    log_output(f"Tunnel: localhost:{local_port} -> {node}:{remote_port}", "info")
+    forwarder = LocalPortForwarder(ssh_client.get_transport(), node, remote_port, local_port=local_port)
+    try:
+        forwarder.start(listen_socket)
+        probe_time = probe_jupyter(local_port, base_url, timeout=probe_timeout)
+    except Exception:
+        stop_forwarder(forwarder)
+        raise
+    log_output(f"SSH tunnel established successfully (Jupyter answered in {probe_time * 1000:.0f} ms)", "success")
+    
+    notebook_url = f"http://localhost:{local_port}{base_url}"
+    if token:
+        notebook_url += f"?token={token}"
+    return forwarder, notebook_url
+
+def reconnect_tunnel(forwarder, descriptor):
+    """Replace a dropped forward with a new one on the same local port, over a live gateway transport.
+
+    The pool reconnects the gateway if its transport died. Raises if Jupyter
+    does not answer through the new forward.
+    """
+    global active_forwarder
+    forwarder.stop(timeout=1)
+    if session_connection_key is None:
+        raise Exception("No SSH session established")
+    ssh_client = ssh_pool.get(*session_connection_key)
+    replacement = LocalPortForwarder(ssh_client.get_transport(), descriptor["node"], descriptor["remote_port"],
+                                     local_port=forwarder.local_port)
+    try:
+        replacement.start()
+        probe_jupyter(replacement.local_port, descriptor["base_url"], timeout=5)
+    except Exception:
+        replacement.stop(timeout=1)
+        raise
+    active_forwarder = replacement
+    return replacement
+
+def publish_tunnel_health(health):
+    """Report a tunnel going down, coming back or Jupyter not answering, on the session bus and in the terminal."""
+    event = health["event"]
+    session_events.publish(TUNNEL_STATE, healthy=health["healthy"], state=health["state"], event=event,
+                           reconnects=health["reconnects"], error=health["last_error"])
+    if event == "reconnected":
+        add_to_output_buffer(f"🔁 SSH tunnel re-established in {health['last_reconnect'] * 1000:.0f} ms", "success")
+        # The extra forwards ran over the same transport
+        revived = forward_manager.revive()
+        if revived:
+            add_to_output_buffer(f"🔁 {revived} port forward(s) re-established", "success")
+        if revive_socks_proxy():
+            add_to_output_buffer(f"🔁 SOCKS5 proxy on localhost:{socks_proxy.local_port} re-established", "success")
+    elif event == "responding":
+        add_to_output_buffer("✅ Jupyter is answering through the tunnel again", "success")
+    elif event == "unresponsive":
+        add_to_output_buffer(f"⚠️  Jupyter is not answering ({health['last_error']}); "
+                             "the tunnel is up, open connections are kept", "warning")
+    else:
+        add_to_output_buffer(f"⚠️  SSH tunnel lost ({health['last_error']}); reconnecting...", "warning")
+
+def start_tunnel_monitor(descriptor):
+    """Supervise the active forwarder of a session until it is disconnected."""
+    global tunnel_monitor
+    stop_tunnel_monitor()
+    tunnel_monitor = TunnelMonitor(active_forwarder, descriptor["base_url"],
+                                   reconnect=lambda forwarder: reconnect_tunnel(forwarder, descriptor),
+                                   on_change=publish_tunnel_health).start()
+
+def stop_tunnel_monitor():
+    global tunnel_monitor
+    if tunnel_monitor is not None:
+        tunnel_monitor.stop()
+        tunnel_monitor = None
+
+def add_port_forward(remote_port, node=None, local_port=None, label=None):
+    """Forward a local port to ``node:remote_port`` (default: the session's node) over the gateway transport.
+
+    Returns the forward's stats; ``local_port`` is used if it is free, else any free port.
+    """
+    node = node or (active_session or {}).get("node")
+    if not node:
+        raise Exception("No node given and no active session")
+    forwarder = forward_manager.add(node, int(remote_port), int(local_port) if local_port else None, label)
+    add_to_output_buffer(f"🔀 Forwarding localhost:{forwarder.local_port} -> {forwarder.target}"
+                         + (f" ({label})" if label else ""), "success")
+    return forwarder.stats()
+
+def remove_port_forward(local_port):
+    if forward_manager.remove(int(local_port)):
+        add_to_output_buffer(f"Closed forward on localhost:{local_port}", "info")
+        return True
+    return False
+
+def list_port_forwards():
+    """Traffic counters of the extra forwards (the Jupyter tunnel is reported by get_tunnel_health)."""
+    return forward_manager.stats()
+
+def start_socks_proxy(local_port=1080, max_connections=64, max_per_destination=16):
+    """Serve a SOCKS5 proxy on localhost that connects to any host:port through the gateway.
+
+    Connections are ``direct-tcpip`` channels on the pooled transport, so no
+    ssh process is started. The proxy outlives a dropped gateway connection
+    on its own: the next request reconnects through the pool, with or
+    without a notebook session. Returns the running SocksProxy; calling it
+    again while the proxy runs returns that one.
+    """
+    global socks_proxy
+    if socks_proxy is not None and socks_proxy.is_alive():
+        return socks_proxy
+    stop_socks_proxy()
+    lease = port_registry.allocate(int(local_port), owner="socks5")
+    try:
+        proxy = SocksProxy(get_session_client().get_transport(), local_port=lease.port,
+                           max_connections=max_connections, max_per_destination=max_per_destination,
+                           get_transport=lambda: get_session_client().get_transport())
+        proxy.start(lease.detach())
+    except Exception:
+        port_registry.release(lease.port)
+        raise
+    socks_proxy = proxy
+    add_to_output_buffer(f"🌐 SOCKS5 proxy on localhost:{proxy.local_port}", "success")
+    return proxy
+
+def revive_socks_proxy():
+    """Restart the SOCKS5 proxy on its port if its relay loop stopped. Returns whether it did."""
+    global socks_proxy
+    old = socks_proxy
+    if old is None or old.is_alive():
+        return False
+    old.stop(timeout=1)
+    try:
+        socks_proxy = SocksProxy(get_session_client().get_transport(), local_port=old.local_port,
+                                 max_connections=old.max_connections,
+                                 max_per_destination=old.max_per_destination,
+                                 get_transport=old.get_transport).start()
+    except Exception as e:
+        print(f"Could not revive SOCKS5 proxy on port {old.local_port}: {e}")
+        return False
+    return True
+
+def stop_socks_proxy():
+    global socks_proxy
+    if socks_proxy is not None:
+        stop_forwarder(socks_proxy)
+        socks_proxy = None
+
+def get_socks_proxy_stats():
+    """Traffic, limits and per-destination counters of the SOCKS5 proxy, or None when it is not running."""
+    return socks_proxy.stats() if socks_proxy is not None else None
+
+def get_session_metrics():
+    """Phase timings and outcome counts across the sessions of this app run."""
+    return session_metrics.summary()
+
+def get_tunnel_health():
+    """Return the monitored tunnel's health and traffic metrics, or None without a session."""
+    return tunnel_monitor.health() if tunnel_monitor is not None else None
+
+def reattach_session(descriptor, log_output=add_to_output_buffer):
+    """Re-establish the tunnel to a persisted session without touching its Jupyter server.
+
+    Raises an Exception (and forgets the descriptor) if the server is no longer running.
+    """
+    global active_shell, active_forwarder, active_runner, active_session, session_connection_key
+    node = descriptor["node"]
+    
+    # Still attached in this process, e.g. after a page refresh
+    if (active_session is not None and SessionStore.key(active_session) == SessionStore.key(descriptor)
+            and active_forwarder is not None and active_forwarder.is_alive()):
+        session_events.publish(URL_READY, url=active_session["url"], local_port=active_session["local_port"],
+                               remote_port=active_session["remote_port"], node=node)
+        log_output(f"Session on {node} is still attached", "success")
+        log_output(f"Jupyter Notebook URL: {active_session['url']}", "success")
+        return {
+            "success": True,
+            "url": active_session["url"],
+            "message": f"🟢 Reattached to Jupyter Notebook at {active_session['url']}",
+            "port": str(active_session["remote_port"]),
+            "token": active_session["token"],
+            "forwarder": active_forwarder
+        }
+    
+    session_events.start_phase("reattach", node=node)
+    log_output(f"Reattaching to Jupyter (pid {descriptor['pid']}) on {node}...", "info")
+    establish_ssh_session(descriptor["username"], descriptor["gateway"])
+    
+    stop_tunnel_monitor()
+    if active_forwarder:
+        stop_forwarder(active_forwarder)
+        active_forwarder = None
+    lease = reserve_local_port(descriptor["local_port"], log_output)
+    local_port = lease.port
+    session_events.publish(PORT_CHOSEN, local_port=local_port)
+    try:
+        return _reattach_on_port(descriptor, lease, log_output)
+    except Exception:
+        if lease.socket is not None:
+            port_registry.release(local_port)
+        raise
+
+def _reattach_on_port(descriptor, lease, log_output):
+    global active_shell, active_forwarder, active_runner, active_session, session_connection_key
+    node = descriptor["node"]
+    local_port = lease.port
+    ssh_client = ssh_pool.acquire(*current_connection_key)
+    if session_connection_key is not None:
+        ssh_pool.release(*session_connection_key)
+    session_connection_key = current_connection_key
+    
+    runner = open_node_session(ssh_client, node, descriptor["username"], log_output=log_output)
+    active_runner = runner
+    if not descriptor.get("pid") or not is_server_running(runner, descriptor["pid"]):
+        session_store.remove(descriptor)
+        raise Exception(f"Jupyter server (pid {descriptor['pid']}) is no longer running on {node}")
+    
+    # Commands from the page run in the session's environment, as after a launch
+    prelude = activation_prelude(descriptor, descriptor["env_name"])
+    if isinstance(runner, ExecRunner):
+        runner.prelude = prelude
+        if descriptor.get("session_name"):
+            log_follower = runner.start(log_follow_command(node, descriptor["session_name"], lines=20))
+            active_shell = log_follower.shell
+            start_output_pump(log_follower)
+    else:
+        runner.run(" && ".join(prelude))
+        active_shell = runner.shell
+    
+    forwarder, notebook_url = open_jupyter_tunnel(ssh_client, node, descriptor["remote_port"], local_port,
+                                                  descriptor["base_url"], descriptor["token"], log_output,
+                                                  probe_timeout=5, listen_socket=lease.detach())
+    active_forwarder = forwarder
+    active_session = session_store.save(dict(descriptor, local_port=local_port, url=notebook_url))
+    start_tunnel_monitor(active_session)
+    session_events.finish_phase()
+    session_events.publish(URL_READY, url=notebook_url, local_port=local_port,
+                           remote_port=descriptor["remote_port"], node=node)
+    log_output(f"Jupyter Notebook URL: {notebook_url}", "success")
+    
+    return {
+        "success": True,
+        "url": notebook_url,
+        "message": f"🟢 Reattached to Jupyter Notebook at {notebook_url}",
+        "port": str(descriptor["remote_port"]),
+        "token": descriptor["token"],
+        "forwarder": forwarder
+    }
+
+def get_saved_session():
+    """Return the attached session's descriptor, or the most recently persisted one."""
+    return active_session or session_store.latest()
+
+def start_output_pump(engine):
+    """Copy a channel's output into the output buffer on a background thread.
+
+    Keeps the server's log visible and its channel drained so the SSH window
+    never fills up and blocks the remote process.
+    """
+    def pump():
+        pending = engine.buffer
+        engine.buffer = ""
+        try:
+            while True:
+                lines = pending.split("\n")
+                pending = lines.pop()
+                for line in lines:
+                    line = line.rstrip("\r")
+                    if line.strip():
+                        add_to_output_buffer(line, "output")
+                chunk = engine.shell.recv(4096)
+                if not chunk:
+                    break
+                pending += chunk.decode("utf-8", errors="replace")
+        except Exception as e:
+            print(f"Output pump stopped: {e}")
+        if pending.strip():
+            add_to_output_buffer(pending.strip(), "output")
+
+    engine.shell.settimeout(None)
+    thread = threading.Thread(target=pump, name="jupyter-output")
+    thread.daemon = True
+    thread.start()
+    return thread
+
 def send_command_to_active_shell(command):
     """Send a command to the active shell session."""
     global active_shell
+    if isinstance(active_runner, ExecRunner):
+        # On a direct node connection commands get their own exec channel instead
+        # of being typed into the channel Jupyter is running in
+        add_to_output_buffer(f"$ {command}", "command")
+        try:
+            result = active_runner.run(command, timeout=30)
+        except Exception as e:
+            add_to_output_buffer(f"Error sending command: {str(e)}", "error")
+            return False
+        for line in (result.output + "\n" + result.error).splitlines():
+            if line.strip():
+                add_to_output_buffer(line, "output")
+        if not result.ok:
+            add_to_output_buffer(f"Exit code {result.exit_code}", "warning")
+        return True
+    
     if active_shell is None:
         add_to_output_buffer("No active shell session", "error")
         return False
@@ -539,79 +906,66 @@ def send_command_to_active_shell(command):
         add_to_output_buffer(f"Error sending command: {str(e)}", "error")
         return False
 
-def kill_processes_on_port_with_timeout(port, timeout=3):
-    """Kill processes on a port with timeout to avoid hanging."""
-    import signal
-    
-    killed_processes = []
+def stop_session_server(descriptor, runner, log_output=add_to_output_buffer):
+    """Stop the detached Jupyter server of a session and remove its files on the node.
+
+    Only servers this app started (with a pid file in its runtime directory)
+    are stopped. Returns whether one was.
+    """
+    node, pid = descriptor["node"], descriptor.get("pid")
+    if not pid:
+        return False
     try:
-        def timeout_handler(signum, frame):
-            raise TimeoutError(f"Port cleanup timed out after {timeout} seconds")
-        
-        # Set alarm for timeout (Unix/Linux only)
-        if hasattr(signal, 'SIGALRM'):
-            signal.signal(signal.SIGALRM, timeout_handler)
-            signal.alarm(timeout)
-        
-        try:
-            for proc in psutil.process_iter(['pid', 'name', 'connections']):
-                try:
-                    connections = proc.info['connections']
-                    if connections:
-                        for conn in connections:
-                            if hasattr(conn, 'laddr') and conn.laddr and conn.laddr.port == port:
-                                # Try to terminate gracefully first
-                                proc.terminate()
-                                try:
-                                    proc.wait(timeout=1)  # Wait 1 second for graceful termination
-                                except psutil.TimeoutExpired:
-                                    proc.kill()  # Force kill if it doesn't terminate
-                                killed_processes.append(f"PID {proc.info['pid']} ({proc.info['name']})")
-                                break
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-                    
-        except TimeoutError:
-            add_to_output_buffer(f"Port {port} cleanup timed out - continuing anyway", "warning")
-        finally:
-            # Cancel the alarm
-            if hasattr(signal, 'SIGALRM'):
-                signal.alarm(0)
-                
+        result = runner.run(stop_server_command(node, pid), timeout=30)
     except Exception as e:
-        add_to_output_buffer(f"Error during port cleanup: {e}", "warning")
-    
-    return killed_processes
+        log_output(f"Could not stop Jupyter (pid {pid}) on {node}: {e}", "warning")
+        return False
+    session_name = parse_stopped_session(result.output)
+    if session_name is None:
+        log_output(f"No detached Jupyter server of this app to stop (pid {pid})", "info")
+        return False
+    log_output(f"Stopped Jupyter (pid {pid}, session {session_name}) on {node}", "success")
+    return True
+
+def disconnect_session(stop_server=True):
+    """Disconnect the current Jupyter session, clean up resources and release the local ports this app owns.
 
-def disconnect_session():
-    """Disconnect the current Jupyter session and clean up resources with enhanced browser tab detection."""
-    global active_shell, active_tunnel_process
+    With ``stop_server`` the session's detached Jupyter server is stopped as
+    well; it only outlives the app when the connection drops or the app exits.
+    """
+    global active_shell, active_forwarder, active_runner, active_node_client, active_session, session_connection_key
     
     try:
         print("Starting session disconnect...")
         add_to_output_buffer("Disconnecting session...", "info")
-        
-        # Kill any active tunnel processes with timeout
-        if 'active_tunnel_process' in globals() and active_tunnel_process:
-            print("Terminating tunnel process...")
-            add_to_output_buffer("Terminating SSH tunnel...", "warning")
+        stop_tunnel_monitor()
+        tunnel_port = active_forwarder.local_port if active_forwarder else None
+        closed = forward_manager.stop_all()
+        if closed:
+            add_to_output_buffer(f"Closed {closed} port forward(s)", "info")
+        
+        if stop_server and active_session is not None and active_runner is not None:
+            stop_session_server(active_session, active_runner)
+        
+        # The user ended the session, so a reload should not reattach to it
+        if active_session is not None:
+            session_store.remove(active_session)
+            active_session = None
+        
+        # Stop the local port forwarder
+        if active_forwarder:
+            print("Stopping port forwarder...")
+            add_to_output_buffer("Closing SSH tunnel...", "warning")
             try:
-                active_tunnel_process.terminate()
-                # Wait with timeout
-                try:
-                    active_tunnel_process.wait(timeout=3)
-                    add_to_output_buffer("SSH tunnel terminated gracefully", "success")
-                except subprocess.TimeoutExpired:
-                    add_to_output_buffer("SSH tunnel force-killed (timeout)", "warning")
-                    active_tunnel_process.kill()
-                    try:
-                        active_tunnel_process.wait(timeout=2)
-                    except subprocess.TimeoutExpired:
-                        add_to_output_buffer("SSH tunnel process may still be running", "warning")
+                stop_forwarder(active_forwarder, timeout=3)
+                stats = active_forwarder.stats()
+                add_to_output_buffer(
+                    f"SSH tunnel closed ({stats['total_connections']} connections, "
+                    f"{stats['bytes_in']} bytes in, {stats['bytes_out']} bytes out)", "success")
             except Exception as e:
-                add_to_output_buffer(f"Error terminating tunnel: {e}", "warning")
+                add_to_output_buffer(f"Error closing tunnel: {e}", "warning")
             finally:
-                active_tunnel_process = None
+                active_forwarder = None
         
         # Close the active shell with timeout
         if active_shell:
@@ -629,68 +983,45 @@ def disconnect_session():
             finally:
                 active_shell = None
         
-        # Enhanced port cleanup with better browser tab detection
-        print("Cleaning up ports with timeout...")
-        add_to_output_buffer("Cleaning up ports (with timeout)...", "info")
-        
-        cleanup_successful = 0
-        cleanup_failed = 0
-        browser_tabs_detected = 0
-        
-        for port in range(8888, 8893):  # Reduced range for faster cleanup
+        # Close the direct connection to the node
+        active_runner = None
+        if active_node_client is not None:
             try:
-                # Check what's using the port before attempting cleanup
-                port_usage = analyze_port_usage(port)
-                
-                if port_usage["is_free"]:
-                    add_to_output_buffer(f"Port {port}: already free", "info")
-                    continue
-                
-                # Attempt cleanup
-                killed = kill_processes_on_port_with_timeout(port, timeout=2)
-                
-                if killed:
-                    print(f"Cleaned up port {port}: {killed}")
-                    add_to_output_buffer(f"Port {port}: {', '.join(killed)}", "success")
-                    cleanup_successful += 1
-                    
-                    # Verify port is now free
-                    time.sleep(0.5)
-                    if not is_port_free(port):
-                        add_to_output_buffer(f"Port {port}: still in use after cleanup", "warning")
-                        cleanup_failed += 1
-                else:
-                    # Check if it's a browser tab
-                    if port_usage["browser_connection"]:
-                        add_to_output_buffer(f"Port {port}: browser tab still open (close manually)", "warning")
-                        browser_tabs_detected += 1
-                    else:
-                        add_to_output_buffer(f"Port {port}: in use by {port_usage['process_name']}", "warning")
-                    cleanup_failed += 1
-                    
+                active_node_client.close()
             except Exception as e:
-                print(f"Error cleaning port {port}: {e}")
-                add_to_output_buffer(f"Port {port}: cleanup error - {e}", "warning")
-                cleanup_failed += 1
-        
-        # Enhanced summary messages
-        if cleanup_failed > 0:
-            summary_msg = f"Port cleanup: {cleanup_successful} freed, {cleanup_failed} still in use"
-            add_to_output_buffer(summary_msg, "warning")
-            
-            if browser_tabs_detected > 0:
-                browser_msg = f"⚠️  {browser_tabs_detected} browser tab(s) detected. Please close Jupyter notebook tabs manually."
-                add_to_output_buffer(browser_msg, "warning")
-                add_to_output_buffer("💡 Tip: Look for tabs with 'localhost:888X' in your browser", "info")
-            
-            if cleanup_failed - browser_tabs_detected > 0:
-                other_processes = cleanup_failed - browser_tabs_detected
-                add_to_output_buffer(f"⚠️  {other_processes} port(s) blocked by other processes", "warning")
-        else:
-            add_to_output_buffer(f"✅ Port cleanup: {cleanup_successful} ports freed", "success")
+                print(f"Error closing node connection: {e}")
+            active_node_client = None
+        
+        # Hand the session's reference on the pooled transport back
+        if session_connection_key is not None:
+            ssh_pool.release(*session_connection_key)
+            session_connection_key = None
+        
+        # Release the local ports this app allocated; ports held by other programs are left alone
+        owned = [entry["port"] for entry in port_registry.owned()]
+        if tunnel_port is not None:
+            owned.append(tunnel_port)
+        for stopped in port_registry.cleanup(timeout=2):
+            add_to_output_buffer(f"Stopped {stopped}", "success")
+        
+        # One snapshot of the connection table answers for every released port
+        index = PortIndex.snapshot()
+        browser_tabs = 0
+        for port in sorted(set(owned)):
+            usage = index.usage(port)
+            if usage["is_free"]:
+                continue
+            if usage["browser_connection"]:
+                browser_tabs += 1
+                add_to_output_buffer(f"Port {port}: browser tab still open (close manually)", "warning")
+            else:
+                add_to_output_buffer(f"Port {port}: in use by {usage['process_name']}", "warning")
+        if owned:
+            add_to_output_buffer(f"✅ Port cleanup: {len(set(owned))} port(s) released", "success")
         
         # Final status message
-        if browser_tabs_detected > 0:
+        session_events.publish(SESSION_STOPPED)
+        if browser_tabs > 0:
             add_to_output_buffer("🔄 Session disconnected (manual browser cleanup needed)", "warning")
         else:
             add_to_output_buffer("✅ Session disconnected successfully", "success")
@@ -701,194 +1032,56 @@ def disconnect_session():
         print(f"Error during disconnect: {e}")
         add_to_output_buffer(f"Error during disconnect: {e}", "error")
 
-def is_port_free(port, host='localhost'):
-    """Check if a port is free, with enhanced checking for lingering connections."""
+def is_port_free(port, host='localhost', index=None):
+    """Check if a port is free: it can be bound and no socket on it is listening or connected.
+
+    Pass a PortIndex to reuse one connection-table snapshot across several ports.
+    """
     import socket
-    import time
     
-    # First check: basic socket connection
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         try:
             s.bind((host, port))
-            s.listen(1)
         except OSError:
-            # Port is in use
             return False
     
-    # Second check: look for processes using this port
-    try:
-        for conn in psutil.net_connections():
-            if conn.laddr.port == port and conn.status in ['LISTEN', 'ESTABLISHED']:
-                return False
-    except (psutil.AccessDenied, AttributeError):
-        # If we can't check processes, rely on socket test
-        pass
-    
-    # Third check: try to actually connect to see if something is listening
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.settimeout(1)
-        result = s.connect_ex((host, port))
-        if result == 0:
-            # Something is listening on this port
-            return False
-    
-    return True
+    # Lingering client connections (e.g. a browser tab) do not stop the bind above
+    index = PortIndex.snapshot() if index is None else index
+    return not index.in_use(port)
 
-def find_free_port(start_port=8888, max_attempts=20):
-    """Find a free port starting from start_port with detailed feedback."""
-    port = start_port
-    attempted_ports = []
-    browser_ports = []
-    
-    for attempt in range(max_attempts):
-        attempted_ports.append(port)
-        
-        if is_port_free(port):
-            if len(attempted_ports) > 1:
-                add_to_output_buffer(f"🎯 Found free port {port} after checking {len(attempted_ports)} ports", "success")
-            return port
-        else:
-            # Analyze what's using this port
-            port_usage = analyze_port_usage(port)
-            
-            if port_usage["browser_connection"]:
-                browser_ports.append(port)
-                add_to_output_buffer(f"🌐 Port {port} in use (browser tab)", "info")
-            else:
-                add_to_output_buffer(f"⚙️  Port {port} in use ({port_usage['process_name']})", "info")
-        
-        port += 1
-    
-    # Provide helpful error message
-    error_msg = f"Could not find a free port after checking {max_attempts} ports ({start_port}-{port-1})"
-    if browser_ports:
-        error_msg += f"\n🌐 Browser tabs detected on ports: {', '.join(map(str, browser_ports))}"
-        error_msg += "\n💡 Close browser tabs to free up ports"
-    
-    raise Exception(error_msg)
+def reserve_local_port(preferred_port=8888, log_output=add_to_output_buffer):
+    """Reserve a local port for a tunnel: the preferred one if it is free, else one the kernel picks.
 
-def smart_port_cleanup_and_find(preferred_port=8888):
-    """Smart port cleanup with enhanced feedback and browser tab detection."""
-    
-    # First, try the preferred port
-    if is_port_free(preferred_port):
-        add_to_output_buffer(f"✅ Port {preferred_port} is available", "success")
-        return preferred_port
-    
-    # Analyze what's using the preferred port
-    port_usage = analyze_port_usage(preferred_port)
-    
-    if port_usage["browser_connection"]:
-        add_to_output_buffer(f"🌐 Port {preferred_port} in use by browser tab", "warning")
-        add_to_output_buffer("💡 You may close the browser tab to reuse this port", "info")
+    Nothing that holds the preferred port is stopped; the returned PortLease
+    keeps the port until a forwarder adopts its socket.
+    """
+    lease = port_registry.allocate(preferred_port)
+    if lease.port == preferred_port:
+        log_output(f"✅ Port {preferred_port} is available", "success")
     else:
-        add_to_output_buffer(f"⚠️  Port {preferred_port} in use by {port_usage['process_name']}", "warning")
-    
-    # Try to clean up the preferred port with timeout
-    add_to_output_buffer(f"🔧 Attempting to clean up port {preferred_port}...", "info")
-    try:
-        killed = kill_processes_on_port_with_timeout(preferred_port, timeout=3)
-        if killed:
-            add_to_output_buffer(f"✅ Cleaned up port {preferred_port}: {', '.join(killed)}", "success")
-            time.sleep(1)  # Brief wait for cleanup
-            
-            # Check if it's now free
-            if is_port_free(preferred_port):
-                add_to_output_buffer(f"🎉 Port {preferred_port} is now available", "success")
-                return preferred_port
-            else:
-                add_to_output_buffer(f"⚠️  Port {preferred_port} still in use after cleanup", "warning")
-        else:
-            add_to_output_buffer(f"❌ Could not clean up port {preferred_port}", "warning")
-    except Exception as e:
-        add_to_output_buffer(f"❌ Cleanup attempt failed: {e}", "warning")
-    
-    # If still not free, find an alternative
-    add_to_output_buffer(f"🔍 Finding alternative port (starting from {preferred_port + 1})...", "info")
-    
-    try:
-        alternative_port = find_free_port(preferred_port + 1)
-        add_to_output_buffer(f"✅ Using alternative port: {alternative_port}", "success")
-        add_to_output_buffer(f"🔗 Jupyter will be available at: localhost:{alternative_port}", "info")
-        return alternative_port
-    except Exception as e:
-        add_to_output_buffer(f"❌ Could not find alternative port: {e}", "error")
-        add_to_output_buffer("💡 Try closing browser tabs or restarting the application", "info")
-        raise
+        holder = analyze_port_usage(preferred_port)
+        if holder["browser_connection"]:
+            log_output(f"🌐 Port {preferred_port} in use by browser tab", "info")
+        elif not holder["is_free"]:
+            log_output(f"⚙️  Port {preferred_port} in use ({holder['process_name']})", "info")
+        log_output(f"✅ Using alternative port: {lease.port}", "success")
+    return lease
 
-def kill_processes_on_port(port):
-    """Kill any processes using the specified port."""
-    killed_processes = []
+def stop_forwarder(forwarder, timeout=2):
+    """Stop a port forwarder and give its local port back to the registry."""
     try:
-        for proc in psutil.process_iter(['pid', 'name', 'connections']):
-            try:
-                connections = proc.info['connections']
-                if connections:
-                    for conn in connections:
-                        if hasattr(conn, 'laddr') and conn.laddr and conn.laddr.port == port:
-                            proc.kill()
-                            killed_processes.append(f"PID {proc.info['pid']} ({proc.info['name']})")
-                            break
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-    except Exception as e:
-        print(f"Error killing processes on port {port}: {e}")
-    
-    return killed_processes
-
-def analyze_port_usage(port):
-    """Analyze what is using a specific port and detect browser connections."""
-    result = {
-        "is_free": True,
-        "browser_connection": False,
-        "process_name": "unknown",
-        "connection_type": "none",
-        "pid": None
-    }
-    
-    # First check if port is free with basic socket test
-    if is_port_free(port):
-        return result
-    
-    result["is_free"] = False
-    
+        forwarder.stop(timeout=timeout)
+    finally:
+        port_registry.release(forwarder.local_port)
+
+def analyze_port_usage(port, index=None):
+    """Analyze what is using a specific port and detect browser connections.
+
+    Pass a PortIndex to reuse one connection-table snapshot across several ports.
+    """
     try:
-        # Check for processes using this port
-        for proc in psutil.process_iter(['pid', 'name', 'connections']):
-            try:
-                connections = proc.info.get('connections', [])
-                if not connections:
-                    continue
-                    
-                for conn in connections:
-                    if hasattr(conn, 'laddr') and conn.laddr and conn.laddr.port == port:
-                        result["pid"] = proc.info['pid']
-                        result["process_name"] = proc.info['name']
-                        result["connection_type"] = conn.status
-                        
-                        # Detect browser connections based on process name and connection status
-                        browser_processes = ['chrome', 'firefox', 'edge', 'safari', 'msedge', 'chromium']
-                        if any(browser in result["process_name"].lower() for browser in browser_processes):
-                            result["browser_connection"] = True
-                        elif conn.status == 'ESTABLISHED' and result["process_name"] in ['jupyter-notebook', 'jupyter', 'python']:
-                            # This might be a browser connection to Jupyter
-                            result["browser_connection"] = True
-                        
-                        return result
-                        
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-                
-        # If we get here, port is in use but we couldn't identify the process
-        # Check network connections without process info
-        for conn in psutil.net_connections():
-            if hasattr(conn, 'laddr') and conn.laddr and conn.laddr.port == port:
-                result["connection_type"] = conn.status
-                if conn.status == 'ESTABLISHED':
-                    result["browser_connection"] = True  # Likely browser connection
-                break
-                
+        index = PortIndex.snapshot() if index is None else index
+        return index.usage(port)
     except Exception as e:
-        result["process_name"] = f"error: {e}"
-    
-    return result
\ No newline at end of file
+        return {"is_free": False, "browser_connection": False, "process_name": f"error: {e}",
+                "connection_type": "none", "pid": None}
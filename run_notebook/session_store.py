@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+SESSION_STATE_FILE = Path("jupyter_sessions.json")
+
+
+class SessionStore:
+    """Persistent descriptors of running notebook sessions.
+
+    A descriptor holds everything needed to reach a Jupyter server again
+    without touching it: gateway and user, node, remote port, token and base
+    URL, the server's pid and tmux/nohup session name, and the local port of
+    the tunnel. Descriptors survive a page refresh and an app restart.
+    """
+
+    def __init__(self, path=SESSION_STATE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._sessions = None
+
+    @staticmethod
+    def key(descriptor):
+        return "|".join([
+            f"{descriptor['username']}@{descriptor['gateway']}",
+            descriptor["node"],
+            descriptor.get("env_name") or "",
+            descriptor.get("dest_folder") or "",
+        ])
+
+    def _load(self):
+        if self._sessions is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._sessions = json.load(f)
+            except (OSError, ValueError):
+                self._sessions = {}
+        return self._sessions
+
+    def _save(self):
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            # Owner-only: descriptors hold server tokens
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._sessions, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save session state: {e}")
+
+    def save(self, descriptor):
+        descriptor = dict(descriptor, updated_at=time.time())
+        with self._lock:
+            self._load()[self.key(descriptor)] = descriptor
+            self._save()
+        return descriptor
+
+    def remove(self, descriptor):
+        with self._lock:
+            if self._load().pop(self.key(descriptor), None) is not None:
+                self._save()
+
+    def find(self, node, env_name, dest_folder, connection_key=None):
+        """Return the descriptor for a node/env/folder, optionally for one (username, gateway)."""
+        with self._lock:
+            sessions = list(self._load().values())
+        for descriptor in sorted(sessions, key=lambda d: d.get("updated_at", 0), reverse=True):
+            if (descriptor["node"], descriptor.get("env_name") or "", descriptor.get("dest_folder") or "") != \
+                    (node, env_name or "", dest_folder or ""):
+                continue
+            if connection_key is None or (descriptor["username"], descriptor["gateway"]) == tuple(connection_key):
+                return descriptor
+        return None
+
+    def latest(self):
+        """Return the most recently updated descriptor, or None."""
+        with self._lock:
+            sessions = list(self._load().values())
+        return max(sessions, key=lambda d: d.get("updated_at", 0), default=None)
@@ -0,0 +1,214 @@
+import socket
+import struct
+import threading
+import time
+
+from port_forward import ForwardedConnection, LocalPortForwarder
+
+SOCKS_VERSION = 5
+
+# Reply codes (RFC 1928)
+REPLY_SUCCEEDED = 0x00
+REPLY_GENERAL_FAILURE = 0x01
+REPLY_NOT_ALLOWED = 0x02
+REPLY_HOST_UNREACHABLE = 0x04
+REPLY_COMMAND_NOT_SUPPORTED = 0x07
+REPLY_ADDRESS_NOT_SUPPORTED = 0x08
+
+# Why the gateway refused a direct-tcpip channel (RFC 4254) -> the SOCKS reply for it
+_OPEN_FAILURE_REPLIES = {1: REPLY_NOT_ALLOWED, 2: REPLY_HOST_UNREACHABLE}
+
+
+def _recv_exact(sock, count):
+    data = b""
+    while len(data) < count:
+        chunk = sock.recv(count - len(data))
+        if not chunk:
+            raise ConnectionError("client closed the connection during the SOCKS handshake")
+        data += chunk
+    return data
+
+
+def _reply(sock, code):
+    # The bound address is not meaningful through a channel, so it is reported as 0.0.0.0:0
+    sock.sendall(bytes([SOCKS_VERSION, code, 0, 1, 0, 0, 0, 0, 0, 0]))
+
+
+def _new_destination(key):
+    return {"destination": key, "connections": 0, "active": 0, "failed": 0, "rejected": 0,
+            "bytes_in": 0, "bytes_out": 0, "last_used": None}
+
+
+class SocksProxy(LocalPortForwarder):
+    """In-process equivalent of ``ssh -D local_port``: a SOCKS5 proxy over an SSH transport.
+
+    Every accepted connection negotiates SOCKS5 (no authentication, CONNECT
+    only) on its opener thread and then gets a ``direct-tcpip`` channel to
+    the host and port it asked for; the bytes are relayed by
+    LocalPortForwarder's selector loop. Host names are passed to the gateway
+    unresolved, so nodes that only resolve behind the gateway are reachable.
+    At most ``max_connections`` relayed connections are open at once, and at
+    most ``max_per_destination`` to one host:port. A request over a limit
+    waits up to ``open_timeout`` seconds for a slot and is then refused.
+    ``stats`` adds counters per destination.
+
+    With ``get_transport`` the proxy supervises itself: it keeps listening
+    when its transport dies, and the next request fetches a live one (the
+    pool reconnects the gateway), whether or not a notebook session runs.
+    """
+
+    def __init__(self, transport, local_port=1080, local_host="127.0.0.1", max_connections=64,
+                 max_per_destination=16, open_timeout=10, handshake_timeout=10, buffer_size=65536,
+                 get_transport=None):
+        super().__init__(transport, "*", 0, local_port=local_port, local_host=local_host,
+                         open_timeout=open_timeout, buffer_size=buffer_size)
+        self.get_transport = get_transport
+        self.stop_with_transport = get_transport is None
+        self.transport_reconnects = 0
+        self._transport_lock = threading.Lock()
+        self.max_connections = max_connections
+        self.max_per_destination = max_per_destination
+        self.handshake_timeout = handshake_timeout
+        self.rejected_connections = 0
+        self._slots = threading.Condition()
+        self._active = 0
+        self._destinations = {}  # "host:port" -> counters
+
+    @property
+    def target(self):
+        return "SOCKS5"
+
+    def _handshake(self, client_sock):
+        """Read the greeting and the request. Returns (host, port), or None after replying with an error."""
+        version, method_count = _recv_exact(client_sock, 2)
+        if version != SOCKS_VERSION:
+            return None
+        if 0 not in _recv_exact(client_sock, method_count):
+            client_sock.sendall(bytes([SOCKS_VERSION, 0xFF]))  # No acceptable authentication method
+            return None
+        client_sock.sendall(bytes([SOCKS_VERSION, 0]))
+
+        _, command, _, address_type = _recv_exact(client_sock, 4)
+        if address_type == 1:
+            host = socket.inet_ntop(socket.AF_INET, _recv_exact(client_sock, 4))
+        elif address_type == 3:
+            host = _recv_exact(client_sock, _recv_exact(client_sock, 1)[0]).decode("utf-8", "replace")
+        elif address_type == 4:
+            host = socket.inet_ntop(socket.AF_INET6, _recv_exact(client_sock, 16))
+        else:
+            _reply(client_sock, REPLY_ADDRESS_NOT_SUPPORTED)
+            return None
+        port = struct.unpack("!H", _recv_exact(client_sock, 2))[0]
+        if command != 1:
+            _reply(client_sock, REPLY_COMMAND_NOT_SUPPORTED)
+            return None
+        return host, port
+
+    def _count(self, key, field):
+        with self._slots:
+            counters = self._destinations.setdefault(key, _new_destination(key))
+            counters[field] += 1
+            counters["last_used"] = time.time()
+
+    def _acquire(self, key):
+        """Take a connection slot for ``key``, waiting up to open_timeout. Returns whether it got one."""
+        deadline = time.monotonic() + self.open_timeout
+        with self._slots:
+            counters = self._destinations.setdefault(key, _new_destination(key))
+            while self._active >= self.max_connections or counters["active"] >= self.max_per_destination:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping.is_set():
+                    return False
+                self._slots.wait(remaining)
+            self._active += 1
+            counters["active"] += 1
+            return True
+
+    def _release(self, key, bytes_in=0, bytes_out=0):
+        with self._slots:
+            self._active -= 1
+            counters = self._destinations[key]
+            counters["active"] -= 1
+            counters["bytes_in"] += bytes_in
+            counters["bytes_out"] += bytes_out
+            self._slots.notify_all()
+
+    def _live_transport(self):
+        """The transport to open channels on, replaced through ``get_transport`` if it died."""
+        with self._transport_lock:
+            if not self.transport.is_active() and self.get_transport is not None:
+                self.transport = self.get_transport()
+                self.transport_reconnects += 1
+                print(f"SOCKS {self.local_port}: SSH transport replaced")
+            return self.transport
+
+    def _refuse(self, client_sock, code):
+        try:
+            _reply(client_sock, code)
+        except OSError:
+            pass
+        client_sock.close()
+
+    def _open_channel(self, client_sock, peer):
+        try:
+            client_sock.settimeout(self.handshake_timeout)
+            destination = self._handshake(client_sock)
+        except (OSError, ValueError) as e:
+            print(f"SOCKS {self.local_port}: handshake with {peer} failed: {e}")
+            destination = None
+        if destination is None:
+            self.failed_connections += 1
+            client_sock.close()
+            return
+
+        key = f"{destination[0]}:{destination[1]}"
+        if not self._acquire(key):
+            self.rejected_connections += 1
+            self._count(key, "rejected")
+            self._refuse(client_sock, REPLY_NOT_ALLOWED)
+            return
+        try:
+            channel = self._live_transport().open_channel("direct-tcpip", destination, peer,
+                                                          timeout=self.open_timeout)
+        except Exception as e:
+            print(f"SOCKS {self.local_port} -> {key}: channel open failed: {e}")
+            self._release(key)
+            self.failed_connections += 1
+            self._count(key, "failed")
+            self._refuse(client_sock, _OPEN_FAILURE_REPLIES.get(getattr(e, "code", None), REPLY_GENERAL_FAILURE))
+            return
+        try:
+            _reply(client_sock, REPLY_SUCCEEDED)
+            client_sock.settimeout(None)
+        except OSError:
+            channel.close()
+            client_sock.close()
+            self._release(key)
+            return
+        self._count(key, "connections")
+        self._queue_connection(ForwardedConnection(client_sock, channel, peer, destination))
+
+    def _close_connection(self, selector, conn):
+        open_before = id(conn) in self._connections
+        super()._close_connection(selector, conn)
+        if open_before and id(conn) not in self._connections:
+            self._release(f"{conn.destination[0]}:{conn.destination[1]}", conn.bytes_in, conn.bytes_out)
+
+    def stats(self):
+        """Forwarder stats plus the limits, rejected connections and counters per destination."""
+        stats = super().stats()
+        with self._slots:
+            destinations = {key: dict(counters) for key, counters in self._destinations.items()}
+        for conn in stats["connections"]:
+            counters = destinations.get(conn["destination"])
+            if counters is not None:
+                counters["bytes_in"] += conn["bytes_in"]
+                counters["bytes_out"] += conn["bytes_out"]
+        stats.update(
+            rejected_connections=self.rejected_connections,
+            transport_reconnects=self.transport_reconnects,
+            max_connections=self.max_connections,
+            max_per_destination=self.max_per_destination,
+            destinations=sorted(destinations.values(), key=lambda d: d["bytes_in"] + d["bytes_out"], reverse=True),
+        )
+        return stats
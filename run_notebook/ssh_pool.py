@@ -0,0 +1,271 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import paramiko
+
+
+class PooledConnection:
+    """A pooled SSH client together with its bookkeeping and liveness state."""
+    __slots__ = ("key", "client", "refcount", "created", "last_used", "lock",
+                 "last_seen", "rtt", "probe_started")
+
+    def __init__(self, key):
+        self.key = key
+        self.client = None
+        self.refcount = 0
+        self.created = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()  # Serialises (re)connecting this key
+        self.last_seen = None  # When the server last answered a keepalive
+        self.rtt = None  # Smoothed keepalive round-trip time in seconds
+        self.probe_started = None  # Set while a keepalive is outstanding
+
+    @property
+    def transport(self):
+        return self.client.get_transport() if self.client is not None else None
+
+    def is_connected(self):
+        transport = self.transport
+        return transport is not None and transport.is_active()
+
+    def is_healthy(self, dead_after):
+        """O(1) liveness answer from the keepalive bookkeeping, no remote call."""
+        if not self.is_connected():
+            return False
+        now = time.monotonic()
+        if self.probe_started is not None and now - self.probe_started > dead_after:
+            return False  # The transport is up but the server stopped answering
+        return self.last_seen is not None and now - self.last_seen <= dead_after
+
+    def record_reply(self, started, answered):
+        sample = answered - started
+        self.rtt = sample if self.rtt is None else 0.8 * self.rtt + 0.2 * sample
+        self.last_seen = answered
+        self.probe_started = None
+
+    def close(self):
+        if self.client is not None:
+            try:
+                self.client.close()
+            except Exception as e:
+                print(f"Error closing pooled connection {self.key}: {e}")
+            self.client = None
+
+
+class SSHConnectionPool:
+    """SSH connections keyed by (username, gateway) with reference counting.
+
+    Callers ``acquire`` a key to keep its transport alive and ``release`` it when
+    done. Released connections stay open for ``idle_timeout`` seconds so the next
+    page or launch reuses the authenticated transport instead of reconnecting.
+    """
+
+    def __init__(self, max_connections=4, idle_timeout=600, connect_timeout=15, reap_interval=30,
+                 keepalive_interval=15, dead_after=45):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        self.reap_interval = reap_interval
+        self.keepalive_interval = keepalive_interval
+        self.dead_after = dead_after
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def _connect(self, entry):
+        username, gateway = entry.key
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=gateway, username=username, timeout=self.connect_timeout)
+        entry.client = client
+        entry.created = entry.last_seen = time.monotonic()
+        entry.rtt = entry.probe_started = None
+        print(f"Opened pooled SSH connection to {username}@{gateway}")
+        self._start_keepalive(entry, client)
+
+    def _start_keepalive(self, entry, client):
+        """Probe the transport with keepalive global requests in the background.
+
+        Each reply refreshes ``last_seen`` and the smoothed RTT, so health checks
+        on the hot path only read those fields. The probe runs on its own thread
+        because paramiko blocks until the server answers or the transport dies.
+        """
+        def probe():
+            transport = client.get_transport()
+            while entry.client is client and transport.is_active():
+                started = time.monotonic()
+                entry.probe_started = started
+                transport.global_request("keepalive@openssh.com", wait=True)
+                if not transport.is_active():
+                    break
+                entry.record_reply(started, time.monotonic())
+                time.sleep(self.keepalive_interval)
+            print(f"Keepalive stopped for {entry.key[0]}@{entry.key[1]}")
+
+        thread = threading.Thread(target=probe, name=f"ssh-keepalive-{entry.key[1]}")
+        thread.daemon = True
+        thread.start()
+
+    def _entry(self, username, gateway, reference=False):
+        """Return the entry for a key, making room for it if the pool is full.
+
+        With ``reference`` the entry's refcount is taken under the pool lock, so
+        it cannot be reaped or evicted before the caller has connected it.
+        """
+        key = (username, gateway)
+        with self._lock:
+            entry = self._connections.get(key)
+            if entry is not None:
+                entry.refcount += int(reference)
+                return entry
+            if len(self._connections) >= self.max_connections:
+                idle = [e for e in self._connections.values() if e.refcount == 0]
+                if not idle:
+                    raise Exception(f"SSH connection pool exhausted ({self.max_connections} connections in use)")
+                victim = min(idle, key=lambda e: e.last_used)
+                del self._connections[victim.key]
+                victim.close()
+            entry = PooledConnection(key)
+            entry.refcount = int(reference)
+            self._connections[key] = entry
+        self._start_reaper()
+        return entry
+
+    def _ensure_connected(self, entry):
+        """Connect a referenced entry if needed; the reference keeps the reaper and eviction off it."""
+        with entry.lock:
+            if not entry.is_healthy(self.dead_after):
+                entry.close()
+                self._connect(entry)
+            with self._lock:
+                removed = self._connections.get(entry.key) is not entry
+            if removed:
+                # close() or close_all() ran while we were connecting
+                entry.close()
+                raise Exception(f"SSH connection {entry.key[0]}@{entry.key[1]} was closed while connecting")
+            entry.last_used = time.monotonic()
+            return entry.client
+
+    def _unreference(self, entry):
+        with self._lock:
+            entry.refcount = max(0, entry.refcount - 1)
+            entry.last_used = time.monotonic()
+
+    def get(self, username, gateway):
+        """Return a connected client for the key, reconnecting if the transport died."""
+        entry = self._entry(username, gateway, reference=True)
+        try:
+            return self._ensure_connected(entry)
+        finally:
+            self._unreference(entry)
+
+    def acquire(self, username, gateway):
+        """Take a reference on the key and return its connected client."""
+        entry = self._entry(username, gateway, reference=True)
+        try:
+            return self._ensure_connected(entry)
+        except Exception:
+            self._unreference(entry)
+            raise
+
+    def release(self, username, gateway):
+        """Drop a reference; the connection stays pooled until it idles out."""
+        with self._lock:
+            entry = self._connections.get((username, gateway))
+        if entry is not None:
+            self._unreference(entry)
+
+    @contextmanager
+    def borrow(self, username, gateway):
+        """Hold a reference for the duration of a ``with`` block."""
+        client = self.acquire(username, gateway)
+        try:
+            yield client
+        finally:
+            self.release(username, gateway)
+
+    def is_connected(self, username, gateway):
+        entry = self._connections.get((username, gateway))
+        return entry is not None and entry.is_connected()
+
+    def is_healthy(self, username, gateway):
+        """Return whether the key's transport is up and answering keepalives."""
+        entry = self._connections.get((username, gateway))
+        return entry is not None and entry.is_healthy(self.dead_after)
+
+    def health(self, username, gateway):
+        """Return a snapshot of the key's liveness: healthy flag, RTT and last-seen age."""
+        entry = self._connections.get((username, gateway))
+        if entry is None:
+            return {"healthy": False, "rtt": None, "last_seen_age": None, "refcount": 0}
+        last_seen = entry.last_seen
+        return {
+            "healthy": entry.is_healthy(self.dead_after),
+            "rtt": entry.rtt,
+            "last_seen_age": time.monotonic() - last_seen if last_seen is not None else None,
+            "refcount": entry.refcount,
+        }
+
+    def evict_idle(self):
+        """Close connections that have been unreferenced for longer than idle_timeout."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [e for e in self._connections.values()
+                       if e.refcount == 0 and now - e.last_used > self.idle_timeout]
+            for entry in expired:
+                del self._connections[entry.key]
+        for entry in expired:
+            print(f"Evicting idle SSH connection {entry.key[0]}@{entry.key[1]}")
+            entry.close()
+        return len(expired)
+
+    def close(self, username, gateway):
+        """Close a connection immediately, regardless of its references."""
+        with self._lock:
+            entry = self._connections.pop((username, gateway), None)
+        if entry is not None:
+            entry.close()
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._connections.values())
+            self._connections.clear()
+        for entry in entries:
+            entry.close()
+
+    def _start_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+
+        def reap():
+            while True:
+                time.sleep(self.reap_interval)
+                try:
+                    self.evict_idle()
+                except Exception as e:
+                    print(f"Error evicting idle SSH connections: {e}")
+
+        self._reaper = threading.Thread(target=reap, name="ssh-pool-reaper")
+        self._reaper.daemon = True
+        self._reaper.start()
+
+
+def connect_via_jump(gateway_client, host, username, port=22, timeout=15):
+    """Open an SSH client to ``host`` tunnelled through the gateway (like ProxyJump).
+
+    The nested transport runs over a direct-tcpip channel on the gateway's
+    transport, so no interactive shell or PTY sits between us and the node.
+    """
+    channel = gateway_client.get_transport().open_channel(
+        "direct-tcpip", (host, port), ("127.0.0.1", 0), timeout=timeout
+    )
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        client.connect(hostname=host, port=port, username=username, sock=channel,
+                       timeout=timeout, banner_timeout=timeout, auth_timeout=timeout)
+    except Exception:
+        channel.close()
+        raise
+    return client
@@ -0,0 +1,53 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from output_log import OutputLog
+
+
+def test_delta_with_concurrent_writer_loses_nothing():
+    count = 20000
+    log = OutputLog(capacity=count)
+    writer = threading.Thread(target=lambda: [log.append(f"line {i}") for i in range(count)])
+
+    seen = []
+    cursor = 0
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Interleave the threads as often as possible
+    try:
+        writer.start()
+        while writer.is_alive() or cursor < log.last_seq:
+            delta = log.delta(cursor)
+            seen.extend(entry["seq"] for entry in delta["entries"])
+            cursor = delta["seq"]
+        writer.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert seen == list(range(1, count + 1))
+
+
+def test_delta_after_clear_resets():
+    log = OutputLog(capacity=10)
+    log.append("old")
+    cursor = log.delta(0)["seq"]
+    log.clear()
+    log.append("new")
+
+    delta = log.delta(cursor)
+    assert delta["reset"]
+    assert [entry["message"] for entry in delta["entries"]] == ["new"]
+
+
+def test_delta_with_cursor_from_before_a_restart_resets():
+    log = OutputLog(capacity=10)
+    log.append("first")
+    log.append("second")
+
+    delta = log.delta(500)
+    assert delta["reset"]
+    assert [entry["message"] for entry in delta["entries"]] == ["first", "second"]
+    assert delta["seq"] == 2
+    assert not log.delta(2)["reset"]
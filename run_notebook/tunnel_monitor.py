@@ -0,0 +1,199 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+class TunnelMonitor:
+    """Supervise a local port forward: probe it, measure it and re-establish it when it drops.
+
+    Every ``check_interval`` seconds the monitor checks that the forwarder is
+    still relaying over a live transport, and every ``interval`` seconds it
+    fetches Jupyter's ``/api`` through the local endpoint, recording the
+    round-trip time and the bytes moved since the last probe. When the
+    forwarder has stopped or its transport died, ``reconnect(forwarder)`` is
+    called to build a replacement (it returns the new running forwarder or
+    raises); failed attempts are retried with exponential backoff. After
+    ``max_failures`` failed probes in a row over a live forward the tunnel
+    is only marked unresponsive: a busy Jupyter is not a broken tunnel, and
+    rebuilding the forward would drop every open kernel connection.
+    ``on_change(health)`` is called on each change, with ``health["event"]``
+    set to "down", "reconnected", "unresponsive" or "responding", and
+    ``health`` returns the current metrics at any time.
+    """
+
+    def __init__(self, forwarder, base_url="/", reconnect=None, on_change=None, interval=5, probe_timeout=3,
+                 max_failures=2, check_interval=0.5, max_backoff=30):
+        self.forwarder = forwarder
+        self.base_url = base_url
+        self.reconnect = reconnect
+        self.on_change = on_change
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.max_failures = max_failures
+        self.check_interval = check_interval
+        self.max_backoff = max_backoff
+        self.healthy = True
+        self.state = "up"  # "up", "unresponsive" (forward alive, probes failing) or "down"
+        self.rtt = None  # Smoothed probe round-trip time in seconds
+        self.last_rtt = None
+        self.probes = 0
+        self.failed_probes = 0
+        self.consecutive_failures = 0
+        self.reconnects = 0
+        self.reconnect_failures = 0
+        self.last_reconnect = None  # Seconds the last successful reconnect took
+        self.last_error = None
+        self.last_checked = None  # Wall-clock time of the last successful probe
+        self.rate_in = 0.0  # Bytes per second between the last two probes
+        self.rate_out = 0.0
+        self._closed_in = 0  # Traffic of forwarders replaced by reconnects
+        self._closed_out = 0
+        self._last_sample = None  # (monotonic time, bytes in, bytes out) at the last probe
+        self._stop = threading.Event()
+        self._reconnecting = threading.Lock()  # Held while reconnect() runs
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"tunnel-monitor-{self.forwarder.local_port}")
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2):
+        """Stop monitoring. A reconnect in progress is waited for, and its replacement forwarder stopped."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+            with self._reconnecting:
+                pass
+
+    def probe(self):
+        """Fetch ``/api`` through the local endpoint once. Returns the round-trip time or raises."""
+        url = f"http://127.0.0.1:{self.forwarder.local_port}{self.base_url.rstrip('/')}/api"
+        started = time.monotonic()
+        with urllib.request.urlopen(url, timeout=self.probe_timeout) as response:
+            response.read()
+        return time.monotonic() - started
+
+    def traffic(self):
+        """Total bytes (in, out) through this tunnel, across reconnects."""
+        stats = self.forwarder.stats()
+        return self._closed_in + stats["bytes_in"], self._closed_out + stats["bytes_out"]
+
+    def health(self):
+        stats = self.forwarder.stats()
+        return {
+            "healthy": self.healthy,
+            "state": self.state,
+            "local_port": self.forwarder.local_port,
+            "target": self.forwarder.target,
+            "rtt": self.rtt,
+            "last_rtt": self.last_rtt,
+            "bytes_in": self._closed_in + stats["bytes_in"],
+            "bytes_out": self._closed_out + stats["bytes_out"],
+            "rate_in": self.rate_in,
+            "rate_out": self.rate_out,
+            "active_connections": stats["active_connections"],
+            "probes": self.probes,
+            "failed_probes": self.failed_probes,
+            "reconnects": self.reconnects,
+            "reconnect_failures": self.reconnect_failures,
+            "last_reconnect": self.last_reconnect,
+            "last_error": self.last_error,
+            "last_checked": self.last_checked,
+        }
+
+    def _notify(self, event):
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(dict(self.health(), event=event))
+        except Exception as e:
+            print(f"Tunnel monitor callback failed: {e}")
+
+    def _set_state(self, state, event, error=None):
+        self.state = state
+        self.healthy = state == "up"
+        self.last_error = error
+        self._notify(event)
+
+    def _record_probe(self, rtt):
+        self.probes += 1
+        self.consecutive_failures = 0
+        self.last_rtt = rtt
+        self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+        self.last_checked = time.time()
+        if self.state == "unresponsive":
+            print(f"Tunnel on port {self.forwarder.local_port}: Jupyter is answering again")
+            self._set_state("up", "responding")
+        now = time.monotonic()
+        bytes_in, bytes_out = self.traffic()
+        if self._last_sample is not None and now > self._last_sample[0]:
+            elapsed = now - self._last_sample[0]
+            self.rate_in = max(0, bytes_in - self._last_sample[1]) / elapsed
+            self.rate_out = max(0, bytes_out - self._last_sample[2]) / elapsed
+        self._last_sample = (now, bytes_in, bytes_out)
+
+    def _recover(self, reason):
+        """Replace the forwarder; returns whether it worked."""
+        if self.state != "down":
+            print(f"Tunnel on port {self.forwarder.local_port} down: {reason}")
+            self._set_state("down", "down", reason)
+        if self.reconnect is None:
+            return False
+        started = time.monotonic()
+        old = self.forwarder
+        with self._reconnecting:
+            if self._stop.is_set():
+                return False
+            try:
+                forwarder = self.reconnect(old)
+            except Exception as e:
+                self.reconnect_failures += 1
+                self.last_error = f"reconnect failed: {e}"
+                print(f"Tunnel on port {old.local_port}: {self.last_error}")
+                return False
+            if self._stop.is_set():
+                # Stopped (e.g. by a disconnect) while reconnecting: the new forward must not outlive the monitor
+                forwarder.stop(timeout=1)
+                return False
+        stats = old.stats()
+        self._closed_in += stats["bytes_in"]
+        self._closed_out += stats["bytes_out"]
+        self.forwarder = forwarder
+        self.reconnects += 1
+        self.last_reconnect = time.monotonic() - started
+        self.consecutive_failures = 0
+        self._set_state("up", "reconnected")
+        return True
+
+    def _run(self):
+        next_probe = time.monotonic() + self.interval
+        backoff = 0.0
+        while not self._stop.wait(self.check_interval + backoff):
+            reason = None
+            if not self.forwarder.is_alive():
+                reason = f"forward stopped ({self.forwarder.error or 'closed'})"
+            elif not self.forwarder.transport.is_active():
+                reason = "SSH transport closed"
+            elif time.monotonic() >= next_probe:
+                next_probe = time.monotonic() + self.interval
+                try:
+                    self._record_probe(self.probe())
+                except (urllib.error.URLError, OSError, ValueError) as e:
+                    self.failed_probes += 1
+                    self.consecutive_failures += 1
+                    error = f"probe failed: {e}"
+                    if self.consecutive_failures >= self.max_failures and self.state == "up":
+                        print(f"Tunnel on port {self.forwarder.local_port}: Jupyter not answering ({error})")
+                        self._set_state("unresponsive", "unresponsive", error)
+                    else:
+                        self.last_error = error
+            if reason is None or self._stop.is_set():
+                continue
+            if self._recover(reason):
+                backoff = 0.0
+                next_probe = time.monotonic() + self.interval
+            else:
+                backoff = min(self.max_backoff, max(1.0, backoff * 2))